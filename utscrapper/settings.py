@@ -198,3 +198,39 @@ CELERYBEAT_SCHEDULE = {
 }
 
 YOUTUBE_API_KEY = os.environ.get('YOUTUBE_API_KEY')
+
+# comma-separated keys of several projects to spread the scrapes over, and how to pick them:
+# 'round_robin' or 'least_used'
+YOUTUBE_API_KEYS = [key for key in (os.environ.get('YOUTUBE_API_KEYS') or YOUTUBE_API_KEY or '').split(',') if key]
+YOUTUBE_API_KEY_STRATEGY = os.environ.get('YOUTUBE_API_KEY_STRATEGY', 'round_robin')
+
+# etag response cache of the Data API: 'redis', 'file' or 'none'
+YOUTUBE_API_CACHE = os.environ.get('YOUTUBE_API_CACHE', 'redis')
+YOUTUBE_API_CACHE_DIR = os.environ.get('YOUTUBE_API_CACHE_DIR') or os.path.join(BASE_DIR, '.api_cache')
+YOUTUBE_API_CACHE_TIMEOUT = int(os.environ.get('YOUTUBE_API_CACHE_TIMEOUT', 7 * 24 * 60 * 60))
+
+
+# quota units the scrapers may spend per day, and requests per second across all workers
+YOUTUBE_API_DAILY_QUOTA = int(os.environ.get('YOUTUBE_API_DAILY_QUOTA', 10000))
+YOUTUBE_API_REQUESTS_PER_SECOND = float(os.environ.get('YOUTUBE_API_REQUESTS_PER_SECOND', 10))
+
+# full-text search of the videos API: 'mysql' (FULLTEXT index), 'index' (inverted index
+# maintained by the scraper) or 'auto', mysql on MySQL and index elsewhere
+YOUTUBE_SEARCH_BACKEND = os.environ.get('YOUTUBE_SEARCH_BACKEND', 'auto')
+
+# seconds the videos API caches a response, 0 disables it; scrapes invalidate the cache as they write
+YOUTUBE_VIDEOS_API_CACHE_TIMEOUT = int(os.environ.get('YOUTUBE_VIDEOS_API_CACHE_TIMEOUT', 10 * 60))
+
+# incremental scrapes still rescan a channel's whole history once this many hours have passed
+YOUTUBE_FULL_RESCAN_HOURS = float(os.environ.get('YOUTUBE_FULL_RESCAN_HOURS', 24))
+
+# number of registered channels the scraper works on at the same time
+YOUTUBE_SCRAPE_WORKERS = int(os.environ.get('YOUTUBE_SCRAPE_WORKERS', 4))
+
+# scrapes lock every channel they work on ('channel') or the whole run ('global'),
+# a scrape finding the lock taken is dropped ('skip') or waits for it ('queue');
+# a lock which is not extended frees itself after YOUTUBE_SCRAPE_LOCK_EXPIRE seconds
+YOUTUBE_SCRAPE_LOCK_SCOPE = os.environ.get('YOUTUBE_SCRAPE_LOCK_SCOPE', 'channel')
+YOUTUBE_SCRAPE_LOCK_POLICY = os.environ.get('YOUTUBE_SCRAPE_LOCK_POLICY', 'skip')
+YOUTUBE_SCRAPE_LOCK_EXPIRE = int(os.environ.get('YOUTUBE_SCRAPE_LOCK_EXPIRE', 15 * 60))
+YOUTUBE_SCRAPE_LOCK_RETRY_DELAY = int(os.environ.get('YOUTUBE_SCRAPE_LOCK_RETRY_DELAY', 60))
@@ -0,0 +1,86 @@
+"""
+    Response cache of the videos API.
+
+    A cached response is keyed by the normalized request and by the current
+    generation of the data. The scraper bumps the generation after every write
+    of channels or videos, which orphans all the cached responses at once;
+    they expire on their own.
+"""
+
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from rest_framework.response import Response
+
+GENERATION_KEY = "utube:videos-api:generation"
+KEY_PREFIX = "utube:videos-api:response:"
+
+
+def get_generation() -> int:
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        # starting from the clock, a generation lost with the cache never comes back
+        cache.add(GENERATION_KEY, int(time.time() * 1000), timeout=None)
+        generation = cache.get(GENERATION_KEY)
+    return generation
+
+
+def bump_generation() -> None:
+    """
+    Invalidate the cached responses, once the current transaction commits so
+    no response of the old data is cached under the new generation.
+    """
+    def bump():
+        try:
+            cache.incr(GENERATION_KEY)
+        except ValueError:
+            # not set yet, the first read starts a new generation
+            pass
+
+    transaction.on_commit(bump)
+
+
+def response_cache_key(request) -> str:
+    """
+    The cache key of a GET: the same params in any order, or with empty values
+    left out, share the key. The host is part of it, the pagination links are absolute.
+    """
+    params = sorted(
+        (name, values)
+        for name, values in request.query_params.lists()
+        if any(value.strip() for value in values)
+    )
+    digest = hashlib.sha1(json.dumps(
+        [request.scheme, request.get_host(), request.path, params],
+    ).encode()).hexdigest()
+    return f"{KEY_PREFIX}{get_generation()}:{digest}"
+
+
+class CachedListMixin(object):
+    """
+    Serve `list` from the cache, for YOUTUBE_VIDEOS_API_CACHE_TIMEOUT seconds at
+    most; 0 disables the cache. The serialized data is cached, not the rendered
+    response, so every renderer is served from the same entry.
+    """
+
+    def list(self, request, *args, **kwargs):
+        timeout = settings.YOUTUBE_VIDEOS_API_CACHE_TIMEOUT
+        if not timeout:
+            return super().list(request, *args, **kwargs)
+
+        key = response_cache_key(request)
+        data = cache.get(key)
+        if data is not None:
+            response = Response(data)
+            response["X-Cache"] = "hit"
+            return response
+
+        response = super().list(request, *args, **kwargs)
+        if response.status_code == 200:
+            cache.set(key, response.data, timeout=timeout)
+        response["X-Cache"] = "miss"
+        return response
@@ -0,0 +1,17 @@
+from rest_framework.filters import BaseFilterBackend
+
+from utube.search import get_search_backend
+
+
+class FullTextSearchFilter(BaseFilterBackend):
+    """
+    Answer the `search` param with the configured full-text search backend,
+    most relevant videos first unless an `ordering` is given.
+    """
+    search_param = 'search'
+
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, '').strip()
+        if not query:
+            return queryset
+        return get_search_backend().search(queryset, query)
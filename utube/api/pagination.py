@@ -1,13 +1,191 @@
-from rest_framework.pagination import (
-    LimitOffsetPagination,
-    PageNumberPagination,
-)
-
-
-class VideoLimitOffsetPagination(LimitOffsetPagination):
-    default_limit = 5
-    max_limit = 10
-
-
-class VideoPageNumberPagination(PageNumberPagination):
-    page_size = 20
+import base64
+import json
+from collections import OrderedDict
+
+from django.core.exceptions import ValidationError
+from django.db import connection, connections
+from django.db.models import F, Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import (
+    BasePagination,
+    LimitOffsetPagination,
+    PageNumberPagination,
+)
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class VideoLimitOffsetPagination(LimitOffsetPagination):
+    default_limit = 5
+    max_limit = 10
+
+
+class VideoPageNumberPagination(PageNumberPagination):
+    page_size = 20
+
+
+def approximate_count(queryset):
+    """
+    The row count of the queryset's table from the database statistics, without
+    scanning it. None when the queryset is filtered, the statistics say nothing
+    about it then.
+    """
+    if queryset.query.where:
+        return None
+
+    table = queryset.model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'mysql':
+            cursor.execute(
+                'SELECT TABLE_ROWS FROM information_schema.TABLES WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s',
+                [table],
+            )
+        elif connection.vendor == 'postgresql':
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE relname = %s', [table])
+        else:
+            # no statistics to read, the table is small enough to count
+            return queryset.count()
+        row = cursor.fetchone()
+    return max(int(row[0]), 0) if row and row[0] is not None else None
+
+
+class VideoCursorPagination(BasePagination):
+    """
+    Keyset pagination: a page starts after the (ordering value, id) of the last
+    row of the previous page, so any page is read straight from the index of the
+    ordering, whatever its depth. No exact count is ever run; `count=approx` adds
+    the approximate count of the table statistics.
+
+    Rows are ordered by the `ordering` param only, a search is not ranked by
+    relevance in this mode.
+    """
+    page_size = 20
+    pagination_param = 'pagination'
+    cursor_query_param = 'cursor'
+    ordering_param = 'ordering'
+    count_param = 'count'
+    # every ordering ends with the id, which breaks the ties of equal values
+    orderings = ['-view_count', 'view_count', '-published_at', 'published_at', '-id', 'id']
+    default_ordering = '-view_count'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        cursor = self.decode_cursor(request, queryset.model)
+        if cursor is not None:
+            self.ordering = cursor['o']
+        else:
+            ordering = request.query_params.get(self.ordering_param)
+            self.ordering = ordering if ordering in self.orderings else self.default_ordering
+        self.field = self.ordering.lstrip('-')
+        descending = self.ordering.startswith('-')
+
+        self.count = None
+        if request.query_params.get(self.count_param) == 'approx':
+            self.count = approximate_count(queryset)
+
+        # a previous page is read backwards from the first row of the current one
+        backwards = cursor is not None and cursor['p']
+        if cursor is not None:
+            queryset = queryset.filter(self.after(cursor, descending != backwards))
+
+        rows = list(queryset.order_by(*self.order_by(queryset, descending != backwards))[:self.page_size + 1])
+        more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if backwards:
+            rows.reverse()
+
+        self.has_next = more if not backwards else True
+        self.has_previous = more if backwards else cursor is not None
+        self.first, self.last = (rows[0], rows[-1]) if rows else (None, None)
+        # an empty page reached backwards has nothing before it, one reached forwards nothing after
+        if not rows:
+            self.has_next = self.has_previous = False
+        return rows
+
+    def order_by(self, queryset, descending):
+        """
+        The ordering of the page, NULL first in ascending order as `after` expects.
+        MySQL sorts NULL that way on its own and the index of the field stays
+        usable; elsewhere, e.g. on PostgreSQL, the NULL placement is explicit.
+        """
+        if self.field == 'id':
+            return ['-pk' if descending else 'pk']
+        field = F(self.field)
+        if connections[queryset.db].features.supports_order_by_nulls_modifier:
+            field = field.desc(nulls_last=True) if descending else field.asc(nulls_first=True)
+        else:
+            field = field.desc() if descending else field.asc()
+        return [field, '-pk' if descending else 'pk']
+
+    def after(self, cursor, descending):
+        """
+        The rows after the cursor position, in the direction of the page.
+        NULL sorts first, see `order_by`.
+        """
+        field = self.field if self.field != 'id' else 'pk'
+        value, pk = cursor['v'], cursor['pk']
+        if field == 'pk':
+            return Q(pk__lt=pk) if descending else Q(pk__gt=pk)
+
+        if descending:
+            if value is None:
+                return Q(**{f'{field}__isnull': True, 'pk__lt': pk})
+            return (
+                Q(**{f'{field}__lt': value}) | Q(**{field: value, 'pk__lt': pk}) | Q(**{f'{field}__isnull': True})
+            )
+        if value is None:
+            return Q(**{f'{field}__isnull': True, 'pk__gt': pk}) | Q(**{f'{field}__isnull': False})
+        return Q(**{f'{field}__gt': value}) | Q(**{field: value, 'pk__gt': pk})
+
+    def encode_cursor(self, row, previous):
+        value = getattr(row, self.field) if self.field != 'id' else None
+        position = {
+            'o': self.ordering,
+            'v': value.isoformat() if hasattr(value, 'isoformat') else value,
+            'pk': row.pk,
+            'p': previous,
+        }
+        token = base64.urlsafe_b64encode(json.dumps(position, separators=(',', ':')).encode()).decode()
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, self.ordering_param)
+        return replace_query_param(url, self.cursor_query_param, token)
+
+    def decode_cursor(self, request, model):
+        """
+        The position of the `cursor` param, its value converted to the type of the
+        ordering field. A cursor which is not one of ours is a 404.
+        """
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(token.encode()).decode())
+            if cursor['o'] not in self.orderings or not isinstance(cursor['pk'], int):
+                raise ValueError(cursor)
+            cursor['p'] = bool(cursor['p'])
+            field = cursor['o'].lstrip('-')
+            if field == 'id':
+                cursor['v'] = None
+            elif cursor['v'] is not None:
+                # a tampered value would otherwise reach the query and fail there
+                cursor['v'] = model._meta.get_field(field).to_python(cursor['v'])
+        except (TypeError, ValueError, KeyError, UnicodeDecodeError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        return cursor
+
+    def get_next_link(self):
+        return self.encode_cursor(self.last, previous=False) if self.has_next else None
+
+    def get_previous_link(self):
+        return self.encode_cursor(self.first, previous=True) if self.has_previous else None
+
+    def get_paginated_response(self, data):
+        fields = [
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+        ]
+        if self.request.query_params.get(self.count_param) == 'approx':
+            fields.append(('approximate_count', self.count))
+        fields.append(('results', data))
+        return Response(OrderedDict(fields))
@@ -1,16 +1,31 @@
-from django.test import TestCase
+import base64
+import json
+from datetime import datetime, timezone
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth import get_user_model
 from rest_framework.test import APITestCase
 from rest_framework.test import APIClient
 from rest_framework import status
 from django.urls import reverse
 
+from utube.models import Channel, Video
+from utube.scrapper import persistence
+from utube.search import InvertedIndexSearch
+
 User = get_user_model()
 
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
 
+
+@override_settings(CACHES=LOCMEM_CACHES)
 class VideoListAPITestCase(APITestCase):
     def setUp(self):
         self.client = APIClient()
+        cache.clear()
 
     def test_videos_list(self):
         url = reverse('videos-api:list')
@@ -19,3 +34,244 @@ class VideoListAPITestCase(APITestCase):
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertTrue(status.is_success(response.status_code))
+
+    def test_videos_search_is_ranked(self):
+        channel = Channel.objects.create(channel_uid='UC1')
+        for video_uid, title, description in [
+            ('v1', 'Cooking', 'python on the side'),
+            ('v2', 'Python tricks', ''),
+            ('v3', 'Gardening', ''),
+        ]:
+            video = Video.objects.create(
+                channel=channel, video_uid=video_uid, title=title, description=description,
+                published_at=datetime(2020, 4, 19, tzinfo=timezone.utc),
+            )
+            InvertedIndexSearch().index_videos([video])
+
+        with override_settings(YOUTUBE_SEARCH_BACKEND='index'):
+            response = self.client.get(reverse('videos-api:list'), {'search': 'python'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([video['video_uid'] for video in response.data['results']], ['v2', 'v1'])
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class VideoListQueryCountTestCase(APITestCase):
+    """
+    The list endpoint runs the same queries whatever the page size: the count,
+    the page with its channels, and the tags of the page.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        channels = [Channel.objects.create(channel_uid=f'UC{i}', title=f'Channel {i}') for i in range(3)]
+        for i in range(30):
+            video = Video.objects.create(
+                channel=channels[i % 3], video_uid=f'v{i}', title=f'Python video {i}', description='',
+                published_at=datetime(2020, 4, 19, tzinfo=timezone.utc), view_count=i,
+            )
+            video.tags.add('python', f'tag-{i % 5}')
+            InvertedIndexSearch().index_videos([video])
+
+    def setUp(self):
+        cache.clear()
+
+    def get(self, **params):
+        response = self.client.get(reverse('videos-api:list'), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response
+
+    def test_full_page(self):
+        with self.assertNumQueries(3):
+            response = self.get()
+        self.assertEqual(len(response.data['results']), 20)
+        self.assertTrue(all(video['channel_name'].startswith('Channel') for video in response.data['results']))
+        self.assertTrue(all('python' in video['tags'] for video in response.data['results']))
+
+    def test_last_page(self):
+        with self.assertNumQueries(3):
+            response = self.get(page=2)
+        self.assertEqual(len(response.data['results']), 10)
+
+    def test_ordering_and_tag_filter(self):
+        with self.assertNumQueries(3):
+            response = self.get(ordering='-view_count', tags='tag-1')
+        self.assertEqual([video['video_uid'] for video in response.data['results']][:2], ['v26', 'v21'])
+
+    def test_search(self):
+        with override_settings(YOUTUBE_SEARCH_BACKEND='index'), self.assertNumQueries(3):
+            response = self.get(search='python video')
+        self.assertEqual(len(response.data['results']), 20)
+
+    def test_cursor_page(self):
+        with self.assertNumQueries(2):
+            response = self.get(pagination='cursor')
+        self.assertEqual(len(response.data['results']), 20)
+        self.assertNotIn('approximate_count', response.data)
+
+    def test_video_without_channel(self):
+        Video.objects.filter(video_uid='v0').update(channel=None)
+
+        with self.assertNumQueries(3):
+            response = self.get(ordering='view_count')
+        self.assertEqual(response.data['results'][0]['channel_name'], '')
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class VideoCursorPaginationTestCase(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        channel = Channel.objects.create(channel_uid='UC1', title='Channel')
+        # many equal view counts, only the id tells them apart
+        for i in range(45):
+            Video.objects.create(
+                channel=channel, video_uid=f'v{i}', title=f'Video {i}', description='',
+                published_at=datetime(2020, 4, 1 + i % 20, tzinfo=timezone.utc), view_count=i % 4,
+            )
+
+    def setUp(self):
+        cache.clear()
+
+    def walk(self, **params):
+        pages = []
+        response = self.client.get(reverse('videos-api:list'), dict(params, pagination='cursor'))
+        while True:
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            pages.append(response.data)
+            if not response.data['next']:
+                return pages
+            response = self.client.get(response.data['next'])
+
+    def test_walks_every_video_once_in_order(self):
+        for ordering, key in [
+            ('-view_count', lambda v: (-v.view_count, -v.pk)),
+            ('published_at', lambda v: (v.published_at, v.pk)),
+            ('id', lambda v: v.pk),
+        ]:
+            pages = self.walk(ordering=ordering)
+
+            self.assertEqual([len(page['results']) for page in pages], [20, 20, 5])
+            expected = [video.video_uid for video in sorted(Video.objects.all(), key=key)]
+            self.assertEqual([video['video_uid'] for page in pages for video in page['results']], expected)
+
+    def test_previous_link_returns_the_same_page(self):
+        pages = self.walk(ordering='-published_at')
+        self.assertIsNone(pages[0]['previous'])
+
+        response = self.client.get(pages[2]['previous'])
+
+        self.assertEqual(response.data['results'], pages[1]['results'])
+        response = self.client.get(response.data['previous'])
+        self.assertEqual(response.data['results'], pages[0]['results'])
+        self.assertIsNone(response.data['previous'])
+
+    def test_deep_page_costs_the_same_query(self):
+        last_page = self.walk(ordering='-view_count')[-1]
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(last_page['previous'])
+
+        page_query = queries.captured_queries[0]['sql']
+        self.assertNotIn('OFFSET', page_query)
+        self.assertNotIn('COUNT', page_query)
+
+    def test_approximate_count(self):
+        response = self.client.get(reverse('videos-api:list'), {'pagination': 'cursor', 'count': 'approx'})
+        self.assertEqual(response.data['approximate_count'], 45)
+
+        response = self.client.get(reverse('videos-api:list'), {'pagination': 'cursor', 'count': 'approx', 'title': 'Video 1'})
+        self.assertIsNone(response.data['approximate_count'])
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse('videos-api:list'), {'pagination': 'cursor', 'cursor': 'garbage'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_tampered_cursor_value(self):
+        for position in [
+            {'o': '-view_count', 'v': 'abc', 'pk': 3, 'p': False},
+            {'o': 'published_at', 'v': 'yesterday', 'pk': 3, 'p': False},
+            {'o': 'published_at', 'v': [2020], 'pk': 3, 'p': False},
+            {'o': '-view_count', 'pk': 3, 'p': False},
+        ]:
+            cursor = base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+            response = self.client.get(reverse('videos-api:list'), {'pagination': 'cursor', 'cursor': cursor})
+
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND, position)
+
+    def test_cursor_at_a_null_value(self):
+        Video.objects.filter(video_uid__in=['v0', 'v4']).update(view_count=None)
+        position = {'o': '-view_count', 'v': None, 'pk': Video.objects.get(video_uid='v4').pk, 'p': False}
+        cursor = base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+        response = self.client.get(reverse('videos-api:list'), {'pagination': 'cursor', 'cursor': cursor})
+
+        self.assertEqual([video['video_uid'] for video in response.data['results']], ['v0'])
+
+    def test_null_values_are_walked_once_in_both_directions(self):
+        Video.objects.filter(video_uid__in=['v0', 'v5', 'v21', 'v44']).update(view_count=None)
+
+        for ordering in ['view_count', '-view_count']:
+            with CaptureQueriesContext(connection) as queries:
+                pages = self.walk(ordering=ordering)
+
+            video_uids = [video['video_uid'] for page in pages for video in page['results']]
+            self.assertEqual(sorted(video_uids), sorted(Video.objects.values_list('video_uid', flat=True)))
+            null_uids = video_uids[:4] if ordering == 'view_count' else video_uids[-4:]
+            self.assertEqual(sorted(null_uids), ['v0', 'v21', 'v44', 'v5'])
+            if connection.features.supports_order_by_nulls_modifier:
+                # the NULL placement does not depend on the database's default
+                self.assertIn('NULLS FIRST' if ordering == 'view_count' else 'NULLS LAST', queries.captured_queries[0]['sql'])
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class VideoListCacheTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.channel = Channel.objects.create(channel_uid='UC1', title='Channel')
+        persistence.save_videos(self.channel, [self.video_item('v1', 'First')])
+
+    @staticmethod
+    def video_item(video_id, title):
+        return {
+            'id': video_id,
+            'snippet': {'title': title, 'description': '', 'publishedAt': '2020-04-19T16:10:00Z', 'tags': ['python']},
+            'statistics': {'viewCount': '10'},
+        }
+
+    def get(self, query=''):
+        return self.client.get(reverse('videos-api:list') + query)
+
+    def test_repeat_reads_are_served_from_the_cache(self):
+        self.assertEqual(self.get('?ordering=id&tags=python')['X-Cache'], 'miss')
+
+        with self.assertNumQueries(0):
+            response = self.get('?tags=python&ordering=id&search=')
+
+        self.assertEqual(response['X-Cache'], 'hit')
+        self.assertEqual([video['title'] for video in response.data['results']], ['First'])
+        self.assertEqual(self.get('?ordering=-id&tags=python')['X-Cache'], 'miss')
+
+    def test_scraper_writes_invalidate_the_cache(self):
+        self.get()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            persistence.save_videos(self.channel, [self.video_item('v1', 'First'), self.video_item('v2', 'Second')])
+        response = self.get()
+
+        self.assertEqual(response['X-Cache'], 'miss')
+        self.assertEqual(len(response.data['results']), 2)
+
+    def test_unchanged_scrape_keeps_the_cache(self):
+        self.get()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            persistence.save_videos(self.channel, [self.video_item('v1', 'First')])
+
+        self.assertEqual(self.get()['X-Cache'], 'hit')
+
+    @override_settings(YOUTUBE_VIDEOS_API_CACHE_TIMEOUT=0)
+    def test_cache_can_be_disabled(self):
+        self.get()
+
+        self.assertNotIn('X-Cache', self.get())
@@ -1,8 +1,5 @@
-from django.db.models import Q
-
 from rest_framework.generics import CreateAPIView, ListAPIView, RetrieveAPIView, RetrieveUpdateAPIView, RetrieveDestroyAPIView
 from rest_framework.filters import (
-    SearchFilter,
     OrderingFilter,
 )
 
@@ -12,26 +9,42 @@ from rest_framework.permissions import (
 
 from utube.models import Video
 
+from .cache import CachedListMixin
+from .filters import FullTextSearchFilter
 from .pagination import (
+    VideoCursorPagination,
     VideoPageNumberPagination,
 )
 
 from .serializers import VideoListSerializer
 
 
-class VideoListAPIView(ListAPIView):
+class VideoListAPIView(CachedListMixin, ListAPIView):
     """
     List:
     Return a list of all the existing videos.
+
+    Paged by page number, or by cursor with `?pagination=cursor`. Responses
+    are cached until the scraper writes again.
     """
     permission_classes = [AllowAny]
-    filter_backends = [SearchFilter, OrderingFilter]
-    search_fields = ['description', 'title']
+    # search goes through a full-text index, never a LIKE scan of the descriptions
+    filter_backends = [FullTextSearchFilter, OrderingFilter]
     serializer_class = VideoListSerializer
     pagination_class = VideoPageNumberPagination # VideoLimitOffsetPagination # PageNumberPagination
 
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            if self.request.query_params.get(VideoCursorPagination.pagination_param) == 'cursor':
+                self._paginator = VideoCursorPagination()
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
+
     def get_queryset(self, *args, **kwargs):
-        queryset_list = Video.objects.all()
+        # the serializer reads the channel title and the tags of every row
+        queryset_list = Video.objects.select_related('channel').prefetch_related('tags')
         title = self.request.GET.get('title')
         tags = self.request.GET.get('tags')
 
@@ -40,13 +53,6 @@ class VideoListAPIView(ListAPIView):
         
         if tags:
             queryset_list = queryset_list.filter(tags__name__icontains=tags)
-        
-        query = self.request.GET.get('search')
-        if query:
-            queryset_list = queryset_list.filter(
-                Q(title__icontains=query) |
-                Q(description__icontains=query)
-            ).distinct()
 
         return queryset_list
 
@@ -3,3 +3,5 @@ from django.apps import AppConfig
 
 class UtubeConfig(AppConfig):
     name = 'utube'
+    # the tables were created with AutoField ids before DEFAULT_AUTO_FIELD was set
+    default_auto_field = 'django.db.models.AutoField'
@@ -0,0 +1,103 @@
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+from django.core.management.base import BaseCommand
+
+from utube.scrapper.api import Api
+from utube.scrapper.async_api import AsyncApi
+
+
+class FakeYoutubeHandler(BaseHTTPRequestHandler):
+    """
+    Serves canned playlistItems pages after a fixed delay, standing in for the Data API.
+    """
+    latency = 0.05
+    pages_per_playlist = 2
+
+    def do_GET(self):
+        time.sleep(self.latency)
+        query = parse_qs(urlparse(self.path).query)
+        page = int(query.get('pageToken', ['0'])[0])
+        playlist_id = query.get('playlistId', [''])[0]
+
+        data = {
+            'items': [
+                {'contentDetails': {'videoId': '{}-{}-{}'.format(playlist_id, page, i)}}
+                for i in range(50)
+            ],
+        }
+        if page + 1 < self.pages_per_playlist:
+            data['nextPageToken'] = str(page + 1)
+
+        body = json.dumps(data).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeYoutubeServer(ThreadingHTTPServer):
+    # the default backlog of 5 makes the extra concurrent connects wait for a SYN retransmit
+    request_queue_size = 128
+
+
+class Command(BaseCommand):
+    help = 'Compare Api and AsyncApi playlist paging against a local fake server.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--playlists', type=int, default=50)
+        parser.add_argument('--pages', type=int, default=2)
+        parser.add_argument('--latency', type=float, default=0.05, help='Seconds per fake request.')
+        parser.add_argument('--concurrency', type=int, default=10)
+
+    def handle(self, *args, **options):
+        FakeYoutubeHandler.latency = options['latency']
+        FakeYoutubeHandler.pages_per_playlist = options['pages']
+        server = FakeYoutubeServer(('127.0.0.1', 0), FakeYoutubeHandler, bind_and_activate=False)
+        server.request_queue_size = max(server.request_queue_size, options['concurrency'])
+        server.server_bind()
+        server.server_activate()
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        base_url = 'http://127.0.0.1:{}/'.format(server.server_address[1])
+        playlist_ids = ['PL{}'.format(i) for i in range(options['playlists'])]
+
+        try:
+            sync_seconds, sync_count = self.run_sync(base_url, playlist_ids)
+            async_seconds, async_count = asyncio.run(
+                self.run_async(base_url, playlist_ids, options['concurrency'])
+            )
+        finally:
+            server.shutdown()
+
+        self.stdout.write('sync:  {} items in {:.2f}s'.format(sync_count, sync_seconds))
+        self.stdout.write('async: {} items in {:.2f}s (concurrency={})'.format(
+            async_count, async_seconds, options['concurrency'],
+        ))
+        self.stdout.write('speedup: {:.1f}x'.format(sync_seconds / async_seconds))
+
+    def run_sync(self, base_url, playlist_ids):
+        api = Api(api_key='benchmark')
+        api.BASE_URL = base_url
+        start = time.perf_counter()
+        count = 0
+        for playlist_id in playlist_ids:
+            res = api.get_playlist_items(playlist_id=playlist_id, parts='contentDetails', count=None)
+            count += len(res['items'])
+        return time.perf_counter() - start, count
+
+    async def run_async(self, base_url, playlist_ids, concurrency):
+        async with AsyncApi(api_key='benchmark', concurrency=concurrency) as api:
+            api.BASE_URL = base_url
+            start = time.perf_counter()
+            results = await api.gather_playlist_items(playlist_ids=playlist_ids, parts='contentDetails')
+            count = sum(len(res['items']) for res in results)
+        return time.perf_counter() - start, count
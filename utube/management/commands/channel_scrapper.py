@@ -1,119 +1,979 @@
+import asyncio
 import logging
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, nullcontext
+from datetime import timedelta
+
 from django.core.management.base import BaseCommand, CommandError
 from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from utube.models import RegisteredChannel, ScrapeCheckpoint, Video
 from utube.scrapper.api import Api
-
-from utube.models import Channel, Video
+from utube.scrapper.async_api import AsyncApi
+from utube.scrapper.cache import get_response_cache
+from utube.scrapper.exceptions import ApiError, QuotaExceededError
+from utube.scrapper.keys import ApiKeyPool
+from utube.scrapper.locks import DistributedLock
+from utube.scrapper import persistence
+from utube.scrapper.mappers import (
+    CHANNEL_FIELDS,
+    CHANNEL_PARTS,
+    CHANNEL_UPLOADS_PATH,
+    PLAYLIST_FIELDS,
+    PLAYLIST_ITEM_FIELDS,
+    PLAYLIST_ITEM_PARTS,
+    PLAYLIST_ITEM_PUBLISHED_AT_PATH,
+    PLAYLIST_ITEM_VIDEO_ID_PATH,
+    PLAYLIST_PARTS,
+    VIDEO_FIELDS,
+    VIDEO_PARTS,
+    VIDEO_STATS_FIELDS,
+    VIDEO_STATS_PARTS,
+    get_path,
+)
+from utube.scrapper.pipeline import Pipeline, Stage
+from utube.scrapper.profiling import ScrapeProfiler
+from utube.scrapper.quota import QuotaLimiter
+from utube.scrapper.resilience import CircuitBreaker
 
 logger = logging.getLogger(__name__)
 
+MODE_UPLOADS = 'uploads'
+MODE_PLAYLISTS = 'playlists'
+
+# the channels and videos endpoints take at most 50 ids per call
+CHANNELS_PER_REQUEST = 50
+VIDEOS_PER_REQUEST = 50
+
+LOCK_SCOPE_CHANNEL = 'channel'
+LOCK_SCOPE_GLOBAL = 'global'
+LOCK_POLICY_SKIP = 'skip'
+LOCK_POLICY_QUEUE = 'queue'
+GLOBAL_LOCK_NAME = 'scrape'
+
 
 class Command(BaseCommand):
+    # call_command('channel_scrapper', profiler=ScrapeProfiler()) profiles into a profiler of the caller
+    stealth_options = ('profiler',)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # channels are scraped in parallel threads which share the seen video ids
+        self.seen_lock = threading.Lock()
+        self.profiler = None
+        # created, changed and unchanged rows per model, summed over the persist threads
+        self.write_stats = {'channels': Counter(), 'videos': Counter()}
+        self.write_stats_lock = threading.Lock()
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--channels',
+            nargs='+',
+            metavar='CHANNEL_ID',
+            help='Scrape these channels instead of the active channels of the registry.',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=settings.YOUTUBE_SCRAPE_WORKERS,
+            help='Number of channels scraped at the same time.',
+        )
+        parser.add_argument(
+            '--fetch-workers',
+            type=int,
+            default=4,
+            help='Threads fetching video details while the channels are paged.',
+        )
+        parser.add_argument(
+            '--persist-workers',
+            type=int,
+            default=1,
+            help='Threads saving the fetched videos.',
+        )
+        parser.add_argument(
+            '--queue-size',
+            type=int,
+            default=8,
+            help='Batches of 50 videos which may wait between two stages before the earlier stage blocks.',
+        )
+        parser.add_argument(
+            '--lock-scope',
+            choices=[LOCK_SCOPE_CHANNEL, LOCK_SCOPE_GLOBAL],
+            default=settings.YOUTUBE_SCRAPE_LOCK_SCOPE,
+            help='Lock every channel while it is scraped, or the whole run.',
+        )
+        parser.add_argument(
+            '--lock-policy',
+            choices=[LOCK_POLICY_SKIP, LOCK_POLICY_QUEUE],
+            default=settings.YOUTUBE_SCRAPE_LOCK_POLICY,
+            help='Skip what another scrape holds the lock of, or wait for it.',
+        )
+        parser.add_argument(
+            '--mode',
+            choices=[MODE_UPLOADS, MODE_PLAYLISTS],
+            default=MODE_UPLOADS,
+            help='Page only the channel uploads playlist (default), or every playlist of the channel.',
+        )
+        parser.add_argument(
+            '--async',
+            action='store_true',
+            dest='use_async',
+            help='Fetch playlists and videos concurrently with AsyncApi.',
+        )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=10,
+            help='Maximum number of requests in flight when --async is used.',
+        )
+        parser.add_argument(
+            '--estimate',
+            action='store_true',
+            help='Only print the estimated quota cost of the scrape and the remaining budget.',
+        )
+        parser.add_argument(
+            '--stats-only',
+            action='store_true',
+            help='Only refresh the counters of the saved videos (of --channels, or all of them), '
+                 'without paging any playlist.',
+        )
+        parser.add_argument(
+            '--incremental',
+            action='store_true',
+            help='Stop paging the uploads playlist at the last known video of each channel.',
+        )
+        parser.add_argument(
+            '--resume',
+            action='store_true',
+            help='Continue the interrupted scrape of a channel from its checkpoint instead of starting over.',
+        )
+        parser.add_argument(
+            '--profile',
+            action='store_true',
+            help='Time the stages, HTTP requests and SQL queries of the run and write them as a JSON report.',
+        )
+        parser.add_argument(
+            '--profile-output',
+            default='scrape-profile.json',
+            help='Where --profile writes its report.',
+        )
+        parser.add_argument(
+            '--cprofile-output',
+            help='Also run cProfile on every thread and dump the merged stats here (pstats format).',
+        )
+        parser.add_argument(
+            '--full-rescan-hours',
+            type=float,
+            default=settings.YOUTUBE_FULL_RESCAN_HOURS,
+            help='With --incremental, still rescan a channel fully when its last full scan is older than this.',
+        )
 
     def handle(self, *args, **options):
-        print(args, options)
-        return
-        api_key = settings.YOUTUBE_API_KEY
-        api = Api(api_key=api_key)
-        channel_ids = 'UChTsiSbpTuSrdOHpXkKlq6Q'
-        channel_info = api.get_channel_info(channel_id=channel_ids, parts='snippet,statistics')
-
-        channel_items = channel_info.get('items')
-
-        if channel_items:
-            for channel_item in channel_items:
-                channel_id = channel_item.get('id')
-                if not channel_id:
-                    continue
-
-                channel_snippet = channel_item.get('snippet')
-                channel_statistics = channel_item.get('statistics')
-                channel_instances = Channel.objects.filter(channel_uid=channel_id)
-
-                if channel_instances.exists():
-                    channel_instance = channel_instances.first()
-                else:
-                    channel_instance = Channel(channel_uid=channel_id)
-
-                channel_instance.title = channel_snippet.get('title')
-                channel_instance.description = channel_snippet.get('description')
-                channel_instance.view_count = channel_statistics.get('viewCount')
-                channel_instance.comment_count = channel_statistics.get('commentCount')
-                channel_instance.subscriber_count = channel_statistics.get('subscriberCount')
-                channel_instance.video_count = channel_statistics.get('videoCount')
-                channel_instance.save()
-
-                playlist_info = api.get_playlists(
-                    channel_id=channel_id,
-                    count=None,
-                    limit=50,
+        self.profiler = options.get('profiler')
+        if self.profiler is not None or not (options['profile'] or options['cprofile_output']):
+            self.scrape(options)
+            return
+
+        self.profiler = ScrapeProfiler(cprofile=bool(options['cprofile_output']))
+        try:
+            with self.profiler:
+                self.scrape(options)
+        finally:
+            # a failed run is the one most worth looking at
+            self.profiler.write_report(options['profile_output'])
+            self.stdout.write('profile written to {}'.format(options['profile_output']))
+            if options['cprofile_output']:
+                self.profiler.dump_cprofile(options['cprofile_output'])
+                self.stdout.write('cProfile stats written to {}'.format(options['cprofile_output']))
+
+    def stage(self, name):
+        return self.profiler.stage(name) if self.profiler is not None else nullcontext()
+
+    def scrape(self, options):
+        if options['use_async']:
+            # the async path has no checkpoints, high-water marks nor cost estimate
+            unsupported = [flag for flag in ('resume', 'incremental', 'estimate', 'stats_only') if options[flag]]
+            if unsupported:
+                raise CommandError('--async cannot be combined with {}'.format(
+                    ', '.join('--' + flag.replace('_', '-') for flag in unsupported)
+                ))
+
+        if options['stats_only']:
+            self.refresh_stats(options)
+            return
+
+        channel_ids = options['channels'] or list(
+            RegisteredChannel.objects.filter(is_active=True).order_by('id').values_list('channel_uid', flat=True)
+        )
+        if not channel_ids:
+            raise CommandError('No channels to scrape, add some with the register_channels command')
+
+        mode = options['mode']
+        # only the uploads playlist is ordered newest first, so only it can stop early
+        incremental = options['incremental'] and mode == MODE_UPLOADS
+        if options['incremental'] and not incremental:
+            logger.warning('--incremental only applies to --mode uploads, doing a full scrape')
+
+        # both paths run under the same locks; an estimate writes nothing and takes none
+        lock_scope, lock_policy = options['lock_scope'], options['lock_policy']
+        global_lock = None
+        if lock_scope == LOCK_SCOPE_GLOBAL and not options['estimate']:
+            global_lock = self.scrape_lock(GLOBAL_LOCK_NAME)
+        if global_lock is not None and not global_lock.acquire(blocking=lock_policy == LOCK_POLICY_QUEUE):
+            self.stdout.write('another scrape is running, skipped')
+            return
+
+        with global_lock or nullcontext():
+            if options['use_async']:
+                self.handle_async(
+                    channel_ids, options['concurrency'], mode, lock_scope, lock_policy, options['queue_size'],
                 )
+            else:
+                self.scrape_sync(options, channel_ids, mode, incremental)
 
-                playlists = playlist_info.get('items')
-                playlist_item_ids = None
+    def scrape_sync(self, options, channel_ids, mode, incremental):
+        api_components = self.api_components()
+        limiter, key_pool = api_components['limiter'], api_components['key_pool']
+        get_api = self.api_factory(api_components)
 
-                if playlists:
-                    playlist_item_ids = []
-                    for playlist in playlists:
-                        playlist_id = playlist.get('id')
+        with self.stage('channels'):
+            channel_items = self.fetch_channel_items(get_api(), channel_ids)
 
-                        if playlist_id:
-                            playlist_items_info = api.get_playlist_items(
-                                playlist_id=playlist_id,
-                                parts='snippet,contentDetails',
-                                count=None,
-                                limit=50,
-                            )
-                            playlist_items = playlist_items_info.get('items')
+        if options['estimate']:
+            estimate = limiter.estimate_scrape_cost(channel_items, list_playlists=mode == MODE_PLAYLISTS)
+            self.stdout.write('estimated cost: {} units, remaining today: {} units'.format(
+                estimate, key_pool.remaining(),
+            ))
+            return
 
-                            if playlist_items:
-                                for playlist_item in playlist_items:
-                                    content_details = playlist_item.get('contentDetails')
-                                    if content_details:
-                                        playlist_item_ids.append(content_details.get('videoId'))
+        # a video can sit in many playlists, fetch and save it once per run
+        seen_video_ids = set()
 
-                                    if len(playlist_item_ids) == 50:
-                                        self.save_videos(api, channel_instance, playlist_item_ids)
+        # Channel threads page the playlists and hand batches of video ids to the
+        # fetch stage, whose threads hand the videos to the persist stage; the
+        # network and the database are busy at the same time.
+        def fetch(batch):
+            channel_instance, video_ids = batch
+            with self.stage('fetch'):
+                return channel_instance, self.fetch_video_items(get_api(), video_ids)
 
-                                        playlist_item_ids = []
+        def persist(batch):
+            channel_instance, video_items = batch
+            with self.stage('persist'):
+                self.save_video_items(channel_instance, video_items)
+            return len(video_items)
 
-                if playlist_item_ids:
-                    self.save_videos(api, channel_instance, playlist_item_ids)
+        pipeline = Pipeline([
+            Stage('fetch', fetch, workers=options['fetch_workers'], queue_size=options['queue_size']),
+            Stage('persist', persist, workers=options['persist_workers'], queue_size=options['queue_size']),
+        ], thread_exit=lambda: connection.close())
+        paging_stats = {'batches': 0, 'seconds': 0.0}
+        paging_lock = threading.Lock()
 
-    def save_videos(self, api, channel_instance, playlist_item_ids):
+        def scrape(channel_item):
+            with self.stage('save_channel'):
+                channel_instance = self.save_channel(channel_item)
+            if channel_instance is None:
+                return
+
+            full_scan = not incremental or self.needs_full_scan(channel_instance, options['full_rescan_hours'])
+            checkpoint = self.load_checkpoint(channel_instance, mode) if options['resume'] else None
+            if checkpoint is not None:
+                # carry on the scrape the checkpoint belongs to, a full scan stays one
+                full_scan = checkpoint.full_scan
+                logger.info(f'Resuming {channel_instance.channel_uid} at playlist {checkpoint.playlist_id}')
+
+            api = get_api()
+            playlist_ids = self.iter_channel_playlist_ids(api, channel_item, mode)
+            # batches handed to the pipeline and not known to be saved yet
+            unsaved = []
+            batches = 0
+
+            def save_batch(video_ids):
+                nonlocal batches
+                video_ids = list(video_ids)
+                unsaved.append((pipeline.submit((channel_instance, video_ids)), video_ids))
+                batches += 1
+
+            def on_page(playlist_id, page_token, pending_video_ids, newest):
+                unsaved[:] = [(ticket, video_ids) for ticket, video_ids in unsaved if not ticket.succeeded()]
+                with self.stage('checkpoint'):
+                    self.save_checkpoint(
+                        channel_instance, mode, full_scan, playlist_id, page_token,
+                        [video_id for _, video_ids in unsaved for video_id in video_ids] + pending_video_ids,
+                        newest,
+                    )
+
+            start = time.perf_counter()
+            with self.stage('paging'):
+                newest = self.scrape_channel(
+                    api, channel_instance, playlist_ids, seen_video_ids,
+                    known_until=None if full_scan else channel_instance,
+                    save_batch=save_batch,
+                    resume_from=checkpoint,
+                    on_page=on_page,
+                )
+            with paging_lock:
+                paging_stats['batches'] += batches
+                paging_stats['seconds'] += time.perf_counter() - start
+
+            # the mark only moves once every batch of the channel is saved
+            with self.stage('wait_for_pipeline'):
+                for ticket, _ in unsaved:
+                    ticket.wait()
+
+            with self.stage('finish_channel'):
+                if mode == MODE_UPLOADS:
+                    self.update_high_water_mark(channel_instance, newest, full_scan)
+                self.clear_checkpoint(channel_instance, mode)
+
+        lock_scope, lock_policy = options['lock_scope'], options['lock_policy']
+        with pipeline:
+            results = self.scrape_channels(
+                channel_items, options['workers'], scrape,
+                lock_scope=lock_scope, lock_policy=lock_policy,
+            )
+
+        for channel_uid, seconds, error in results:
+            self.stdout.write('  {}: {:.1f}s {}'.format(channel_uid, seconds, error or 'ok'))
+        skipped = sum(1 for _, _, error in results if error and error.startswith('skipped'))
+        failed = sum(1 for _, _, error in results if error) - skipped
+        self.stdout.write('{} channels scraped, {} failed, {} skipped'.format(
+            len(results) - failed - skipped, failed, skipped,
+        ))
+        lock_name = GLOBAL_LOCK_NAME if lock_scope == LOCK_SCOPE_GLOBAL else 'channel:'
+        self.stdout.write(self.scrape_lock(lock_name).stats_line())
+        self.write_pipeline_stats(pipeline, paging_stats, options['workers'])
+        for model, counts in self.write_stats.items():
+            self.stdout.write('{}: {} created, {} changed, {} unchanged'.format(
+                model, counts['created'], counts['changed'], counts['unchanged'],
+            ))
+        self.write_api_usage(api_components)
+
+    def refresh_stats(self, options):
+        """
+        Refetch only the statistics of the saved videos, 50 per request, and
+        update their counters. No playlist is paged and no snippet downloaded.
+        """
+        api_components = self.api_components()
+        get_api = self.api_factory(api_components)
+
+        videos = Video.objects.all()
+        if options['channels']:
+            videos = videos.filter(channel__channel_uid__in=options['channels'])
+
+        if options['estimate']:
+            self.stdout.write('estimated cost: {} units, remaining today: {} units'.format(
+                api_components['limiter'].estimate_stats_refresh_cost(videos.count()),
+                api_components['key_pool'].remaining(),
+            ))
+            return
+
+        quota_exhausted = threading.Event()
+
+        def fetch(video_ids):
+            # the batches queued before the quota ran out are dropped, not sent
+            if quota_exhausted.is_set():
+                return []
+            with self.stage('fetch'):
+                try:
+                    video_items = self.fetch_video_items(
+                        get_api(), video_ids, parts=VIDEO_STATS_PARTS, fields=VIDEO_STATS_FIELDS,
+                    )
+                except QuotaExceededError:
+                    quota_exhausted.set()
+                    raise
+            # deleted and private videos are not returned
+            self.count_writes('videos', Counter(missing=len(video_ids) - len(video_items)))
+            return video_items
+
+        def persist(video_items):
+            stats = Counter()
+            with self.stage('persist'):
+                persistence.save_video_stats(video_items, stats=stats)
+            self.count_writes('videos', stats)
+            return len(video_items)
+
+        pipeline = Pipeline([
+            Stage('fetch', fetch, workers=options['fetch_workers'], queue_size=options['queue_size']),
+            Stage('persist', persist, workers=options['persist_workers'], queue_size=options['queue_size']),
+        ], thread_exit=lambda: connection.close())
+
+        tickets = []
+        with pipeline:
+            # keyset pages keep no cursor open while the pipeline writes
+            last_pk = 0
+            while not quota_exhausted.is_set():
+                page = list(
+                    videos.filter(pk__gt=last_pk).order_by('pk').values_list('pk', 'video_uid')[:VIDEOS_PER_REQUEST * 20]
+                )
+                if not page:
+                    break
+                last_pk = page[-1][0]
+                for i in range(0, len(page), VIDEOS_PER_REQUEST):
+                    tickets.append(pipeline.submit([video_uid for _, video_uid in page[i:i + VIDEOS_PER_REQUEST]]))
+
+        errors = [ticket.error for ticket in tickets if ticket.error is not None]
+        if quota_exhausted.is_set():
+            logger.error('Quota exhausted, the counters of the remaining videos were not refreshed')
+        for error in errors:
+            if not isinstance(error, QuotaExceededError):
+                logger.error(f'Refreshing a batch of video stats failed: {type(error).__name__}: {error}')
+
+        counts = self.write_stats['videos']
+        self.stdout.write('{} batches, {} failed'.format(len(tickets), len(errors)))
+        self.write_pipeline_stats(pipeline)
+        self.stdout.write('videos: {} changed, {} unchanged, {} not returned'.format(
+            counts['changed'], counts['unchanged'], counts['missing'],
+        ))
+        self.write_api_usage(api_components)
+
+    def api_factory(self, api_components):
+        # requests sessions are not meant to be shared between threads, the rest is
+        local = threading.local()
+
+        def get_api():
+            if not hasattr(local, 'api'):
+                local.api = Api(
+                    **api_components,
+                    request_hook=self.profiler.record_request if self.profiler is not None else None,
+                )
+            return local.api
+
+        return get_api
+
+    def write_api_usage(self, api_components):
+        cache, limiter, key_pool = api_components['cache'], api_components['limiter'], api_components['key_pool']
+        if cache is not None:
+            self.stdout.write('api cache: {hits} hits, {misses} misses, {bytes_saved} bytes saved'.format(**cache.stats()))
+        self.stdout.write('quota used today: {total}/{budget} units'.format(**limiter.usage()))
+        for fingerprint, usage in key_pool.usage().items():
+            self.stdout.write('  key {}: {}/{} units{}'.format(
+                fingerprint, usage['total'], usage['budget'], ' (exhausted)' if usage['exhausted'] else '',
+            ))
+
+    @staticmethod
+    def api_components():
+        key_pool = ApiKeyPool.from_settings()
+        return {
+            'cache': get_response_cache(),
+            'key_pool': key_pool,
+            # every key brings its own daily budget, the pool enforces them one by one
+            'limiter': QuotaLimiter(daily_budget=settings.YOUTUBE_API_DAILY_QUOTA * len(key_pool.keys)),
+            'breaker': CircuitBreaker(),
+        }
+
+    def fetch_channel_items(self, api, channel_ids):
+        channel_items = []
+        for i in range(0, len(channel_ids), CHANNELS_PER_REQUEST):
+            channel_info = api.get_channel_info(
+                channel_id=channel_ids[i:i + CHANNELS_PER_REQUEST],
+                parts=CHANNEL_PARTS,
+                fields=CHANNEL_FIELDS,
+            )
+            channel_items += [item for item in channel_info.get('items') or [] if item.get('id')]
+
+        missing = set(channel_ids) - {item['id'] for item in channel_items}
+        if missing:
+            logger.warning(f'Channels not found: {", ".join(sorted(missing))}')
+            RegisteredChannel.objects.filter(channel_uid__in=missing).update(
+                last_scraped_at=timezone.now(), last_error='channel not found',
+            )
+
+        return channel_items
+
+    @staticmethod
+    def scrape_lock(name, token=None):
+        return DistributedLock(name, expire=settings.YOUTUBE_SCRAPE_LOCK_EXPIRE, token=token)
+
+    def scrape_channels(self, channel_items, workers, scrape, lock_scope=None, lock_policy=LOCK_POLICY_SKIP):
+        """
+        Call scrape(channel_item) for every channel, at most `workers` of them at a time.
+
+        A failing channel is logged and recorded on the registry, the others go on.
+        Once the quota is exhausted the channels which have not started are skipped.
+        With the channel lock scope, a channel another scrape is working on is
+        skipped or waited for, depending on lock_policy.
+
+        Returns the (channel_uid, seconds, error) of every channel.
+        """
+        quota_exhausted = threading.Event()
+
+        def run(channel_item):
+            channel_uid = channel_item['id']
+            if quota_exhausted.is_set():
+                return channel_uid, 0.0, 'skipped, quota exhausted'
+
+            lock = self.scrape_lock(f'channel:{channel_uid}') if lock_scope == LOCK_SCOPE_CHANNEL else None
+            if lock is not None and not lock.acquire(blocking=lock_policy == LOCK_POLICY_QUEUE):
+                return channel_uid, 0.0, 'skipped, scraped elsewhere'
+
+            error = None
+            start = time.perf_counter()
+            try:
+                with lock or nullcontext():
+                    scrape(channel_item)
+            except QuotaExceededError as e:
+                # everything saved so far is kept, the next run picks up the rest
+                quota_exhausted.set()
+                error = f'quota exhausted: {e}'
+                logger.error(f'Quota exhausted while scraping {channel_uid}: {e}')
+            except Exception as e:
+                error = f'{type(e).__name__}: {e}'
+                logger.exception(f'Scraping {channel_uid} failed')
+            seconds = time.perf_counter() - start
+
+            RegisteredChannel.objects.filter(channel_uid=channel_uid).update(
+                last_scraped_at=timezone.now(), last_scrape_seconds=seconds, last_error=error,
+            )
+            return channel_uid, seconds, error
+
+        if workers <= 1:
+            return [run(channel_item) for channel_item in channel_items]
+
+        def run_in_thread(channel_item):
+            try:
+                return run(channel_item)
+            finally:
+                # django opens one connection per thread, the pool threads go away with the run
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(run_in_thread, channel_items))
+
+    def iter_channel_playlist_ids(self, api, channel_item, mode):
+        if mode == MODE_UPLOADS:
+            # every public video of the channel is in its uploads playlist
+            uploads_playlist_id = get_path(channel_item, CHANNEL_UPLOADS_PATH)
+            if uploads_playlist_id:
+                yield uploads_playlist_id
+            return
+
+        for playlist_page in api.iter_playlists(
+            channel_id=channel_item['id'],
+            parts=PLAYLIST_PARTS,
+            fields=PLAYLIST_FIELDS,
+        ):
+            for playlist in playlist_page.get('items', []):
+                playlist_id = playlist.get('id')
+                if playlist_id:
+                    yield playlist_id
+
+    @staticmethod
+    def needs_full_scan(channel_instance, full_rescan_hours):
+        if channel_instance.last_published_at is None or channel_instance.last_full_scan_at is None:
+            return True
+        return timezone.now() - channel_instance.last_full_scan_at >= timedelta(hours=full_rescan_hours)
+
+    @staticmethod
+    def is_known(channel_instance, video_id, published_at):
+        if video_id == channel_instance.last_video_uid:
+            return True
+        return published_at is not None and published_at <= channel_instance.last_published_at
+
+    def scrape_channel(self, api, channel_instance, playlist_ids, seen_video_ids, known_until=None, save_batch=None,
+                       resume_from=None, on_page=None):
+        """
+        Page the playlists and save their videos.
+
+        known_until is the channel whose high-water mark ends the paging: the
+        uploads playlist is newest first, so everything after the first known
+        video is known too.
+
+        save_batch is called with every batch of up to 50 new video ids, by
+        default it fetches and saves them right away.
+
+        resume_from is the ScrapeCheckpoint of an interrupted scrape: the
+        playlists before its playlist and the pages before its page token are
+        not requested again, and its pending video ids are saved first. A
+        checkpoint whose playlist is gone or whose page token the API rejects is
+        dropped and the playlists are paged from the start.
+        on_page(playlist_id, page_token, pending_video_ids, newest) is called
+        after every page, with the token of the next page (None at the end of
+        the playlist) and the ids not handed to save_batch yet.
+
+        Returns the (published_at, video_uid) of the newest video seen, or None.
+        """
+        # Pages are consumed as they arrive and video ids are flushed every 50,
+        # so memory stays flat however many uploads the channel has.
+        if save_batch is None:
+            def save_batch(video_ids):
+                self.save_videos(api, channel_instance, video_ids)
+
+        playlist_item_ids = []
+        newest = None
+        reached_known = False
+        resume_playlist_id = resume_page_token = None
+
+        if resume_from is not None:
+            resume_playlist_id, resume_page_token = resume_from.playlist_id, resume_from.page_token
+            pending = list(resume_from.pending_video_ids)
+            with self.seen_lock:
+                seen_video_ids.update(pending)
+            while len(pending) >= 50:
+                save_batch(pending[:50])
+                pending = pending[50:]
+            playlist_item_ids = pending
+            if resume_from.newest_published_at is not None:
+                newest = (resume_from.newest_published_at, resume_from.newest_video_uid)
+
+        if resume_playlist_id is not None:
+            playlists = self.resumed_playlists(
+                channel_instance, playlist_ids, resume_playlist_id, resume_page_token,
+            )
+        else:
+            playlists = ((playlist_id, None) for playlist_id in playlist_ids)
+
+        for playlist_id, page_token in playlists:
+            if page_token is not None:
+                def restart():
+                    # the pending ids are saved already, only the position is lost
+                    self.clear_checkpoint(channel_instance, resume_from.mode)
+                playlist_items_pages = self.iter_resumed_playlist_items(api, playlist_id, page_token, restart)
+            else:
+                playlist_items_pages = api.iter_playlist_items(
+                    playlist_id=playlist_id,
+                    parts=PLAYLIST_ITEM_PARTS,
+                    fields=PLAYLIST_ITEM_FIELDS,
+                )
+
+            for playlist_items_page in playlist_items_pages:
+                for playlist_item in playlist_items_page.get('items', []):
+                    video_id = get_path(playlist_item, PLAYLIST_ITEM_VIDEO_ID_PATH)
+                    published_at = parse_datetime(get_path(playlist_item, PLAYLIST_ITEM_PUBLISHED_AT_PATH) or '')
+
+                    if known_until is not None and self.is_known(known_until, video_id, published_at):
+                        reached_known = True
+                        break
+
+                    if published_at is not None and (newest is None or published_at > newest[0]):
+                        newest = (published_at, video_id)
+
+                    if not video_id:
+                        continue
+                    with self.seen_lock:
+                        if video_id in seen_video_ids:
+                            continue
+                        seen_video_ids.add(video_id)
+                    playlist_item_ids.append(video_id)
+
+                    if len(playlist_item_ids) == 50:
+                        save_batch(playlist_item_ids)
+
+                        playlist_item_ids = []
+
+                if reached_known:
+                    # leaving the generator here means the next page is never requested
+                    break
+                if on_page is not None:
+                    on_page(playlist_id, playlist_items_page.get('nextPageToken'), playlist_item_ids, newest)
+            if reached_known:
+                break
+
+        if playlist_item_ids:
+            save_batch(playlist_item_ids)
+
+        return newest
+
+    @staticmethod
+    def resumed_playlists(channel_instance, playlist_ids, resume_playlist_id, resume_page_token):
+        """
+        The (playlist id, page token) to page when resuming at the checkpointed
+        playlist: the playlists before it are skipped. When it is gone, e.g. deleted
+        since, every playlist is paged from its first page.
+        """
+        playlist_ids = iter(playlist_ids)
+        skipped = []
+        for playlist_id in playlist_ids:
+            if playlist_id != resume_playlist_id:
+                skipped.append(playlist_id)
+                continue
+            # without a token the checkpoint was taken after the last page of this playlist
+            if resume_page_token is not None:
+                yield playlist_id, resume_page_token
+            for playlist_id in playlist_ids:
+                yield playlist_id, None
+            return
+
+        logger.warning('checkpointed playlist {} of channel {} is gone, scraping all the playlists'.format(
+            resume_playlist_id, channel_instance.channel_uid,
+        ))
+        for playlist_id in skipped:
+            yield playlist_id, None
+
+    @staticmethod
+    def iter_resumed_playlist_items(api, playlist_id, page_token, restart):
+        """
+        Page the playlist from the checkpointed page token. A token the API
+        rejects, stale or expired, calls restart() and pages the playlist from
+        its first page instead.
+        """
+        playlist_items_pages = api.iter_playlist_items(
+            playlist_id=playlist_id,
+            parts=PLAYLIST_ITEM_PARTS,
+            fields=PLAYLIST_ITEM_FIELDS,
+            page_token=page_token,
+        )
+        try:
+            first_page = next(playlist_items_pages, None)
+        except ApiError as e:
+            # quota and transient errors are subclasses, they are not about the token
+            if type(e) is not ApiError or e.status_code != 400:
+                raise
+            logger.warning('page token of playlist {} rejected ({}), restarting the playlist'.format(playlist_id, e))
+            restart()
+            yield from api.iter_playlist_items(
+                playlist_id=playlist_id,
+                parts=PLAYLIST_ITEM_PARTS,
+                fields=PLAYLIST_ITEM_FIELDS,
+            )
+            return
+        if first_page is not None:
+            yield first_page
+            yield from playlist_items_pages
+
+    @staticmethod
+    def load_checkpoint(channel_instance, mode):
+        return ScrapeCheckpoint.objects.filter(channel=channel_instance, mode=mode).first()
+
+    @staticmethod
+    def save_checkpoint(channel_instance, mode, full_scan, playlist_id, page_token, pending_video_ids, newest):
+        ScrapeCheckpoint.objects.update_or_create(
+            channel=channel_instance,
+            mode=mode,
+            defaults={
+                'full_scan': full_scan,
+                'playlist_id': playlist_id,
+                'page_token': page_token,
+                'pending_video_ids': list(pending_video_ids),
+                'newest_published_at': newest[0] if newest else None,
+                'newest_video_uid': newest[1] if newest else None,
+            },
+        )
+
+    @staticmethod
+    def clear_checkpoint(channel_instance, mode):
+        ScrapeCheckpoint.objects.filter(channel=channel_instance, mode=mode).delete()
+
+    @staticmethod
+    def update_high_water_mark(channel_instance, newest, full_scan):
+        # only called once the channel was scraped completely, so an interrupted
+        # run never moves the mark past videos it did not save
+        update_fields = []
+        if newest is not None and (
+            channel_instance.last_published_at is None or newest[0] > channel_instance.last_published_at
+        ):
+            channel_instance.last_published_at, channel_instance.last_video_uid = newest
+            update_fields += ['last_published_at', 'last_video_uid']
+        if full_scan:
+            channel_instance.last_full_scan_at = timezone.now()
+            update_fields.append('last_full_scan_at')
+
+        if update_fields:
+            channel_instance.save(update_fields=update_fields)
+
+    def handle_async(self, channel_ids, concurrency, mode, lock_scope=None, lock_policy=LOCK_POLICY_SKIP, queue_size=8):
+        with ExitStack() as channel_locks:
+            if lock_scope == LOCK_SCOPE_CHANNEL:
+                # the channels are fetched all at once, so their locks are all taken up front
+                locked_channel_ids = []
+                for channel_id in channel_ids:
+                    lock = self.scrape_lock(f'channel:{channel_id}')
+                    if not lock.acquire(blocking=lock_policy == LOCK_POLICY_QUEUE):
+                        self.stdout.write('  {}: skipped, scraped elsewhere'.format(channel_id))
+                        continue
+                    channel_locks.enter_context(lock)
+                    locked_channel_ids.append(channel_id)
+                channel_ids = locked_channel_ids
+            if not channel_ids:
+                return
+
+            api_components = self.api_components()
+            self.stream_async(channel_ids, concurrency, mode, api_components, queue_size)
+            self.write_api_usage(api_components)
+
+    def stream_async(self, channel_ids, concurrency, mode, api_components, queue_size=8):
+        """
+        Fetch in an event loop of its own thread and save as the fetches complete.
+
+        The ORM is synchronous and may not run on the loop, so the loop hands
+        every channel, then every batch of up to 50 of its videos, to this
+        thread through a bounded queue; a full queue holds the fetches back.
+        """
+        batches = queue.Queue(maxsize=queue_size)
+        stopped = threading.Event()
+        fetch_errors = []
+
+        def put(batch):
+            if stopped.is_set():
+                raise RuntimeError('saving stopped, fetch abandoned')
+            batches.put(batch)
+
+        def fetch():
+            try:
+                asyncio.run(self.fetch_async(channel_ids, concurrency, mode, api_components, put))
+            except Exception as e:
+                fetch_errors.append(e)
+            finally:
+                batches.put(None)
+
+        fetch_thread = threading.Thread(target=fetch, name='async-fetch')
+        fetch_thread.start()
+        channel_instances = {}
+        try:
+            for channel_item, payload in iter(batches.get, None):
+                channel_id = channel_item['id']
+                if isinstance(payload, Exception):
+                    # one failed channel does not cancel the fetches of the others
+                    logger.error(f'Scraping {channel_id} failed: {payload!r}')
+                elif payload is None:
+                    channel_instances[channel_id] = self.save_channel(channel_item)
+                elif channel_instances.get(channel_id) is not None:
+                    self.save_video_items(channel_instances[channel_id], payload)
+        finally:
+            # a failed save must not leave the fetch thread blocked on the full queue
+            stopped.set()
+            while fetch_thread.is_alive():
+                try:
+                    batches.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            fetch_thread.join()
+
+        if fetch_errors:
+            raise fetch_errors[0]
+
+    async def fetch_async(self, channel_ids, concurrency, mode, api_components, put):
+        """
+        Fetch the channels and their videos, handing every (channel item, None)
+        and then every (channel item, video items) to put() as it completes,
+        or (channel item, exception) when the channel failed.
+        """
+        loop = asyncio.get_running_loop()
+
+        async def put_async(batch):
+            await loop.run_in_executor(None, put, batch)
+
+        # the same quota budget, key pool, breaker and cache as the sync path
+        async with AsyncApi(
+            **api_components,
+            concurrency=concurrency,
+            request_hook=self.profiler.record_request if self.profiler is not None else None,
+        ) as api:
+            channel_infos = await asyncio.gather(*[
+                api.get_channel_info(
+                    channel_id=channel_ids[i:i + CHANNELS_PER_REQUEST], parts=CHANNEL_PARTS, fields=CHANNEL_FIELDS,
+                )
+                for i in range(0, len(channel_ids), CHANNELS_PER_REQUEST)
+            ])
+            channel_items = [
+                item for channel_info in channel_infos for item in channel_info.get('items', []) if item.get('id')
+            ]
+
+            seen_video_ids = set()
+
+            async def fetch_channel(channel_item):
+                await put_async((channel_item, None))
+                try:
+                    await self.fetch_channel_videos_async(api, channel_item, mode, seen_video_ids, put_async)
+                except Exception as e:
+                    await put_async((channel_item, e))
+
+            await asyncio.gather(*[fetch_channel(channel_item) for channel_item in channel_items])
+
+    async def fetch_channel_videos_async(self, api, channel_item, mode, seen_video_ids, put_async):
+        if mode == MODE_UPLOADS:
+            uploads_playlist_id = get_path(channel_item, CHANNEL_UPLOADS_PATH)
+            playlist_ids = [uploads_playlist_id] if uploads_playlist_id else []
+        else:
+            playlist_info = await api.get_playlists(
+                channel_id=channel_item['id'], parts=PLAYLIST_PARTS, fields=PLAYLIST_FIELDS, count=None, limit=50,
+            )
+            playlist_ids = [playlist['id'] for playlist in playlist_info.get('items', []) if playlist.get('id')]
+
+        fetches = []
+
+        async def fetch_batch(video_ids):
+            video_info = await api.get_video_by_id(
+                video_id=video_ids, parts=VIDEO_PARTS, fields=VIDEO_FIELDS, limit=VIDEOS_PER_REQUEST,
+            )
+            await put_async((channel_item, video_info.get('items') or []))
+
+        async def page_playlist(playlist_id):
+            video_ids = []
+            async for playlist_items_page in api.iter_playlist_items(
+                playlist_id=playlist_id, parts=PLAYLIST_ITEM_PARTS, fields=PLAYLIST_ITEM_FIELDS,
+            ):
+                for playlist_item in playlist_items_page.get('items', []):
+                    video_id = get_path(playlist_item, PLAYLIST_ITEM_VIDEO_ID_PATH)
+                    # the check and the add run without an await in between, so channels can share the set
+                    if not video_id or video_id in seen_video_ids:
+                        continue
+                    seen_video_ids.add(video_id)
+                    video_ids.append(video_id)
+                    if len(video_ids) == VIDEOS_PER_REQUEST:
+                        fetches.append(asyncio.ensure_future(fetch_batch(video_ids)))
+                        video_ids = []
+            if video_ids:
+                fetches.append(asyncio.ensure_future(fetch_batch(video_ids)))
+
+        try:
+            await asyncio.gather(*[page_playlist(playlist_id) for playlist_id in playlist_ids])
+        finally:
+            # the batches handed out before a paging failure are still fetched and saved
+            errors = [error for error in await asyncio.gather(*fetches, return_exceptions=True) if error is not None]
+        if errors:
+            raise errors[0]
+
+    def save_channel(self, channel_item):
+        stats = Counter()
+        channel_instance = persistence.save_channels([channel_item], stats=stats).get(channel_item.get('id'))
+        self.count_writes('channels', stats)
+        return channel_instance
+
+    def count_writes(self, model, stats):
+        with self.write_stats_lock:
+            self.write_stats[model].update(stats)
+
+    def write_pipeline_stats(self, pipeline, paging_stats=None, paging_workers=None):
+        stats = pipeline.stats()
+        elapsed = (pipeline.finished_at or time.perf_counter()) - pipeline.started_at
+        self.stdout.write('pipeline, {:.1f}s:'.format(elapsed))
+        if paging_stats is not None:
+            self.stdout.write('  {:8} {:>3} workers: {:>6} batches {:>7.1f}/s, busy {:>4.0%}'.format(
+                'paging', paging_workers, paging_stats['batches'],
+                paging_stats['batches'] / elapsed if elapsed else 0.0,
+                paging_stats['seconds'] / (elapsed * paging_workers) if elapsed else 0.0,
+            ))
+        for stage in stats:
+            self.stdout.write(
+                '  {stage:8} {workers:>3} workers: {processed:>6} batches {per_second:>7.1f}/s, busy {busy:>4.0%}, '
+                '{failed} failed, queue depth max {max_queue_depth} mean {mean_queue_depth:.1f}, '
+                'upstream blocked {producers_blocked_seconds:.1f}s'.format(**stage)
+            )
+
+    @staticmethod
+    def fetch_video_items(api, video_ids, parts=VIDEO_PARTS, fields=VIDEO_FIELDS):
         video_info = api.get_video_by_id(
-            video_id=playlist_item_ids,
-            parts='snippet,statistics',
-            limit=50,
-        )
-
-        video_items = video_info.get('items')
-        if video_items:
-            for video_item in video_items:
-                video_snippet = video_item.get('snippet')
-                video_statistics = video_item.get('statistics')
-                video_tags = video_snippet.get('tags')
-                video_id = video_item.get('id')
-                video_instances = Video.objects.filter(video_uid=video_id)
-
-                if video_instances.exists():
-                    video_instance = video_instances.first()
-
-                else:
-                    video_instance = Video(video_uid=video_id)
-
-                video_instance.channel = channel_instance
-                video_instance.title = video_snippet.get('title')
-                video_instance.description = video_snippet.get('description')
-                video_instance.published_at = video_snippet.get('publishedAt')
-                video_instance.view_count = video_statistics.get('viewCount')
-                video_instance.comment_count = video_statistics.get('commentCount')
-                video_instance.like_count = video_statistics.get('likeCount')
-                video_instance.dislike_count = video_statistics.get('dislikeCount')
-                video_instance.favorite_count = video_statistics.get('favoriteCount')
-                video_instance.save()
-
-                video_instance.tags.clear()
-                if video_tags:
-                    video_instance.tags.add(*video_tags)
+            video_id=video_ids,
+            parts=parts,
+            fields=fields,
+            limit=VIDEOS_PER_REQUEST,
+        )
+        return video_info.get('items') or []
+
+    def save_videos(self, api, channel_instance, playlist_item_ids):
+        self.save_video_items(channel_instance, self.fetch_video_items(api, playlist_item_ids))
 
+    def save_video_items(self, channel_instance, video_items, batch_size=500):
+        video_items = video_items or []
+        stats = Counter()
+        for i in range(0, len(video_items), batch_size):
+            persistence.save_videos(channel_instance, video_items[i:i + batch_size], stats=stats)
+        self.count_writes('videos', stats)
@@ -0,0 +1,93 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from utube.models import Channel, Video
+from utube.scrapper import persistence
+from utube.scrapper.mappers import VIDEO_FIELD_MAPPING, VIDEO_TAGS_PATH, get_path, map_item
+
+
+def fake_video_items(count, offset=0, revision=0):
+    for i in range(offset, offset + count):
+        yield {
+            'id': 'bench-{}'.format(i),
+            'snippet': {
+                'title': 'Video {} rev {}'.format(i, revision),
+                'description': 'Description of video {}'.format(i),
+                'publishedAt': '2020-04-19T16:10:00Z',
+                'tags': ['tag-{}'.format(i % 100), 'tag-{}'.format(i % 7)],
+            },
+            'statistics': {
+                'viewCount': str(i), 'likeCount': '1', 'commentCount': '2',
+                'dislikeCount': '0', 'favoriteCount': '0',
+            },
+        }
+
+
+def save_videos_per_row(channel, video_items):
+    # the scraper's original row by row path, kept here as the baseline
+    for video_item in video_items:
+        video_instances = Video.objects.filter(video_uid=video_item['id'])
+        if video_instances.exists():
+            video_instance = video_instances.first()
+        else:
+            video_instance = Video(video_uid=video_item['id'])
+
+        video_instance.channel = channel
+        for field, value in map_item(video_item, VIDEO_FIELD_MAPPING).items():
+            setattr(video_instance, field, value)
+        video_instance.save()
+
+        video_instance.tags.clear()
+        video_tags = get_path(video_item, VIDEO_TAGS_PATH)
+        if video_tags:
+            video_instance.tags.add(*video_tags)
+
+
+class Command(BaseCommand):
+    help = 'Measure rows per second of the per-row and the bulk video persistence. Nothing is kept.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--videos', type=int, default=100000)
+        parser.add_argument('--batch-size', type=int, default=50)
+        parser.add_argument(
+            '--baseline-videos',
+            type=int,
+            default=5000,
+            help='The per-row path is slow, it is measured on this many videos only.',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        results = []
+
+        for name, count, save in [
+            ('per-row', min(options['baseline_videos'], options['videos']), save_videos_per_row),
+            ('bulk', options['videos'], persistence.save_videos),
+        ]:
+            with transaction.atomic():
+                channel = Channel.objects.create(channel_uid='bench-channel')
+                seconds = []
+                # inserts, then updates of changed items, then a rescrape of the same items
+                for items in [
+                    list(fake_video_items(count)),
+                    list(fake_video_items(count, revision=1)),
+                    list(fake_video_items(count, revision=1)),
+                ]:
+                    start = time.perf_counter()
+                    for i in range(0, count, batch_size):
+                        save(channel, items[i:i + batch_size])
+                    seconds.append(time.perf_counter() - start)
+
+                transaction.set_rollback(True)
+
+            results.append((name, count, *seconds))
+
+        for name, count, inserted, updated, unchanged in results:
+            self.stdout.write(
+                '{:8} {:>7} videos: insert {:>8.0f} rows/s, update {:>8.0f} rows/s, '
+                'unchanged {:>8.0f} rows/s'.format(
+                    name, count, count / inserted, count / updated, count / unchanged,
+                )
+            )
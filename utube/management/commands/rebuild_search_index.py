@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from utube.api.cache import bump_generation
+from utube.models import Video
+from utube.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = 'Index the saved videos for search. Only needed by the inverted index backend, after it is first enabled.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        backend = get_search_backend()
+        if not backend.indexes_writes:
+            self.stdout.write('the {} backend keeps its own index, nothing to do'.format(type(backend).__name__))
+            return
+
+        indexed = 0
+        last_pk = 0
+        while True:
+            videos = list(
+                Video.objects.filter(pk__gt=last_pk).order_by('pk').only('pk', 'title', 'description')[
+                    :options['batch_size']
+                ]
+            )
+            if not videos:
+                break
+            with transaction.atomic():
+                backend.index_videos(videos)
+            indexed += len(videos)
+            last_pk = videos[-1].pk
+
+        # cached searches were answered without these videos
+        bump_generation()
+        self.stdout.write('{} videos indexed'.format(indexed))
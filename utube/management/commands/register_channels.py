@@ -0,0 +1,55 @@
+import logging
+
+from django.core.management.base import BaseCommand, CommandError
+
+from utube.models import RegisteredChannel
+
+logger = logging.getLogger(__name__)
+
+
+def read_channel_ids(path):
+    # one channel id per line, blank lines and # comments are skipped
+    with open(path) as f:
+        for line in f:
+            channel_id = line.split('#', 1)[0].strip()
+            if channel_id:
+                yield channel_id
+
+
+class Command(BaseCommand):
+    help = 'Add channels to the registry the channel_scrapper works through, or deactivate them.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('channel_ids', nargs='*', help='Channel ids to register.')
+        parser.add_argument('--file', help='File with one channel id per line.')
+        parser.add_argument(
+            '--deactivate',
+            action='store_true',
+            help='Stop scraping the given channels instead of registering them.',
+        )
+
+    def handle(self, *args, **options):
+        channel_ids = list(options['channel_ids'])
+        if options['file']:
+            try:
+                channel_ids += read_channel_ids(options['file'])
+            except OSError as e:
+                raise CommandError(f'Cannot read {options["file"]}: {e}')
+        channel_ids = list(dict.fromkeys(channel_ids))
+
+        if not channel_ids:
+            raise CommandError('Give channel ids or --file')
+
+        if options['deactivate']:
+            count = RegisteredChannel.objects.filter(channel_uid__in=channel_ids).update(is_active=False)
+            self.stdout.write(f'{count} channels deactivated')
+            return
+
+        existing = set(RegisteredChannel.objects.filter(channel_uid__in=channel_ids).values_list('channel_uid', flat=True))
+        RegisteredChannel.objects.bulk_create(
+            [RegisteredChannel(channel_uid=channel_id) for channel_id in channel_ids if channel_id not in existing],
+            ignore_conflicts=True,
+        )
+        reactivated = RegisteredChannel.objects.filter(channel_uid__in=existing, is_active=False).update(is_active=True)
+
+        self.stdout.write(f'{len(channel_ids) - len(existing)} channels registered, {reactivated} reactivated')
@@ -0,0 +1,28 @@
+# Generated by Django 4.0.6 on 2026-10-17 17:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('utube', '0003_auto_20200419_1629'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='channel',
+            name='last_full_scan_at',
+            field=models.DateTimeField(blank=True, default=None, null=True),
+        ),
+        migrations.AddField(
+            model_name='channel',
+            name='last_published_at',
+            field=models.DateTimeField(blank=True, default=None, null=True),
+        ),
+        migrations.AddField(
+            model_name='channel',
+            name='last_video_uid',
+            field=models.CharField(blank=True, default=None, max_length=100, null=True),
+        ),
+    ]
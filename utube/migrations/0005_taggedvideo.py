@@ -0,0 +1,79 @@
+# Generated by Django 4.0.6 on 2026-10-17 17:36
+
+from django.db import migrations, models
+import django.db.models.deletion
+import taggit.managers
+
+
+def copy_tagged_items(apps, schema_editor):
+    ContentType = apps.get_model('contenttypes', 'ContentType')
+    TaggedItem = apps.get_model('taggit', 'TaggedItem')
+    TaggedVideo = apps.get_model('utube', 'TaggedVideo')
+    Video = apps.get_model('utube', 'Video')
+
+    content_type = ContentType.objects.filter(app_label='utube', model='video').first()
+    if content_type is None:
+        return
+
+    tagged_items = TaggedItem.objects.filter(content_type=content_type)
+    # generic rows can outlive their video, a real foreign key cannot
+    video_ids = set(Video.objects.values_list('id', flat=True))
+    batch = []
+    for object_id, tag_id in tagged_items.values_list('object_id', 'tag_id').iterator():
+        if object_id in video_ids:
+            batch.append(TaggedVideo(content_object_id=object_id, tag_id=tag_id))
+        if len(batch) >= 1000:
+            TaggedVideo.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    TaggedVideo.objects.bulk_create(batch, ignore_conflicts=True)
+
+    tagged_items.delete()
+
+
+def restore_tagged_items(apps, schema_editor):
+    ContentType = apps.get_model('contenttypes', 'ContentType')
+    TaggedItem = apps.get_model('taggit', 'TaggedItem')
+    TaggedVideo = apps.get_model('utube', 'TaggedVideo')
+
+    content_type, _ = ContentType.objects.get_or_create(app_label='utube', model='video')
+    batch = []
+    for object_id, tag_id in TaggedVideo.objects.values_list('content_object_id', 'tag_id').iterator():
+        batch.append(TaggedItem(content_type=content_type, object_id=object_id, tag_id=tag_id))
+        if len(batch) >= 1000:
+            TaggedItem.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    TaggedItem.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('taggit', '0005_auto_20220424_2025'),
+        ('utube', '0004_channel_high_water_mark'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TaggedVideo',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('content_object', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tagged_items', to='utube.video')),
+                ('tag', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='%(app_label)s_%(class)s_items', to='taggit.tag')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='taggedvideo',
+            index=models.Index(fields=['tag', 'content_object'], name='utube_taggedvideo_tag_video'),
+        ),
+        migrations.AddConstraint(
+            model_name='taggedvideo',
+            constraint=models.UniqueConstraint(fields=('content_object', 'tag'), name='utube_taggedvideo_video_tag_uniq'),
+        ),
+        migrations.RunPython(copy_tagged_items, restore_tagged_items),
+        migrations.AlterField(
+            model_name='video',
+            name='tags',
+            field=taggit.managers.TaggableManager(help_text='A comma-separated list of tags.', through='utube.TaggedVideo', to='taggit.Tag', verbose_name='Tags'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.0.6 on 2026-10-17 17:41
+
+from django.db import migrations, models
+
+# the channel the scraper used to hard-code, so existing deployments keep scraping it
+DEFAULT_CHANNEL_UID = 'UChTsiSbpTuSrdOHpXkKlq6Q'
+
+
+def register_default_channel(apps, schema_editor):
+    RegisteredChannel = apps.get_model('utube', 'RegisteredChannel')
+    RegisteredChannel.objects.get_or_create(channel_uid=DEFAULT_CHANNEL_UID)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('utube', '0005_taggedvideo'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RegisteredChannel',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('channel_uid', models.CharField(max_length=100, unique=True)),
+                ('is_active', models.BooleanField(default=True)),
+                ('added_at', models.DateTimeField(auto_now_add=True)),
+                ('last_scraped_at', models.DateTimeField(blank=True, default=None, null=True)),
+                ('last_scrape_seconds', models.FloatField(blank=True, default=None, null=True)),
+                ('last_error', models.TextField(blank=True, default=None, null=True)),
+            ],
+        ),
+        migrations.RunPython(register_default_channel, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.0.6 on 2026-10-17 17:48
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('utube', '0006_channel_registry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScrapeCheckpoint',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mode', models.CharField(max_length=20)),
+                ('full_scan', models.BooleanField(default=True)),
+                ('playlist_id', models.CharField(max_length=100)),
+                ('page_token', models.CharField(blank=True, default=None, max_length=255, null=True)),
+                ('pending_video_ids', models.JSONField(default=list)),
+                ('newest_published_at', models.DateTimeField(blank=True, default=None, null=True)),
+                ('newest_video_uid', models.CharField(blank=True, default=None, max_length=100, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('channel', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='checkpoints', to='utube.channel')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='scrapecheckpoint',
+            constraint=models.UniqueConstraint(fields=('channel', 'mode'), name='utube_scrapecheckpoint_channel_mode_uniq'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.0.6 on 2026-10-17 17:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('utube', '0007_scrape_checkpoint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='channel',
+            name='content_hash',
+            field=models.CharField(blank=True, default=None, max_length=32, null=True),
+        ),
+        migrations.AddField(
+            model_name='video',
+            name='content_hash',
+            field=models.CharField(blank=True, default=None, max_length=32, null=True),
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 4.0.6 on 2026-10-17 17:56
+
+from django.db import migrations
+from django.db.models import Count, Min
+
+
+def duplicates(model, uid_field):
+    """
+    The (uid, kept pk) of every uid saved more than once. The oldest row is kept.
+    """
+    return (
+        model.objects.values_list(uid_field)
+        .annotate(rows=Count('id'), kept=Min('id'))
+        .filter(rows__gt=1)
+        .values_list(uid_field, 'kept')
+    )
+
+
+def dedupe_videos(apps, schema_editor):
+    Video = apps.get_model('utube', 'Video')
+    TaggedVideo = apps.get_model('utube', 'TaggedVideo')
+
+    for video_uid, kept in list(duplicates(Video, 'video_uid')):
+        dropped = Video.objects.filter(video_uid=video_uid).exclude(pk=kept)
+        # the kept row gets the tags of all its copies
+        TaggedVideo.objects.bulk_create(
+            [
+                TaggedVideo(content_object_id=kept, tag_id=tag_id)
+                for tag_id in TaggedVideo.objects.filter(content_object__in=dropped).values_list('tag_id', flat=True)
+            ],
+            ignore_conflicts=True,
+        )
+        dropped.delete()
+        # which copy held the latest data is unknown, the next scrape writes the row again
+        Video.objects.filter(pk=kept).update(content_hash=None)
+
+
+def dedupe_channels(apps, schema_editor):
+    Channel = apps.get_model('utube', 'Channel')
+    Video = apps.get_model('utube', 'Video')
+    ScrapeCheckpoint = apps.get_model('utube', 'ScrapeCheckpoint')
+
+    for channel_uid, kept in list(duplicates(Channel, 'channel_uid')):
+        dropped = Channel.objects.filter(channel_uid=channel_uid).exclude(pk=kept)
+        Video.objects.filter(channel__in=dropped).update(channel_id=kept)
+        # an interrupted scrape of a copy starts over
+        ScrapeCheckpoint.objects.filter(channel__in=dropped).delete()
+        dropped.delete()
+        Channel.objects.filter(pk=kept).update(content_hash=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('utube', '0008_content_hash'),
+    ]
+
+    operations = [
+        migrations.RunPython(dedupe_videos, migrations.RunPython.noop),
+        migrations.RunPython(dedupe_channels, migrations.RunPython.noop),
+    ]
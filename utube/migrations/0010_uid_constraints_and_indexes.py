@@ -0,0 +1,35 @@
+# Generated by Django 4.0.6 on 2026-10-17 17:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('utube', '0009_dedupe_uids'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='channel',
+            name='channel_uid',
+            field=models.CharField(max_length=100, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='video',
+            name='video_uid',
+            field=models.CharField(max_length=100, unique=True),
+        ),
+        migrations.AddIndex(
+            model_name='video',
+            index=models.Index(fields=['channel', 'published_at'], name='utube_video_channel_published'),
+        ),
+        migrations.AddIndex(
+            model_name='video',
+            index=models.Index(fields=['published_at'], name='utube_video_published_at'),
+        ),
+        migrations.AddIndex(
+            model_name='video',
+            index=models.Index(fields=['view_count'], name='utube_video_view_count'),
+        ),
+    ]
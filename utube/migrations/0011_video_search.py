@@ -0,0 +1,39 @@
+# Generated by Django 4.0.6 on 2026-10-17 17:57
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def create_fulltext_index(apps, schema_editor):
+    # only MySQL has FULLTEXT indexes, the other databases search the inverted index
+    if schema_editor.connection.vendor == 'mysql':
+        schema_editor.execute('CREATE FULLTEXT INDEX utube_video_fulltext ON utube_video (title, description)')
+
+
+def drop_fulltext_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'mysql':
+        schema_editor.execute('DROP INDEX utube_video_fulltext ON utube_video')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('utube', '0010_uid_constraints_and_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VideoSearchTerm',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=64)),
+                ('weight', models.PositiveIntegerField(default=1)),
+                ('video', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_terms', to='utube.video')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='videosearchterm',
+            constraint=models.UniqueConstraint(fields=('term', 'video'), name='utube_videosearchterm_term_video_uniq'),
+        ),
+        migrations.RunPython(create_fulltext_index, drop_fulltext_index),
+    ]
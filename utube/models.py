@@ -1,21 +1,28 @@
 from django.db import models
 from taggit.managers import TaggableManager
+from taggit.models import TaggedItemBase
 
 
 class Channel(models.Model):
-    channel_uid = models.CharField(max_length=100)
+    channel_uid = models.CharField(max_length=100, unique=True)
     title = models.CharField(max_length=255, null=True, blank=True, default=None)
     description = models.TextField(null=True, blank=True, default=None)
     view_count = models.PositiveIntegerField(null=True, blank=True, default=0)
     comment_count = models.PositiveIntegerField(null=True, blank=True, default=0)
     subscriber_count = models.PositiveIntegerField(null=True, blank=True, default=0)
     video_count = models.PositiveIntegerField(null=True, blank=True, default=0)
+    # high-water mark of the uploads playlist, incremental scrapes stop paging there
+    last_published_at = models.DateTimeField(null=True, blank=True, default=None)
+    last_video_uid = models.CharField(max_length=100, null=True, blank=True, default=None)
+    last_full_scan_at = models.DateTimeField(null=True, blank=True, default=None)
+    # digest of the scraped fields, a row whose digest did not change is not written again
+    content_hash = models.CharField(max_length=32, null=True, blank=True, default=None)
 
 
 class Video(models.Model):
     channel = models.ForeignKey('Channel', on_delete=models.DO_NOTHING, null=True, blank=True, default=None)
-    tags = TaggableManager()
-    video_uid = models.CharField(max_length=100)
+    tags = TaggableManager(through='TaggedVideo')
+    video_uid = models.CharField(max_length=100, unique=True)
     title = models.CharField(max_length=255, null=True, default=None)
     description = models.TextField(null=True, default=None)
     published_at = models.DateTimeField()
@@ -24,4 +31,79 @@ class Video(models.Model):
     like_count = models.PositiveIntegerField(null=True, blank=True, default=0)
     dislike_count = models.PositiveIntegerField(null=True, blank=True, default=0)
     favorite_count = models.PositiveIntegerField(null=True, blank=True, default=0)
+    # digest of the scraped fields and tags, a row whose digest did not change is not written again
+    content_hash = models.CharField(max_length=32, null=True, blank=True, default=None)
 
+    class Meta:
+        # the orderings and filters of the videos API
+        indexes = [
+            models.Index(fields=['channel', 'published_at'], name='utube_video_channel_published'),
+            models.Index(fields=['published_at'], name='utube_video_published_at'),
+            models.Index(fields=['view_count'], name='utube_video_view_count'),
+        ]
+
+
+class TaggedVideo(TaggedItemBase):
+    """
+    Tags of a video, joined with a real foreign key instead of taggit's generic
+    content type relation.
+    """
+    content_object = models.ForeignKey('Video', on_delete=models.CASCADE, related_name='tagged_items')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['content_object', 'tag'], name='utube_taggedvideo_video_tag_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['tag', 'content_object'], name='utube_taggedvideo_tag_video'),
+        ]
+
+
+class VideoSearchTerm(models.Model):
+    """
+    A word of a video's title or description: the inverted index searched
+    when the database has no full-text index.
+    """
+    term = models.CharField(max_length=64)
+    video = models.ForeignKey('Video', on_delete=models.CASCADE, related_name='search_terms')
+    weight = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['term', 'video'], name='utube_videosearchterm_term_video_uniq'),
+        ]
+
+
+class RegisteredChannel(models.Model):
+    """
+    A channel the scraper keeps up to date, with the outcome of its last scrape.
+    """
+    channel_uid = models.CharField(max_length=100, unique=True)
+    is_active = models.BooleanField(default=True)
+    added_at = models.DateTimeField(auto_now_add=True)
+    last_scraped_at = models.DateTimeField(null=True, blank=True, default=None)
+    last_scrape_seconds = models.FloatField(null=True, blank=True, default=None)
+    last_error = models.TextField(null=True, blank=True, default=None)
+
+
+class ScrapeCheckpoint(models.Model):
+    """
+    How far an unfinished scrape of a channel got, to resume it where it stopped.
+    Deleted once the channel is scraped completely.
+    """
+    channel = models.ForeignKey('Channel', on_delete=models.CASCADE, related_name='checkpoints')
+    mode = models.CharField(max_length=20)
+    full_scan = models.BooleanField(default=True)
+    # the playlist being paged and the token of its next page, None once the playlist is done
+    playlist_id = models.CharField(max_length=100)
+    page_token = models.CharField(max_length=255, null=True, blank=True, default=None)
+    # ids seen on the pages before the token but not saved yet
+    pending_video_ids = models.JSONField(default=list)
+    newest_published_at = models.DateTimeField(null=True, blank=True, default=None)
+    newest_video_uid = models.CharField(max_length=100, null=True, blank=True, default=None)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['channel', 'mode'], name='utube_scrapecheckpoint_channel_mode_uniq'),
+        ]
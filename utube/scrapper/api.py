@@ -2,13 +2,22 @@
     Main Api implementation.
 """
 
-from typing import Optional, List, Union
+import logging
+import time
+from typing import Callable, Optional, Iterator, List, Union
 
 import requests
 from requests.models import Response
 
+from utube.scrapper.cache import ResponseCache
+from utube.scrapper.exceptions import ApiError, QuotaExceededError, TransientApiError
+from utube.scrapper.keys import ApiKeyPool
+from utube.scrapper.quota import QuotaLimiter
+from utube.scrapper.resilience import CircuitBreaker, RetryPolicy
 from utube.utilz.params_checker import enf_comma_separated, enf_parts
 
+logger = logging.getLogger(__name__)
+
 
 class Api(object):
     """
@@ -27,18 +36,30 @@ class Api(object):
             >>> api.get_channel_info()
             >>> api.get_playlist_by_id()
             >>> api.get_playlists()
+            >>> api.iter_playlists()
             >>> api.get_playlist_item_by_id()
             >>> api.get_playlist_items()
+            >>> api.iter_playlist_items()
             >>> api.get_video_by_id()
     """
 
     BASE_URL = "https://www.googleapis.com/youtube/v3/"
 
+    QUOTA_ERROR_REASONS = {"quotaExceeded", "dailyLimitExceeded"}
+    TRANSIENT_ERROR_REASONS = {"rateLimitExceeded", "userRateLimitExceeded", "backendError", "internalError"}
+    TRANSIENT_STATUS_CODES = {429, 500, 502, 503, 504}
+
     def __init__(
         self,
         api_key: Optional[str] = None,
         timeout: Optional[int] = None,
         proxies: Optional[dict] = None,
+        cache: Optional[ResponseCache] = None,
+        limiter: Optional[QuotaLimiter] = None,
+        retry: Optional[RetryPolicy] = None,
+        breaker: Optional[CircuitBreaker] = None,
+        key_pool: Optional[ApiKeyPool] = None,
+        request_hook: Optional[Callable[[str, float, Optional[Response]], None]] = None,
     ) -> None:
         """
         This Api provide two method to work. Use api key or use access token.
@@ -52,6 +73,25 @@ class Api(object):
                 If you want use proxy, need point this param.
                 param style like requests lib style.
                 Refer https://2.python-requests.org//en/latest/user/advanced/#proxies
+            cache(ResponseCache, optional):
+                If provide this, GET responses are cached by etag and
+                unchanged data is served from it on `304 Not Modified`.
+            limiter(QuotaLimiter, optional):
+                If provide this, every request is charged to the daily quota budget
+                and paced before it is sent.
+            retry(RetryPolicy, optional):
+                How transient errors are retried. Default is RetryPolicy().
+            breaker(CircuitBreaker, optional):
+                Stops sending requests while the error rate is too high.
+                Default is CircuitBreaker().
+            key_pool(ApiKeyPool, optional):
+                If provide this, every request uses a key picked from the pool
+                instead of `api_key`, and a key the API reports as out of quota
+                is swapped for the next one.
+            request_hook(callable, optional):
+                Called after every HTTP request sent, retries included, with the
+                resource, the seconds it took and the response (None when the
+                connection failed). Used to profile the scrapes.
 
         Returns:
             Api instance.
@@ -62,9 +102,47 @@ class Api(object):
         self._timeout = 10
         self.proxies = proxies
         self.scope = None
+        self.cache = cache
+        self.limiter = limiter
+        self.retry = retry or RetryPolicy()
+        self.breaker = breaker or CircuitBreaker()
+        self.key_pool = key_pool
+        self.request_hook = request_hook
+
+    @classmethod
+    def _error_from_response(cls, response: Response) -> Optional[ApiError]:
+        """
+        Build the typed exception for an error response.
 
-    @staticmethod
-    def _parse_response(response: Response) -> dict:
+        Args:
+            response (Response)
+                The response which the request return.
+        Return:
+             The exception to raise, or None if the response is not an error.
+        """
+        if response.status_code < 400:
+            return None
+
+        try:
+            error = response.json().get("error") or {}
+        except ValueError:
+            error = {}
+        reason = ((error.get("errors") or [{}])[0]).get("reason")
+        message = error.get("message") or f"HTTP {response.status_code} {response.reason or ''}".strip()
+
+        if reason in cls.QUOTA_ERROR_REASONS:
+            return QuotaExceededError(message, status_code=response.status_code, reason=reason)
+        if response.status_code in cls.TRANSIENT_STATUS_CODES or reason in cls.TRANSIENT_ERROR_REASONS:
+            return TransientApiError(
+                message,
+                status_code=response.status_code,
+                reason=reason,
+                retry_after=RetryPolicy.parse_retry_after(response.headers.get("Retry-After")),
+            )
+        return ApiError(message, status_code=response.status_code, reason=reason)
+
+    @classmethod
+    def _parse_response(cls, response: Response) -> dict:
         """
         Parse response data and check whether errors exists.
 
@@ -73,10 +151,16 @@ class Api(object):
                 The response which the request return.
         Return:
              response's data
+        Raises:
+            QuotaExceededError, TransientApiError or ApiError if the API returned an error.
         """
+        error = cls._error_from_response(response)
+        if error is not None:
+            raise error
+
         data = response.json()
         if "error" in data:
-            raise Exception(response)
+            raise ApiError(str(data["error"]), status_code=response.status_code)
         return data
 
     @staticmethod
@@ -90,7 +174,8 @@ class Api(object):
         Return:
              response's items
         """
-        items = data["items"]
+        # a `fields` mask drops the items key when there is no item
+        items = data.get("items", [])
         return items
 
     def _request(
@@ -112,6 +197,9 @@ class Api(object):
                 The Post params for this request.
         Returns:
             response
+        Note:
+            Transient errors are retried here with the same args, so a paging loop
+            carries on from its current page token instead of starting over.
         """
         if method is None:
             method = "GET"
@@ -133,19 +221,71 @@ class Api(object):
         elif method == "GET" and key not in args:
             args[key] = access_token
 
-        try:
-            response = self.session.request(
-                method=method,
-                url=self.BASE_URL + resource,
-                timeout=self._timeout,
-                params=args,
-                data=post_args,
-                proxies=self.proxies,
-            )
-        except requests.HTTPError as e:
-            raise Exception(message=e.args[0])
-        else:
-            return response
+        cache_key = None
+        cache_entry = None
+        headers = {}
+        if self.cache is not None and method == "GET":
+            cache_key = self.cache.make_key(resource, args)
+            cache_entry = self.cache.get(cache_key)
+            headers = self.cache.request_headers(cache_entry)
+
+        attempt = 0
+        while True:
+            self.breaker.before_request()
+            request_args, request_post_args = args, post_args
+            if self.key_pool is not None:
+                pool_key = self.key_pool.acquire(resource)
+                if method == "POST":
+                    request_post_args = dict(post_args, key=pool_key)
+                else:
+                    request_args = dict(args, key=pool_key)
+            if self.limiter is not None:
+                self.limiter.acquire(resource)
+
+            sent_at = time.perf_counter()
+            try:
+                response = self.session.request(
+                    method=method,
+                    url=self.BASE_URL + resource,
+                    timeout=self._timeout,
+                    params=request_args,
+                    data=request_post_args,
+                    headers=headers,
+                    proxies=self.proxies,
+                )
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = TransientApiError(str(e))
+                if self.request_hook is not None:
+                    self.request_hook(resource, time.perf_counter() - sent_at, None)
+            else:
+                if self.request_hook is not None:
+                    self.request_hook(resource, time.perf_counter() - sent_at, response)
+                error = self._error_from_response(response)
+
+            if isinstance(error, QuotaExceededError) and self.key_pool is not None:
+                # the API answered, which settles a half open breaker's trial before the next key is tried
+                self.breaker.record_success()
+                self.key_pool.mark_exhausted(pool_key)
+                logger.warning(f"Api key {self.key_pool.fingerprint(pool_key)} is out of quota, rotating")
+                continue
+
+            if not isinstance(error, TransientApiError):
+                # client and quota errors say nothing about the API's health
+                self.breaker.record_success()
+                break
+
+            self.breaker.record_failure()
+            if attempt >= self.retry.max_retries:
+                raise error
+
+            delay = self.retry.delay(attempt, error.retry_after)
+            logger.warning(f"{resource} request failed ({error}), retry {attempt + 1} in {delay:.1f}s")
+            time.sleep(delay)
+            attempt += 1
+
+        if cache_key is not None:
+            response = self.cache.resolve(cache_key, cache_entry, response)
+        return response
 
     def get_channel_info(
         self,
@@ -155,6 +295,7 @@ class Api(object):
         mine: Optional[bool] = None,
         parts: Optional[Union[str, list, tuple, set]] = None,
         hl: str = "en_US",
+        fields: Optional[str] = None,
     ):
         """
         Retrieve channel data from YouTube Data API.
@@ -180,6 +321,9 @@ class Api(object):
             hl (str, optional):
                 If provide this. Will return channel's language localized info.
                 This value need https://developers.google.com/youtube/v3/docs/i18nLanguages.
+            fields (str, optional):
+                Partial response mask, e.g. "items(id,snippet(title))".
+                Only the listed properties are returned, which shrinks the payload.
 
         Returns:
             data
@@ -198,10 +342,57 @@ class Api(object):
         else:
             raise Exception("Specify at least one of channel_id,channel_name or mine")
 
+        if fields is not None:
+            args["fields"] = fields
+
         resp = self._request(resource="channels", method="GET", args=args)
 
         return self._parse_response(resp)
 
+    def iter_pages_by_page_token(
+            self, resource: str, args: dict, count: Optional[int] = None,
+    ) -> Iterator[dict]:
+        """
+        Yield the response pages one by one, following the response's page token.
+        Nothing is kept between pages, so memory stays flat whatever the result size.
+
+        Args:
+            resource (str):
+                The resource string need to retrieve data.
+            args (dict)
+                The args for api. Provide `pageToken` in it to start from that page.
+            count (int, optional):
+                The count for result items you want to get.
+                If provide this with None, will retrieve all items.
+        Returns:
+            Iterator of data api origin responses. Each page's `nextPageToken`
+            can be given back as `page_token` to resume right after that page.
+        """
+        page_token: Optional[str] = args.get("pageToken")
+        now_items_count: int = 0
+
+        while True:
+            page_args = dict(args)
+            if page_token is not None:
+                page_args["pageToken"] = page_token
+
+            resp = self._request(resource=resource, method="GET", args=page_args)
+            data = self._parse_response(resp)  # origin response
+            page_token = data.get("nextPageToken")
+
+            items = self._parse_data(data)
+            now_items_count += len(items)
+            # first check the count if satisfies.
+            if count is not None and now_items_count >= count:
+                data["items"] = items[:len(items) - (now_items_count - count)]
+                yield data
+                break
+
+            yield data
+            # if have no page token, mean no more data.
+            if page_token is None:
+                break
+
     def paged_by_page_token(
             self, resource: str, args: dict, count: Optional[int] = None,
     ):
@@ -217,38 +408,22 @@ class Api(object):
                 If provide this with None, will retrieve all items.
                 Note:
                     The all items maybe too much. Notice your app's cost.
+                    Use `iter_pages_by_page_token` to stream them instead.
         Returns:
             Data api origin response.
         """
         res_data: Optional[dict] = None
         current_items: List[dict] = []
         page_token: Optional[str] = None
-        now_items_count: int = 0
-
-        while True:
-            if page_token is not None:
-                args["pageToken"] = page_token
+        prev_page_token: Optional[str] = None
 
-            resp = self._request(resource=resource, method="GET", args=args)
-            data = self._parse_response(resp)  # origin response
-            # set page token
+        for data in self.iter_pages_by_page_token(resource=resource, args=args, count=count):
             page_token = data.get("nextPageToken")
             prev_page_token = data.get("prevPageToken")
 
-            # parse results.
-            items = self._parse_data(data)
-            current_items.extend(items)
-            now_items_count += len(items)
+            current_items.extend(self._parse_data(data))
             if res_data is None:
                 res_data = data
-            # first check the count if satisfies.
-            if count is not None:
-                if now_items_count >= count:
-                    current_items = current_items[:count]
-                    break
-            # if have no page token, mean no more data.
-            if page_token is None:
-                break
         res_data["items"] = current_items
 
         # use last request page token
@@ -262,6 +437,7 @@ class Api(object):
         playlist_id: Union[str, list, tuple, set],
         parts: Optional[Union[str, list, tuple, set]] = None,
         hl: Optional[str] = "en_US",
+        fields: Optional[str] = None,
     ):
         """
         Retrieve playlist data by given playlist id.
@@ -277,6 +453,9 @@ class Api(object):
             hl (str, optional):
                 If provide this. Will return playlist's language localized info.
                 This value need https://developers.google.com/youtube/v3/docs/i18nLanguages.
+            fields (str, optional):
+                Partial response mask, e.g. "items(id,snippet(title))".
+                Only the listed properties are returned, which shrinks the payload.
         Returns:
             data
         """
@@ -286,6 +465,9 @@ class Api(object):
             "hl": hl,
         }
 
+        if fields is not None:
+            args["fields"] = fields
+
         resp = self._request(resource="playlists", method="GET", args=args)
 
         return self._parse_response(resp)
@@ -300,6 +482,7 @@ class Api(object):
         limit: Optional[int] = 5,
         hl: Optional[str] = "en_US",
         page_token: Optional[str] = None,
+        fields: Optional[str] = None,
     ):
         """
         Retrieve channel playlists info from youtube data api.
@@ -329,10 +512,61 @@ class Api(object):
                 The token of the page of playlists result to retrieve.
                 You can use this retrieve point result page directly.
                 And you should know about the the result set for YouTube.
+            fields (str, optional):
+                Partial response mask, e.g. "items(id,snippet(title))".
+                Only the listed properties are returned, which shrinks the payload.
         Returns:
             data
         """
 
+        args = self._playlists_args(
+            channel_id=channel_id, mine=mine, parts=parts, count=count,
+            limit=limit, hl=hl, page_token=page_token,
+        )
+
+        if fields is not None:
+            args["fields"] = fields
+
+        res_data = self.paged_by_page_token(
+            resource="playlists", args=args, count=count
+        )
+
+        return res_data
+
+    def iter_playlists(
+        self,
+        *,
+        channel_id: Optional[str] = None,
+        mine: Optional[bool] = None,
+        parts: Optional[Union[str, list, tuple, set]] = None,
+        count: Optional[int] = None,
+        limit: Optional[int] = 50,
+        hl: Optional[str] = "en_US",
+        page_token: Optional[str] = None,
+        fields: Optional[str] = None,
+    ) -> Iterator[dict]:
+        """
+        Stream channel playlists page by page instead of collecting them all.
+
+        Args:
+            Same as `get_playlists`, but `count` defaults to None (all playlists).
+            page_token(str, optional):
+                Resume from this page, e.g. the `nextPageToken` of the last page handled.
+        Returns:
+            Iterator of playlists response pages.
+        """
+        args = self._playlists_args(
+            channel_id=channel_id, mine=mine, parts=parts, count=count,
+            limit=limit, hl=hl, page_token=page_token,
+        )
+
+        if fields is not None:
+            args["fields"] = fields
+
+        return self.iter_pages_by_page_token(resource="playlists", args=args, count=count)
+
+    @staticmethod
+    def _playlists_args(*, channel_id, mine, parts, count, limit, hl, page_token) -> dict:
         if count is None:
             limit = 50  # for playlists the max limit for per request is 50
         else:
@@ -354,17 +588,14 @@ class Api(object):
         if page_token is not None:
             args["pageToken"] = page_token
 
-        res_data = self.paged_by_page_token(
-            resource="playlists", args=args, count=count
-        )
-
-        return res_data
+        return args
 
     def get_playlist_item_by_id(
         self,
         *,
         playlist_item_id: Union[str, list, tuple, set],
         parts: Optional[Union[str, list, tuple, set]] = None,
+        fields: Optional[str] = None,
     ):
         """
         Retrieve playlist Items info by your given id
@@ -378,6 +609,9 @@ class Api(object):
                 The resource parts for you want to retrieve.
                 If not provide, use default public parts.
                 You can pass this with single part str, comma-separated parts str or a list,tuple,set of parts.
+            fields (str, optional):
+                Partial response mask, e.g. "items(id,snippet(title))".
+                Only the listed properties are returned, which shrinks the payload.
         Returns:
             data
         """
@@ -387,6 +621,9 @@ class Api(object):
             "part": enf_parts(resource="playlistItems", value=parts),
         }
 
+        if fields is not None:
+            args["fields"] = fields
+
         resp = self._request(resource="playlistItems", method="GET", args=args)
 
         return self._parse_response(resp)
@@ -400,6 +637,7 @@ class Api(object):
         count: Optional[int] = 5,
         limit: Optional[int] = 5,
         page_token: Optional[str] = None,
+        fields: Optional[str] = None,
     ):
         """
         Retrieve playlist Items info by your given playlist id
@@ -425,10 +663,60 @@ class Api(object):
                 The token of the page of playlist items result to retrieve.
                 You can use this retrieve point result page directly.
                 And you should know about the the result set for YouTube.
+            fields (str, optional):
+                Partial response mask, e.g. "items(id,snippet(title))".
+                Only the listed properties are returned, which shrinks the payload.
         Returns:
             data
         """
 
+        args = self._playlist_items_args(
+            playlist_id=playlist_id, parts=parts, video_id=video_id,
+            count=count, limit=limit, page_token=page_token,
+        )
+
+        if fields is not None:
+            args["fields"] = fields
+
+        res_data = self.paged_by_page_token(
+            resource="playlistItems", args=args, count=count
+        )
+
+        return res_data
+
+    def iter_playlist_items(
+        self,
+        *,
+        playlist_id: str,
+        parts: Optional[Union[str, list, tuple, set]] = None,
+        video_id: Optional[str] = None,
+        count: Optional[int] = None,
+        limit: Optional[int] = 50,
+        page_token: Optional[str] = None,
+        fields: Optional[str] = None,
+    ) -> Iterator[dict]:
+        """
+        Stream playlist items page by page instead of collecting them all.
+
+        Args:
+            Same as `get_playlist_items`, but `count` defaults to None (all items).
+            page_token(str, optional):
+                Resume from this page, e.g. the `nextPageToken` of the last page handled.
+        Returns:
+            Iterator of playlistItems response pages.
+        """
+        args = self._playlist_items_args(
+            playlist_id=playlist_id, parts=parts, video_id=video_id,
+            count=count, limit=limit, page_token=page_token,
+        )
+
+        if fields is not None:
+            args["fields"] = fields
+
+        return self.iter_pages_by_page_token(resource="playlistItems", args=args, count=count)
+
+    @staticmethod
+    def _playlist_items_args(*, playlist_id, parts, video_id, count, limit, page_token) -> dict:
         if count is None:
             limit = 50  # for playlistItems the max limit for per request is 50
         else:
@@ -445,11 +733,7 @@ class Api(object):
         if page_token is not None:
             args["pageToken"] = page_token
 
-        res_data = self.paged_by_page_token(
-            resource="playlistItems", args=args, count=count
-        )
-
-        return res_data
+        return args
 
     def get_video_by_id(
         self,
@@ -457,6 +741,7 @@ class Api(object):
         video_id: Union[str, list, tuple, set],
         parts: Optional[Union[str, list, tuple, set]] = None,
         limit: Optional[int] = 10,
+        fields: Optional[str] = None,
     ):
         """
         Retrieve video data by given video id.
@@ -471,6 +756,9 @@ class Api(object):
                 You can pass this with single part str, comma-separated parts str or a list,tuple,set of parts.
             limit (int, optional):
                 The maximum number of items each request retrieve.
+            fields (str, optional):
+                Partial response mask, e.g. "items(id,snippet(title))".
+                Only the listed properties are returned, which shrinks the payload.
         Returns:
             data
         """
@@ -481,6 +769,9 @@ class Api(object):
             "maxResults": limit,
         }
 
+        if fields is not None:
+            args["fields"] = fields
+
         resp = self._request(resource="videos", method="GET", args=args)
 
         return self._parse_response(resp)
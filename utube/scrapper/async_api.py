@@ -0,0 +1,483 @@
+"""
+    Asyncio counterpart of the Api implementation.
+"""
+
+import asyncio
+import logging
+import time
+from typing import AsyncIterator, Callable, Optional, List, Union, Iterable
+
+import aiohttp
+from requests.models import Response
+
+from utube.scrapper.api import Api
+from utube.scrapper.cache import ResponseCache
+from utube.scrapper.exceptions import ApiError, QuotaExceededError, TransientApiError
+from utube.scrapper.keys import ApiKeyPool
+from utube.scrapper.quota import QuotaLimiter
+from utube.scrapper.resilience import CircuitBreaker, RetryPolicy
+from utube.utilz.params_checker import enf_comma_separated, enf_parts
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncApi(object):
+    """
+    Example usage:
+        All requests share one connection pool, and at most `concurrency`
+        requests are in flight at the same time:
+
+            >>> from utube.scrapper.async_api import AsyncApi
+            >>> async with AsyncApi(api_key="your api key", concurrency=10) as api:
+            ...     res = await api.get_channel_info(channel_id="UC_x5XG1OV2P6uZZ5FSM9Ttw")
+
+        Many playlists can be fetched at once:
+
+            >>> results = await api.gather_playlist_items(playlist_ids=["PL1", "PL2"])
+
+        Now this api provide methods as follows:
+            >>> api.get_channel_info()
+            >>> api.get_playlists()
+            >>> api.get_playlist_items()
+            >>> api.iter_playlist_items()
+            >>> api.get_video_by_id()
+            >>> api.gather_playlist_items()
+            >>> api.gather_videos_by_id()
+    """
+
+    BASE_URL = Api.BASE_URL
+
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        timeout: Optional[int] = None,
+        proxy: Optional[str] = None,
+        concurrency: int = 10,
+        cache: Optional[ResponseCache] = None,
+        limiter: Optional[QuotaLimiter] = None,
+        retry: Optional[RetryPolicy] = None,
+        breaker: Optional[CircuitBreaker] = None,
+        key_pool: Optional[ApiKeyPool] = None,
+        request_hook: Optional[Callable[[str, float, Optional[Response]], None]] = None,
+    ) -> None:
+        """
+        Args:
+            api_key(str, optional):
+                The api key which you create from google api console.
+            timeout(int, optional):
+                The request timeout in seconds. Default is 10.
+            proxy(str, optional):
+                Proxy url for every request, aiohttp style.
+            concurrency(int, optional):
+                The maximum number of requests in flight at the same time.
+                Default is 10.
+            cache, limiter, retry, breaker, key_pool, request_hook:
+                As for `Api`, and shared with the Api instances of the same run.
+                The limiter, key pool and cache may block, so they are called
+                in the default executor.
+
+        Returns:
+            AsyncApi instance.
+        """
+
+        self._api_key = api_key
+        self._timeout = timeout or 10
+        self.proxy = proxy
+        self.concurrency = concurrency
+        self.cache = cache
+        self.limiter = limiter
+        self.retry = retry or RetryPolicy()
+        self.breaker = breaker or CircuitBreaker()
+        self.key_pool = key_pool
+        self.request_hook = request_hook
+        self.session: Optional[aiohttp.ClientSession] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    async def __aenter__(self) -> "AsyncApi":
+        await self.open()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        await self.close()
+
+    async def open(self) -> None:
+        """
+        Create the shared connection pool. Must be called inside a running event loop.
+        """
+        if self.session is None:
+            connector = aiohttp.TCPConnector(limit=self.concurrency)
+            self.session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self._timeout),
+            )
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+
+    async def close(self) -> None:
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+            self._semaphore = None
+
+    @staticmethod
+    async def _run_blocking(func, *args):
+        return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+    async def _send(self, resource: str, params: dict, headers: dict) -> Response:
+        """
+        Send one GET and wrap its answer in a requests Response, so errors are
+        classified and responses cached exactly as `Api` does.
+        """
+        async with self.session.get(
+            self.BASE_URL + resource, params=params, headers=headers, proxy=self.proxy,
+        ) as aio_response:
+            content = await aio_response.read()
+
+        response = Response()
+        response.status_code = aio_response.status
+        response.reason = aio_response.reason
+        response.headers.update(aio_response.headers)
+        response.url = str(aio_response.url)
+        response.encoding = "utf-8"
+        response._content = content
+        return response
+
+    async def _request(self, resource: str, args: Optional[dict] = None) -> dict:
+        """
+        Main request sender. Only GET is needed by the read-only resources.
+
+        Args:
+            resource(str)
+                Resource field is which type data you want to retrieve.
+                Such as channels，videos and so on.
+            args(dict, optional)
+                The url params for this request.
+        Returns:
+            response's data
+        Note:
+            Like `Api._request`: every attempt goes through the breaker, the key
+            pool and the limiter, and transient errors are retried with the same args.
+        """
+        if self.session is None or self._semaphore is None:
+            await self.open()
+
+        params = {k: str(v) for k, v in (args or {}).items() if v is not None}
+        if self._api_key is not None and "key" not in params:
+            params["key"] = self._api_key
+
+        cache_key = None
+        cache_entry = None
+        headers = {}
+        if self.cache is not None:
+            cache_key = self.cache.make_key(resource, params)
+            cache_entry = await self._run_blocking(self.cache.get, cache_key)
+            headers = self.cache.request_headers(cache_entry)
+
+        attempt = 0
+        while True:
+            self.breaker.before_request()
+            async with self._semaphore:
+                # charged and paced once a slot is free, so the pacing holds for what is sent
+                request_params = params
+                if self.key_pool is not None:
+                    pool_key = await self._run_blocking(self.key_pool.acquire, resource)
+                    request_params = dict(params, key=pool_key)
+                if self.limiter is not None:
+                    await self._run_blocking(self.limiter.acquire, resource)
+
+                sent_at = time.perf_counter()
+                try:
+                    response = await self._send(resource, request_params, headers)
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    error = TransientApiError(str(e) or type(e).__name__)
+                    if self.request_hook is not None:
+                        self.request_hook(resource, time.perf_counter() - sent_at, None)
+                else:
+                    if self.request_hook is not None:
+                        self.request_hook(resource, time.perf_counter() - sent_at, response)
+                    error = Api._error_from_response(response)
+
+            if isinstance(error, QuotaExceededError) and self.key_pool is not None:
+                # the API answered, which settles a half open breaker's trial before the next key is tried
+                self.breaker.record_success()
+                await self._run_blocking(self.key_pool.mark_exhausted, pool_key)
+                logger.warning(f"Api key {self.key_pool.fingerprint(pool_key)} is out of quota, rotating")
+                continue
+
+            if not isinstance(error, TransientApiError):
+                # client and quota errors say nothing about the API's health
+                self.breaker.record_success()
+                break
+
+            self.breaker.record_failure()
+            if attempt >= self.retry.max_retries:
+                raise error
+
+            delay = self.retry.delay(attempt, error.retry_after)
+            logger.warning(f"{resource} request failed ({error}), retry {attempt + 1} in {delay:.1f}s")
+            await asyncio.sleep(delay)
+            attempt += 1
+
+        if error is not None:
+            raise error
+        if cache_key is not None:
+            response = await self._run_blocking(self.cache.resolve, cache_key, cache_entry, response)
+
+        data = response.json()
+        if "error" in data:
+            raise ApiError(str(data["error"]), status_code=response.status_code)
+        return data
+
+    async def paged_by_page_token(
+        self, resource: str, args: dict, count: Optional[int] = None,
+    ):
+        """
+        Response paged by response's page token.
+        Pages of one resource depend on each other, so they are fetched in order;
+        run several of these concurrently to overlap the waiting.
+
+        Args:
+            resource (str):
+                The resource string need to retrieve data.
+            args (dict)
+                The args for api.
+            count (int, optional):
+                The count for result items you want to get.
+                If provide this with None, will retrieve all items.
+        Returns:
+            Data api origin response.
+        """
+        args = dict(args)
+        res_data: Optional[dict] = None
+        current_items: List[dict] = []
+        page_token: Optional[str] = None
+        prev_page_token: Optional[str] = None
+
+        while True:
+            if page_token is not None:
+                args["pageToken"] = page_token
+
+            data = await self._request(resource=resource, args=args)
+            page_token = data.get("nextPageToken")
+            prev_page_token = data.get("prevPageToken")
+
+            current_items.extend(data.get("items", []))
+            if res_data is None:
+                res_data = data
+            if count is not None and len(current_items) >= count:
+                current_items = current_items[:count]
+                break
+            if page_token is None:
+                break
+        res_data["items"] = current_items
+
+        res_data["nextPageToken"] = page_token
+        res_data["prevPageToken"] = prev_page_token
+        return res_data
+
+    async def iter_pages_by_page_token(
+        self, resource: str, args: dict, count: Optional[int] = None,
+    ) -> AsyncIterator[dict]:
+        """
+        Yield the response pages one by one, following the response's page token.
+        See `Api.iter_pages_by_page_token`.
+        """
+        page_token: Optional[str] = args.get("pageToken")
+        now_items_count: int = 0
+
+        while True:
+            page_args = dict(args)
+            if page_token is not None:
+                page_args["pageToken"] = page_token
+
+            data = await self._request(resource=resource, args=page_args)
+            page_token = data.get("nextPageToken")
+
+            items = data.get("items", [])
+            now_items_count += len(items)
+            if count is not None and now_items_count >= count:
+                data["items"] = items[:len(items) - (now_items_count - count)]
+                yield data
+                break
+
+            yield data
+            if page_token is None:
+                break
+
+    async def get_channel_info(
+        self,
+        *,
+        channel_id: Optional[Union[str, list, tuple, set]] = None,
+        channel_name: Optional[str] = None,
+        parts: Optional[Union[str, list, tuple, set]] = None,
+        hl: str = "en_US",
+        fields: Optional[str] = None,
+    ):
+        """
+        Retrieve channel data. See `Api.get_channel_info`.
+        """
+        args = {
+            "part": enf_parts(resource="channels", value=parts),
+            "hl": hl,
+        }
+        if channel_name is not None:
+            args["forUsername"] = channel_name
+        elif channel_id is not None:
+            args["id"] = enf_comma_separated("channel_id", channel_id)
+        else:
+            raise Exception("Specify at least one of channel_id or channel_name")
+
+        if fields is not None:
+            args["fields"] = fields
+
+        return await self._request(resource="channels", args=args)
+
+    async def get_playlists(
+        self,
+        *,
+        channel_id: str,
+        parts: Optional[Union[str, list, tuple, set]] = None,
+        count: Optional[int] = 5,
+        limit: Optional[int] = 5,
+        hl: Optional[str] = "en_US",
+        page_token: Optional[str] = None,
+        fields: Optional[str] = None,
+    ):
+        """
+        Retrieve channel playlists info. See `Api.get_playlists`.
+        """
+        if count is None:
+            limit = 50  # for playlists the max limit for per request is 50
+        else:
+            limit = min(count, limit)
+
+        args = {
+            "channelId": channel_id,
+            "part": enf_parts(resource="playlists", value=parts),
+            "hl": hl,
+            "maxResults": limit,
+        }
+        if page_token is not None:
+            args["pageToken"] = page_token
+
+        if fields is not None:
+            args["fields"] = fields
+
+        return await self.paged_by_page_token(resource="playlists", args=args, count=count)
+
+    async def get_playlist_items(
+        self,
+        *,
+        playlist_id: str,
+        parts: Optional[Union[str, list, tuple, set]] = None,
+        video_id: Optional[str] = None,
+        count: Optional[int] = 5,
+        limit: Optional[int] = 5,
+        page_token: Optional[str] = None,
+        fields: Optional[str] = None,
+    ):
+        """
+        Retrieve playlist Items info by given playlist id. See `Api.get_playlist_items`.
+        """
+        if count is None:
+            limit = 50  # for playlistItems the max limit for per request is 50
+        else:
+            limit = min(count, limit)
+
+        args = {
+            "playlistId": playlist_id,
+            "part": enf_parts(resource="playlistItems", value=parts),
+            "maxResults": limit,
+        }
+        if video_id is not None:
+            args["videoId"] = video_id
+        if page_token is not None:
+            args["pageToken"] = page_token
+
+        if fields is not None:
+            args["fields"] = fields
+
+        return await self.paged_by_page_token(resource="playlistItems", args=args, count=count)
+
+    def iter_playlist_items(
+        self,
+        *,
+        playlist_id: str,
+        parts: Optional[Union[str, list, tuple, set]] = None,
+        count: Optional[int] = None,
+        limit: Optional[int] = 50,
+        page_token: Optional[str] = None,
+        fields: Optional[str] = None,
+    ) -> AsyncIterator[dict]:
+        """
+        Stream playlist items page by page instead of collecting them all. See `Api.iter_playlist_items`.
+        """
+        args = Api._playlist_items_args(
+            playlist_id=playlist_id, parts=parts, video_id=None,
+            count=count, limit=limit, page_token=page_token,
+        )
+        if fields is not None:
+            args["fields"] = fields
+
+        return self.iter_pages_by_page_token(resource="playlistItems", args=args, count=count)
+
+    async def get_video_by_id(
+        self,
+        *,
+        video_id: Union[str, list, tuple, set],
+        parts: Optional[Union[str, list, tuple, set]] = None,
+        limit: Optional[int] = 10,
+        fields: Optional[str] = None,
+    ):
+        """
+        Retrieve video data by given video id. See `Api.get_video_by_id`.
+        """
+        args = {
+            "id": enf_comma_separated(field="video_id", value=video_id),
+            "part": enf_parts(resource="videos", value=parts),
+            "maxResults": limit,
+        }
+
+        if fields is not None:
+            args["fields"] = fields
+
+        return await self._request(resource="videos", args=args)
+
+    async def gather_playlist_items(
+        self,
+        *,
+        playlist_ids: Iterable[str],
+        parts: Optional[Union[str, list, tuple, set]] = None,
+        count: Optional[int] = None,
+        fields: Optional[str] = None,
+    ) -> List[dict]:
+        """
+        Page several playlists concurrently.
+
+        Returns:
+            One `get_playlist_items` response per playlist id, in the same order.
+        """
+        return await asyncio.gather(*[
+            self.get_playlist_items(playlist_id=playlist_id, parts=parts, count=count, limit=50, fields=fields)
+            for playlist_id in playlist_ids
+        ])
+
+    async def gather_videos_by_id(
+        self,
+        *,
+        video_ids: List[str],
+        parts: Optional[Union[str, list, tuple, set]] = None,
+        batch_size: int = 50,
+        fields: Optional[str] = None,
+    ) -> List[dict]:
+        """
+        Split video ids into batches of `batch_size` and fetch them concurrently.
+
+        Returns:
+            The video resources of every batch, flattened.
+        """
+        responses = await asyncio.gather(*[
+            self.get_video_by_id(video_id=video_ids[i:i + batch_size], parts=parts, limit=batch_size, fields=fields)
+            for i in range(0, len(video_ids), batch_size)
+        ])
+        return [item for response in responses for item in response.get("items", [])]
@@ -0,0 +1,162 @@
+"""
+    Conditional request cache for the Data API.
+
+    Every list response carries an etag. The cache keeps the etag and the body
+    of each GET, sends `If-None-Match` on the next identical request and serves
+    the stored body when the API answers `304 Not Modified`.
+"""
+
+import hashlib
+import json
+import os
+from typing import Optional
+
+from django.conf import settings
+from django.core.cache import caches
+from requests.models import Response
+
+
+class ResponseCache(object):
+    """
+    Base class of the response caches. Subclasses only store and load entries,
+    an entry being a dict of `etag` and `content` (the raw response body).
+    """
+
+    key_prefix = "utube:api:"
+
+    def __init__(self) -> None:
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+
+    def get(self, key: str) -> Optional[dict]:
+        raise NotImplementedError
+
+    def set(self, key: str, entry: dict) -> None:
+        raise NotImplementedError
+
+    @classmethod
+    def make_key(cls, resource: str, args: dict) -> str:
+        """
+        Build the cache key from the resource and its params, leaving out the api key
+        so the same entry is shared between keys.
+        """
+        params = sorted((k, str(v)) for k, v in args.items() if k != "key" and v is not None)
+        digest = hashlib.sha1(json.dumps([resource, params]).encode()).hexdigest()
+        return cls.key_prefix + digest
+
+    def request_headers(self, entry: Optional[dict]) -> dict:
+        if entry is None:
+            return {}
+        return {"If-None-Match": entry["etag"]}
+
+    def resolve(self, key: str, entry: Optional[dict], response: Response) -> Response:
+        """
+        Turn a 304 into the cached response, and remember fresh 200 responses.
+
+        Args:
+            key (str):
+                The key made by `make_key`.
+            entry (dict, optional):
+                The entry loaded before the request was sent.
+            response (Response):
+                The response the API returned.
+        Returns:
+            The response to parse.
+        """
+        if response.status_code == 304 and entry is not None:
+            self.hits += 1
+            self.bytes_saved += len(entry["content"])
+
+            cached = Response()
+            cached.status_code = 200
+            cached._content = entry["content"]
+            cached.encoding = "utf-8"
+            cached.headers = response.headers
+            cached.url = response.url
+            cached.request = response.request
+            return cached
+
+        self.misses += 1
+        etag = response.headers.get("ETag")
+        if response.status_code == 200 and etag:
+            self.set(key, {"etag": etag, "content": response.content})
+        return response
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 3) if total else 0.0,
+            "bytes_saved": self.bytes_saved,
+        }
+
+
+class RedisResponseCache(ResponseCache):
+    """
+    Keep the entries in a django cache, by default `CACHES['default']` which is Redis.
+    """
+
+    def __init__(self, alias: str = "default", timeout: Optional[int] = None) -> None:
+        super().__init__()
+        self.cache = caches[alias]
+        self.timeout = timeout
+
+    def get(self, key: str) -> Optional[dict]:
+        return self.cache.get(key)
+
+    def set(self, key: str, entry: dict) -> None:
+        self.cache.set(key, entry, timeout=self.timeout)
+
+
+class FileResponseCache(ResponseCache):
+    """
+    Keep the entries as json files in a local directory.
+    """
+
+    def __init__(self, directory: str) -> None:
+        super().__init__()
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[len(self.key_prefix):] + ".json")
+
+    def get(self, key: str) -> Optional[dict]:
+        try:
+            with open(self._path(key), encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return {"etag": entry["etag"], "content": entry["content"].encode("utf-8")}
+
+    def set(self, key: str, entry: dict) -> None:
+        path = self._path(key)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"etag": entry["etag"], "content": entry["content"].decode("utf-8")}, f)
+        os.replace(tmp_path, path)
+
+
+def get_response_cache(backend: Optional[str] = None) -> Optional[ResponseCache]:
+    """
+    Build the response cache configured by `settings.YOUTUBE_API_CACHE`.
+
+    Args:
+        backend (str, optional):
+            'redis', 'file' or 'none'. Default is the setting.
+    Returns:
+        The cache, or None when caching is disabled.
+    """
+    if backend is None:
+        backend = settings.YOUTUBE_API_CACHE
+
+    if backend == "redis":
+        return RedisResponseCache(timeout=settings.YOUTUBE_API_CACHE_TIMEOUT)
+    elif backend == "file":
+        return FileResponseCache(directory=settings.YOUTUBE_API_CACHE_DIR)
+    elif not backend or backend == "none":
+        return None
+    else:
+        raise Exception(f"Unknown response cache backend {backend}")
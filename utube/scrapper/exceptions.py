@@ -0,0 +1,45 @@
+"""
+    Exceptions raised by the Api.
+"""
+
+from typing import Optional
+
+
+class ApiError(Exception):
+    """
+    Base class of the errors raised by the Api.
+    A plain ApiError is a client error (bad parameter, not found, ...) and is not retried.
+    """
+
+    def __init__(self, message: str, status_code: Optional[int] = None, reason: Optional[str] = None) -> None:
+        super().__init__(message)
+        self.status_code = status_code
+        self.reason = reason
+
+
+class QuotaExceededError(ApiError):
+    """
+    The daily quota is used up, retrying before the quota reset is pointless.
+    """
+
+
+class TransientApiError(ApiError):
+    """
+    Server errors, rate limiting and connection failures, which are worth retrying.
+    """
+
+    def __init__(
+        self,
+        message: str,
+        status_code: Optional[int] = None,
+        reason: Optional[str] = None,
+        retry_after: Optional[float] = None,
+    ) -> None:
+        super().__init__(message, status_code=status_code, reason=reason)
+        self.retry_after = retry_after
+
+
+class CircuitOpenError(ApiError):
+    """
+    Too many recent requests failed, requests are refused until the cool down is over.
+    """
@@ -0,0 +1,132 @@
+"""
+    Pool of api keys, so scrapes can spend the quota of several projects.
+"""
+
+import hashlib
+import itertools
+import threading
+from typing import List, Optional
+
+from django.conf import settings
+from django.core.cache import caches
+
+from utube.scrapper.exceptions import QuotaExceededError
+from utube.scrapper.quota import QuotaLimiter
+
+
+class ApiKeyPool(object):
+    """
+    Example usage:
+
+        >>> pool = ApiKeyPool(["key-1", "key-2"], strategy=ApiKeyPool.LEAST_USED)
+        >>> api = Api(key_pool=pool)
+
+        Each request is charged to the key the strategy picks. A key whose budget is
+        spent, or which the API answered with a quota error, leaves the rotation until
+        the daily quota reset. The state is kept in the django cache so every worker
+        sees the same exhausted keys.
+    """
+
+    ROUND_ROBIN = "round_robin"
+    LEAST_USED = "least_used"
+
+    key_prefix = "utube:keys:exhausted:"
+
+    def __init__(
+        self,
+        keys: List[str],
+        strategy: str = ROUND_ROBIN,
+        daily_budget: Optional[int] = None,
+        alias: str = "default",
+    ) -> None:
+        """
+        Args:
+            keys (list of str):
+                The api keys, each one from a different google project.
+            strategy (str, optional):
+                ApiKeyPool.ROUND_ROBIN or ApiKeyPool.LEAST_USED.
+            daily_budget (int, optional):
+                Quota units per key and day. Default is settings.YOUTUBE_API_DAILY_QUOTA.
+            alias (str, optional):
+                The django cache holding the shared state.
+        """
+        if not keys:
+            raise Exception("ApiKeyPool needs at least one api key")
+        if strategy not in (self.ROUND_ROBIN, self.LEAST_USED):
+            raise Exception(f"Unknown key pool strategy {strategy}")
+
+        self.keys = list(keys)
+        self.strategy = strategy
+        self.cache = caches[alias]
+        self.limiters = {
+            key: QuotaLimiter(
+                daily_budget=daily_budget,
+                requests_per_second=0,  # pacing is done once per process by Api.limiter
+                alias=alias,
+                namespace="key:" + self.fingerprint(key),
+            )
+            for key in self.keys
+        }
+        self._cycle = itertools.cycle(self.keys)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def fingerprint(key: str) -> str:
+        # never store or print the key itself
+        return hashlib.sha1(key.encode()).hexdigest()[:10]
+
+    def is_exhausted(self, key: str) -> bool:
+        return bool(self.cache.get(self.key_prefix + self.fingerprint(key)))
+
+    def mark_exhausted(self, key: str) -> None:
+        self.cache.set(
+            self.key_prefix + self.fingerprint(key),
+            True,
+            timeout=QuotaLimiter.seconds_until_reset(),
+        )
+
+    def _candidates(self) -> List[str]:
+        if self.strategy == self.LEAST_USED:
+            return sorted(self.keys, key=lambda key: self.limiters[key].used())
+
+        with self._lock:
+            first = next(self._cycle)
+        start = self.keys.index(first)
+        return self.keys[start:] + self.keys[:start]
+
+    def acquire(self, resource: str) -> str:
+        """
+        Pick a key for one request on `resource` and charge its cost to that key.
+
+        Raises:
+            QuotaExceededError: if every key is exhausted.
+        """
+        for key in self._candidates():
+            if self.is_exhausted(key):
+                continue
+            try:
+                self.limiters[key].acquire(resource)
+            except QuotaExceededError:
+                self.mark_exhausted(key)
+                continue
+            return key
+
+        raise QuotaExceededError("Every api key of the pool is exhausted until the quota reset")
+
+    def remaining(self) -> int:
+        return sum(
+            self.limiters[key].remaining() for key in self.keys if not self.is_exhausted(key)
+        )
+
+    def usage(self) -> dict:
+        """
+        Quota spent today per key, keyed by the key fingerprint.
+        """
+        return {
+            self.fingerprint(key): dict(self.limiters[key].usage(), exhausted=self.is_exhausted(key))
+            for key in self.keys
+        }
+
+    @classmethod
+    def from_settings(cls) -> "ApiKeyPool":
+        return cls(keys=settings.YOUTUBE_API_KEYS, strategy=settings.YOUTUBE_API_KEY_STRATEGY)
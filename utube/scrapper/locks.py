@@ -0,0 +1,224 @@
+"""
+    Distributed locks keeping scrapes of the same channels from overlapping.
+
+    The locks live in a django cache (Redis by default) so every worker and
+    process sees them. A lock expires on its own, so a crashed holder cannot
+    block the scrapes forever; a live holder keeps it with a heartbeat.
+"""
+
+import logging
+import threading
+import time
+import uuid
+from typing import Optional
+
+from django.core.cache import caches
+
+logger = logging.getLogger(__name__)
+
+# compare-and-set scripts, so a holder whose lock expired never touches the next holder's lock
+EXTEND_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("pexpire", KEYS[1], ARGV[2])
+end
+return 0
+"""
+RELEASE_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+
+class DistributedLock(object):
+    """
+    Example usage:
+
+        >>> with DistributedLock("channel:UC_x5XG1OV2P6uZZ5FSM9Ttw", expire=600) as lock:
+        ...     if lock.acquired:
+        ...         scrape()
+
+        The lock is kept alive by a heartbeat thread while the block runs. Use
+        `acquire()` / `release()` directly to hand the lock to another process,
+        which rebuilds it from the name and `token`.
+
+        Acquisitions, waits, requeues and skips are counted per lock kind (the part
+        of the name before the first ":") and logged, to size the schedule.
+    """
+
+    key_prefix = "utube:lock:"
+
+    def __init__(
+        self,
+        name: str,
+        expire: float = 600,
+        heartbeat: Optional[float] = None,
+        token: Optional[str] = None,
+        alias: str = "default",
+    ) -> None:
+        """
+        Args:
+            name (str):
+                What the lock protects, e.g. "channel:<channel id>" or "scrape".
+            expire (float, optional):
+                Seconds after which the lock frees itself if it is not extended.
+            heartbeat (float, optional):
+                Seconds between two extensions while held in a with block.
+                Default is a third of `expire`.
+            token (str, optional):
+                The token of a lock acquired elsewhere, to extend or release it.
+            alias (str, optional):
+                The django cache holding the locks.
+        """
+        self.name = name
+        self.expire = expire
+        self.heartbeat = heartbeat or expire / 3
+        self.token = token or uuid.uuid4().hex
+        self.cache = caches[alias]
+        self.key = self.key_prefix + name
+        self.acquired = False
+        self._stop_heartbeat = threading.Event()
+        self._heartbeat_thread = None
+
+    @property
+    def kind(self) -> str:
+        return self.name.split(":", 1)[0]
+
+    def _redis(self):
+        # django-redis exposes the raw client, which gives atomic compare-and-set;
+        # other backends fall back to a get followed by a write
+        client = getattr(self.cache, "client", None)
+        if client is not None and hasattr(client, "get_client"):
+            return client.get_client(write=True)
+        return None
+
+    def _try_acquire(self) -> bool:
+        redis = self._redis()
+        if redis is not None:
+            return bool(redis.set(self.cache.make_key(self.key), self.token, nx=True, px=int(self.expire * 1000)))
+        return self.cache.add(self.key, self.token, timeout=self.expire)
+
+    def acquire(
+        self,
+        blocking: bool = False,
+        timeout: Optional[float] = None,
+        poll_interval: float = 1,
+        requeue: bool = False,
+    ) -> bool:
+        """
+        Take the lock.
+
+        Args:
+            blocking (bool, optional):
+                Wait for the lock instead of giving up at once.
+            timeout (float, optional):
+                With `blocking`, the most seconds to wait. Default is the lock expiry,
+                by then a crashed holder's lock is gone.
+            poll_interval (float, optional):
+                Seconds between two attempts while waiting.
+            requeue (bool, optional):
+                The caller tries again later if the lock is taken, so the miss is
+                counted as a requeue instead of a skip.
+        Returns:
+            Whether the lock was taken.
+        """
+        start = time.monotonic()
+        deadline = start + (self.expire if timeout is None else timeout)
+
+        self.acquired = self._try_acquire()
+        while not self.acquired and blocking and time.monotonic() < deadline:
+            time.sleep(min(poll_interval, max(deadline - time.monotonic(), 0)))
+            self.acquired = self._try_acquire()
+
+        waited = time.monotonic() - start
+        if self.acquired:
+            if waited >= poll_interval:
+                self._count("waits")
+                self._count("wait_seconds", int(waited))
+                logger.info(f"Lock {self.name} acquired after waiting {waited:.1f}s ({self.stats_line()})")
+            self._count("acquired")
+        elif requeue:
+            self._count("requeues")
+            logger.info(f"Lock {self.name} is held elsewhere, requeued ({self.stats_line()})")
+        else:
+            self._count("skips")
+            logger.info(f"Lock {self.name} is held elsewhere, skipped ({self.stats_line()})")
+        return self.acquired
+
+    def extend(self) -> bool:
+        """
+        Push the expiry back by `expire` seconds, if the lock is still ours.
+        """
+        redis = self._redis()
+        if redis is not None:
+            return bool(redis.eval(
+                EXTEND_SCRIPT, 1, self.cache.make_key(self.key), self.token, int(self.expire * 1000),
+            ))
+        if self.cache.get(self.key) != self.token:
+            return False
+        return self.cache.touch(self.key, timeout=self.expire)
+
+    def release(self) -> bool:
+        """
+        Free the lock, if it is still ours.
+        """
+        self._stop()
+        self.acquired = False
+        redis = self._redis()
+        if redis is not None:
+            return bool(redis.eval(RELEASE_SCRIPT, 1, self.cache.make_key(self.key), self.token))
+        if self.cache.get(self.key) != self.token:
+            return False
+        return self.cache.delete(self.key)
+
+    def start_heartbeat(self) -> None:
+        def beat():
+            while not self._stop_heartbeat.wait(self.heartbeat):
+                if not self.extend():
+                    logger.warning(f"Lock {self.name} expired while held, another scrape may overlap")
+                    return
+
+        self._stop_heartbeat.clear()
+        self._heartbeat_thread = threading.Thread(target=beat, name=f"lock-heartbeat-{self.name}", daemon=True)
+        self._heartbeat_thread.start()
+
+    def _stop(self) -> None:
+        if self._heartbeat_thread is not None:
+            self._stop_heartbeat.set()
+            self._heartbeat_thread.join()
+            self._heartbeat_thread = None
+
+    def __enter__(self) -> "DistributedLock":
+        # a lock taken with acquire(blocking=True) beforehand is kept as is
+        if not self.acquired:
+            self.acquire()
+        if self.acquired:
+            self.start_heartbeat()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        if self.acquired:
+            self.release()
+
+    def _stats_key(self, counter: str) -> str:
+        return self.key_prefix + "stats:" + self.kind + ":" + counter
+
+    def _count(self, counter: str, delta: int = 1) -> None:
+        key = self._stats_key(counter)
+        self.cache.add(key, 0, timeout=None)
+        self.cache.incr(key, delta)
+
+    def stats(self) -> dict:
+        """
+        Acquisitions, waits, seconds waited, requeues and skips of this kind of lock so far.
+        """
+        return {
+            counter: self.cache.get(self._stats_key(counter), 0)
+            for counter in ("acquired", "waits", "wait_seconds", "requeues", "skips")
+        }
+
+    def stats_line(self) -> str:
+        return (
+            "{kind} locks: {acquired} acquired, {waits} waits ({wait_seconds}s), {requeues} requeues, {skips} skips"
+        ).format(kind=self.kind, **self.stats())
@@ -0,0 +1,111 @@
+"""
+    Mapping of Data API payloads onto the models.
+
+    The mappings are the single place that says which payload keys the scraper
+    reads, so the `part` and `fields` request params are derived from them and
+    nothing else is downloaded.
+"""
+
+from typing import Iterable, Optional, Tuple
+
+CHANNEL_FIELD_MAPPING = {
+    "title": ("snippet", "title"),
+    "description": ("snippet", "description"),
+    "view_count": ("statistics", "viewCount"),
+    "comment_count": ("statistics", "commentCount"),
+    "subscriber_count": ("statistics", "subscriberCount"),
+    "video_count": ("statistics", "videoCount"),
+}
+
+VIDEO_FIELD_MAPPING = {
+    "title": ("snippet", "title"),
+    "description": ("snippet", "description"),
+    "published_at": ("snippet", "publishedAt"),
+    "view_count": ("statistics", "viewCount"),
+    "comment_count": ("statistics", "commentCount"),
+    "like_count": ("statistics", "likeCount"),
+    "dislike_count": ("statistics", "dislikeCount"),
+    "favorite_count": ("statistics", "favoriteCount"),
+}
+
+# the counters refreshed on their own by a stats-only scrape
+VIDEO_STATS_FIELD_MAPPING = {
+    field: path for field, path in VIDEO_FIELD_MAPPING.items() if path[0] == "statistics"
+}
+
+VIDEO_TAGS_PATH = ("snippet", "tags")
+
+CHANNEL_UPLOADS_PATH = ("contentDetails", "relatedPlaylists", "uploads")
+
+PLAYLIST_ID_PATH = ("id",)
+PLAYLIST_ITEM_VIDEO_ID_PATH = ("contentDetails", "videoId")
+PLAYLIST_ITEM_PUBLISHED_AT_PATH = ("contentDetails", "videoPublishedAt")
+
+
+def get_path(item: dict, path: Tuple[str, ...]):
+    value = item
+    for key in path:
+        if not isinstance(value, dict):
+            return None
+        value = value.get(key)
+    return value
+
+
+def map_item(item: dict, mapping: dict) -> dict:
+    """
+    Pick the model field values out of an API resource.
+    """
+    return {field: get_path(item, path) for field, path in mapping.items()}
+
+
+def parts_for(paths: Iterable[Tuple[str, ...]]) -> str:
+    """
+    The `part` param needed to get the given paths. `id` is always returned.
+    """
+    return ",".join(sorted({path[0] for path in paths if path[0] != "id"})) or "id"
+
+
+def fields_mask(paths: Iterable[Tuple[str, ...]], paging: bool = False) -> str:
+    """
+    Build a partial response `fields` mask returning only the given paths of each item.
+
+    Example:
+        >>> fields_mask([("id",), ("snippet", "title")], paging=True)
+        'items(id,snippet(title)),nextPageToken'
+    """
+    tree: dict = {}
+    for path in paths:
+        node = tree
+        for key in path:
+            node = node.setdefault(key, {})
+
+    def render(node: dict) -> str:
+        return ",".join(
+            key + ("(" + render(children) + ")" if children else "")
+            for key, children in node.items()
+        )
+
+    mask = "items(" + render(tree) + ")"
+    if paging:
+        mask += ",nextPageToken"
+    return mask
+
+
+def mapping_paths(mapping: dict, extra: Optional[Iterable[Tuple[str, ...]]] = None):
+    return [("id",)] + list(mapping.values()) + list(extra or [])
+
+
+CHANNEL_PARTS = parts_for(mapping_paths(CHANNEL_FIELD_MAPPING, [CHANNEL_UPLOADS_PATH]))
+CHANNEL_FIELDS = fields_mask(mapping_paths(CHANNEL_FIELD_MAPPING, [CHANNEL_UPLOADS_PATH]))
+
+VIDEO_PARTS = parts_for(mapping_paths(VIDEO_FIELD_MAPPING, [VIDEO_TAGS_PATH]))
+VIDEO_FIELDS = fields_mask(mapping_paths(VIDEO_FIELD_MAPPING, [VIDEO_TAGS_PATH]))
+
+VIDEO_STATS_PARTS = parts_for(mapping_paths(VIDEO_STATS_FIELD_MAPPING))
+VIDEO_STATS_FIELDS = fields_mask(mapping_paths(VIDEO_STATS_FIELD_MAPPING))
+
+PLAYLIST_PARTS = parts_for([PLAYLIST_ID_PATH])
+PLAYLIST_FIELDS = fields_mask([PLAYLIST_ID_PATH], paging=True)
+
+PLAYLIST_ITEM_PARTS = parts_for([PLAYLIST_ITEM_VIDEO_ID_PATH, PLAYLIST_ITEM_PUBLISHED_AT_PATH])
+PLAYLIST_ITEM_FIELDS = fields_mask([PLAYLIST_ITEM_VIDEO_ID_PATH, PLAYLIST_ITEM_PUBLISHED_AT_PATH], paging=True)
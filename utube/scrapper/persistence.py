@@ -0,0 +1,288 @@
+"""
+    Bulk persistence of scraped channels and videos.
+
+    A batch costs a constant number of queries: one to load the rows that
+    already exist, one bulk insert, one bulk update, all in one transaction.
+    Rows whose content hash did not change are left out of the update, so a
+    batch of unchanged data costs the load query only, and leaves the cached
+    responses of the videos API valid.
+"""
+
+import hashlib
+import json
+from collections import Counter
+from typing import Dict, Iterable, List, Optional
+
+from django.db import transaction
+from taggit.models import Tag
+
+from utube.api.cache import bump_generation
+from utube.models import Channel, TaggedVideo, Video
+from utube.search import get_search_backend
+from utube.scrapper.mappers import (
+    CHANNEL_FIELD_MAPPING,
+    VIDEO_FIELD_MAPPING,
+    VIDEO_STATS_FIELD_MAPPING,
+    VIDEO_TAGS_PATH,
+    get_path,
+    map_item,
+)
+
+
+def apply_values(instance, values: dict) -> None:
+    """
+    Copy the mapped payload values onto the instance, converted to the field types.
+    """
+    for field_name, value in values.items():
+        field = instance._meta.get_field(field_name)
+        setattr(instance, field_name, field.to_python(value))
+
+
+def content_hash(values: dict, tags: Optional[Iterable[str]] = None) -> str:
+    """
+    A compact digest of the mapped payload values and tags, equal for equal API data.
+    """
+    payload = dict(values)
+    if tags is not None:
+        payload["tags"] = sorted(tags)
+    return hashlib.blake2b(json.dumps(payload, sort_keys=True, default=str).encode(), digest_size=16).hexdigest()
+
+
+def save_channels(channel_items: Iterable[dict], stats: Optional[Counter] = None) -> Dict[str, Channel]:
+    """
+    Create or update the channels of a channels response.
+
+    Args:
+        channel_items (iterable of dict):
+            Channel resources.
+        stats (Counter, optional):
+            Counts the "created", "changed" and "unchanged" rows.
+    Returns:
+        The saved channels by channel_uid.
+    """
+    items = {item["id"]: item for item in channel_items if item.get("id")}
+    if not items:
+        return {}
+
+    with transaction.atomic():
+        existing = {
+            channel.channel_uid: channel
+            for channel in Channel.objects.filter(channel_uid__in=list(items))
+        }
+
+        to_create: List[Channel] = []
+        to_update: List[Channel] = []
+        for channel_uid, item in items.items():
+            values = map_item(item, CHANNEL_FIELD_MAPPING)
+            digest = content_hash(values)
+            channel = existing.get(channel_uid)
+            if channel is None:
+                channel = Channel(channel_uid=channel_uid)
+                to_create.append(channel)
+            elif channel.content_hash == digest:
+                continue
+            else:
+                to_update.append(channel)
+            apply_values(channel, values)
+            channel.content_hash = digest
+
+        # a row inserted by a concurrent scrape meanwhile is kept, the next scrape updates it
+        Channel.objects.bulk_create(to_create, ignore_conflicts=True)
+        if to_update:
+            Channel.objects.bulk_update(to_update, list(CHANNEL_FIELD_MAPPING) + ["content_hash"])
+        if to_create or to_update:
+            bump_generation()
+
+    if stats is not None:
+        stats.update(created=len(to_create), changed=len(to_update), unchanged=len(items) - len(to_create) - len(to_update))
+
+    if to_create:
+        # MySQL does not return the ids of bulk inserted rows
+        existing.update(
+            (channel.channel_uid, channel)
+            for channel in Channel.objects.filter(channel_uid__in=[c.channel_uid for c in to_create])
+        )
+    return existing
+
+
+def save_videos(
+    channel: Optional[Channel], video_items: Iterable[dict], stats: Optional[Counter] = None,
+) -> Dict[str, Video]:
+    """
+    Create or update one batch of videos of a videos response, with their tags and search terms.
+
+    Args:
+        channel (Channel, optional):
+            The channel the videos belong to.
+        video_items (iterable of dict):
+            Video resources.
+        stats (Counter, optional):
+            Counts the "created", "changed" and "unchanged" rows.
+    Returns:
+        The saved videos by video_uid.
+    """
+    items = {item["id"]: item for item in video_items if item.get("id")}
+    if not items:
+        return {}
+
+    channel_id = channel.pk if channel is not None else None
+    search_backend = get_search_backend()
+
+    with transaction.atomic():
+        existing = {
+            video.video_uid: video
+            for video in Video.objects.filter(video_uid__in=list(items))
+        }
+
+        to_create: List[Video] = []
+        to_update: List[Video] = []
+        for video_uid, item in items.items():
+            values = map_item(item, VIDEO_FIELD_MAPPING)
+            digest = content_hash(values, get_path(item, VIDEO_TAGS_PATH) or [])
+            video = existing.get(video_uid)
+            if video is None:
+                video = Video(video_uid=video_uid)
+                to_create.append(video)
+            elif video.content_hash == digest and video.channel_id == channel_id:
+                continue
+            else:
+                to_update.append(video)
+            video.channel = channel
+            apply_values(video, values)
+            video.content_hash = digest
+
+        # a row inserted by a concurrent scrape meanwhile is kept, the next scrape updates it
+        Video.objects.bulk_create(to_create, ignore_conflicts=True)
+        if to_update:
+            Video.objects.bulk_update(to_update, ["channel"] + list(VIDEO_FIELD_MAPPING) + ["content_hash"])
+        if to_create or to_update:
+            bump_generation()
+
+        videos = existing
+        written = list(to_update)
+        if to_create:
+            # MySQL does not return the ids of bulk inserted rows
+            created = list(Video.objects.filter(video_uid__in=[v.video_uid for v in to_create]))
+            videos.update((video.video_uid, video) for video in created)
+            written += created
+
+        # the tags are part of the hash, an unchanged video has unchanged tags
+        sync_video_tags({
+            video: get_path(items[video.video_uid], VIDEO_TAGS_PATH) or []
+            for video in written
+        })
+        if search_backend.indexes_writes:
+            search_backend.index_videos(written)
+
+    if stats is not None:
+        stats.update(created=len(to_create), changed=len(to_update), unchanged=len(items) - len(to_create) - len(to_update))
+    return videos
+
+
+def save_video_stats(video_items: Iterable[dict], stats: Optional[Counter] = None) -> int:
+    """
+    Update the counters of already saved videos from a statistics-only videos response.
+
+    Args:
+        video_items (iterable of dict):
+            Video resources with the statistics part.
+        stats (Counter, optional):
+            Counts the "changed" and "unchanged" rows.
+    Returns:
+        The number of rows written.
+    """
+    items = {item["id"]: item for item in video_items if item.get("id")}
+    if not items:
+        return 0
+
+    fields = list(VIDEO_STATS_FIELD_MAPPING)
+    with transaction.atomic():
+        videos = list(Video.objects.filter(video_uid__in=list(items)).only("id", "video_uid", *fields))
+
+        to_update: List[Video] = []
+        for video in videos:
+            before = [getattr(video, field) for field in fields]
+            apply_values(video, map_item(items[video.video_uid], VIDEO_STATS_FIELD_MAPPING))
+            if [getattr(video, field) for field in fields] == before:
+                continue
+            # the hash no longer matches the row, the next full scrape writes it again
+            video.content_hash = None
+            to_update.append(video)
+
+        if to_update:
+            Video.objects.bulk_update(to_update, fields + ["content_hash"])
+            bump_generation()
+
+    if stats is not None:
+        stats.update(changed=len(to_update), unchanged=len(videos) - len(to_update))
+    return len(to_update)
+
+
+def resolve_tags(names: Iterable[str]) -> Dict[str, Tag]:
+    """
+    Load the tags with the given names, creating the missing ones in bulk.
+
+    Returns:
+        The tags by name.
+    """
+    names = set(names)
+    if not names:
+        return {}
+
+    def load():
+        tags = list(Tag.objects.filter(name__in=names))
+        # MySQL compares names case-insensitively, so "Python" may come back as "python"
+        by_lower = {tag.name.lower(): tag for tag in tags}
+        found = {tag.name: tag for tag in tags}
+        for name in names - set(found):
+            if name.lower() in by_lower:
+                found[name] = by_lower[name.lower()]
+        return found
+
+    tags = load()
+    missing = names - set(tags)
+    if missing:
+        Tag.objects.bulk_create(
+            [Tag(name=name, slug=Tag().slugify(name)) for name in missing],
+            ignore_conflicts=True,
+        )
+        tags = load()
+
+        # a slug clash drops the row from the bulk insert, taggit's save() finds a free slug
+        for name in names - set(tags):
+            tags[name] = Tag.objects.create(name=name)
+
+    return tags
+
+
+def sync_video_tags(tag_names_by_video: Dict[Video, List[str]]) -> None:
+    """
+    Make the tags of a batch of saved videos match the given names.
+
+    Only the tagged item rows which changed are inserted or deleted.
+    """
+    if not tag_names_by_video:
+        return
+
+    tags = resolve_tags(name for names in tag_names_by_video.values() for name in names)
+
+    wanted = {
+        (video.pk, tags[name].pk)
+        for video, names in tag_names_by_video.items()
+        for name in names
+    }
+    current = {
+        (video_id, tag_id): tagged_video_id
+        for tagged_video_id, video_id, tag_id in TaggedVideo.objects.filter(
+            content_object_id__in=[video.pk for video in tag_names_by_video],
+        ).values_list("id", "content_object_id", "tag_id")
+    }
+
+    stale = [tagged_video_id for pair, tagged_video_id in current.items() if pair not in wanted]
+    if stale:
+        TaggedVideo.objects.filter(id__in=stale).delete()
+
+    TaggedVideo.objects.bulk_create([
+        TaggedVideo(content_object_id=video_id, tag_id=tag_id)
+        for video_id, tag_id in wanted - set(current)
+    ])
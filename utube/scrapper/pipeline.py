@@ -0,0 +1,202 @@
+"""
+    Producer-consumer pipeline overlapping the API fetches and the DB writes.
+
+    Every stage has its own worker threads and reads from a bounded queue, so a
+    slow stage makes the ones before it wait instead of piling items up in memory.
+"""
+
+import queue
+import threading
+import time
+from typing import Callable, List, Optional
+
+_STOP = object()
+
+
+class Ticket(object):
+    """
+    Tracks one item through the stages. `wait()` returns the result of the last
+    stage, or raises the exception of the stage that failed.
+    """
+
+    def __init__(self) -> None:
+        self._done = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+
+    def _finish(self, result=None, error: Optional[BaseException] = None) -> None:
+        self.result, self.error = result, error
+        self._done.set()
+
+    def succeeded(self) -> bool:
+        return self._done.is_set() and self.error is None
+
+    def wait(self, timeout: Optional[float] = None):
+        if not self._done.wait(timeout):
+            raise TimeoutError("Pipeline item not done in time")
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class Stage(object):
+    """
+    One step of the pipeline: `func` turns an item into the item of the next stage.
+    """
+
+    def __init__(self, name: str, func: Callable, workers: int = 1, queue_size: int = 8) -> None:
+        """
+        Args:
+            name (str):
+                Shown in the stats.
+            func (callable):
+                Called with every item, from `workers` threads at once.
+            workers (int, optional):
+                Threads running the stage.
+            queue_size (int, optional):
+                Items which may wait for the stage before putting blocks.
+        """
+        self.name = name
+        self.func = func
+        self.workers = workers
+        self.queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self.threads: List[threading.Thread] = []
+        self._lock = threading.Lock()
+        self.processed = 0
+        self.failed = 0
+        self.busy_seconds = 0.0
+        self.blocked_seconds = 0.0
+        self.max_depth = 0
+        self._depth_total = 0
+        self._puts = 0
+
+    def put(self, entry) -> None:
+        start = time.perf_counter()
+        self.queue.put(entry)
+        blocked = time.perf_counter() - start
+
+        depth = self.queue.qsize()
+        with self._lock:
+            # time spent waiting for room is the backpressure the stage puts on its producers
+            self.blocked_seconds += blocked
+            self.max_depth = max(self.max_depth, depth)
+            self._depth_total += depth
+            self._puts += 1
+
+    def record(self, seconds: float, failed: bool) -> None:
+        with self._lock:
+            self.busy_seconds += seconds
+            if failed:
+                self.failed += 1
+            else:
+                self.processed += 1
+
+    def stats(self, elapsed: float) -> dict:
+        return {
+            "stage": self.name,
+            "workers": self.workers,
+            "processed": self.processed,
+            "failed": self.failed,
+            "per_second": self.processed / elapsed if elapsed else 0.0,
+            "busy": self.busy_seconds / (elapsed * self.workers) if elapsed else 0.0,
+            "producers_blocked_seconds": self.blocked_seconds,
+            "max_queue_depth": self.max_depth,
+            "mean_queue_depth": self._depth_total / self._puts if self._puts else 0.0,
+        }
+
+
+class Pipeline(object):
+    """
+    Example usage:
+
+        >>> pipeline = Pipeline([
+        ...     Stage("fetch", fetch_videos, workers=4),
+        ...     Stage("persist", save_videos, workers=1),
+        ... ])
+        >>> pipeline.start()
+        >>> tickets = [pipeline.submit(video_ids) for video_ids in batches]
+        >>> saved = [ticket.wait() for ticket in tickets]
+        >>> pipeline.close()
+        >>> pipeline.stats()
+
+        `submit` blocks while the first stage's queue is full, which holds the
+        producers back. An item failing in a stage is dropped, its ticket raises.
+    """
+
+    def __init__(self, stages: List[Stage], thread_exit: Optional[Callable[[], None]] = None) -> None:
+        """
+        Args:
+            stages (list of Stage):
+                In order, each one feeding the next.
+            thread_exit (callable, optional):
+                Called by every worker thread before it ends, e.g. to close its DB connection.
+        """
+        self.stages = stages
+        self.thread_exit = thread_exit
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    def start(self) -> "Pipeline":
+        self.started_at = time.perf_counter()
+        for index, stage in enumerate(self.stages):
+            for number in range(stage.workers):
+                thread = threading.Thread(
+                    target=self._work, args=(index,), name=f"pipeline-{stage.name}-{number}", daemon=True,
+                )
+                thread.start()
+                stage.threads.append(thread)
+        return self
+
+    def submit(self, item) -> Ticket:
+        ticket = Ticket()
+        self.stages[0].put((item, ticket))
+        return ticket
+
+    def _work(self, index: int) -> None:
+        stage = self.stages[index]
+        next_stage = self.stages[index + 1] if index + 1 < len(self.stages) else None
+        try:
+            while True:
+                entry = stage.queue.get()
+                if entry is _STOP:
+                    return
+
+                item, ticket = entry
+                start = time.perf_counter()
+                try:
+                    result = stage.func(item)
+                except Exception as e:
+                    stage.record(time.perf_counter() - start, failed=True)
+                    ticket._finish(error=e)
+                    continue
+                stage.record(time.perf_counter() - start, failed=False)
+
+                if next_stage is None:
+                    ticket._finish(result=result)
+                else:
+                    next_stage.put((result, ticket))
+        finally:
+            if self.thread_exit is not None:
+                self.thread_exit()
+
+    def close(self) -> None:
+        """
+        Let every submitted item go through, then stop the workers stage by stage.
+        """
+        for stage in self.stages:
+            for _ in stage.threads:
+                stage.queue.put(_STOP)
+            for thread in stage.threads:
+                thread.join()
+        self.finished_at = time.perf_counter()
+
+    def stats(self) -> List[dict]:
+        end = self.finished_at or time.perf_counter()
+        elapsed = end - self.started_at if self.started_at is not None else 0.0
+        return [stage.stats(elapsed) for stage in self.stages]
+
+    def __enter__(self) -> "Pipeline":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
@@ -0,0 +1,204 @@
+"""
+    Profiling of scrapes: where the wall time goes, per stage, HTTP resource and model.
+
+    Meant to run in production: everything is counted in memory and written
+    out as one JSON report at the end, cProfile only runs when asked for.
+"""
+
+import cProfile
+import json
+import pstats
+import re
+import sys
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Optional
+
+from django.apps import apps
+from django.db import connections
+from django.db.backends.signals import connection_created
+from requests.models import Response
+
+from utube.utilz.constants import RESOURCE_QUOTA_COSTS
+
+SQL_TABLE_PATTERN = re.compile(r'\b(?:FROM|INTO|UPDATE)\s+[`"]?(\w+)', re.IGNORECASE)
+
+
+class ScrapeProfiler(object):
+    """
+    Example usage:
+
+        >>> profiler = ScrapeProfiler(cprofile=True)
+        >>> with profiler:
+        ...     api = Api(api_key="your api key", request_hook=profiler.record_request)
+        ...     with profiler.stage("paging"):
+        ...         api.get_playlist_items(playlist_id="PL...")
+        >>> profiler.write_report("profile.json")
+        >>> profiler.dump_cprofile("profile.prof")
+
+        SQL queries are counted on every thread's connection while the profiler
+        runs, the HTTP requests of every Api given `record_request` as hook.
+        The .prof dump reads with pstats, snakeviz, or flameprof / gprof2dot
+        for a flame graph.
+    """
+
+    def __init__(self, cprofile: bool = False) -> None:
+        """
+        Args:
+            cprofile (bool, optional):
+                Also run cProfile, on every thread started while profiling.
+        """
+        self.cprofile = cprofile
+        self._lock = threading.Lock()
+        self.stages = defaultdict(lambda: {"calls": 0, "seconds": 0.0})
+        self.http = defaultdict(lambda: {
+            "requests": 0, "seconds": 0.0, "max_seconds": 0.0, "bytes": 0,
+            "not_modified": 0, "errors": 0, "quota_units": 0,
+        })
+        self.sql = defaultdict(lambda: {"queries": 0, "seconds": 0.0})
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._profiles = []
+        self._tables = {}
+
+    def start(self) -> "ScrapeProfiler":
+        self._tables = {model._meta.db_table: model._meta.label for model in apps.get_models()}
+        for connection in connections.all():
+            self._watch_connection(connection)
+        # threads open their own connections, they are watched as they open
+        connection_created.connect(self._on_connection_created)
+
+        if self.cprofile:
+            self._start_cprofile()
+            threading.setprofile(self._start_thread_cprofile)
+
+        self.started_at = time.perf_counter()
+        return self
+
+    def stop(self) -> None:
+        self.finished_at = time.perf_counter()
+        connection_created.disconnect(self._on_connection_created)
+        for connection in connections.all():
+            if self._execute_wrapper in connection.execute_wrappers:
+                connection.execute_wrappers.remove(self._execute_wrapper)
+
+        if self.cprofile:
+            threading.setprofile(None)
+            self._profiles[0].disable()
+
+    def __enter__(self) -> "ScrapeProfiler":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    @contextmanager
+    def stage(self, name: str):
+        """
+        Count the wall time of the block towards the stage. Blocks running in
+        several threads at once add up, so a stage can take longer than the run.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            with self._lock:
+                self.stages[name]["calls"] += 1
+                self.stages[name]["seconds"] += seconds
+
+    def record_request(self, resource: str, seconds: float, response: Optional[Response]) -> None:
+        """
+        The `request_hook` of Api.
+        """
+        with self._lock:
+            http = self.http[resource]
+            http["requests"] += 1
+            http["seconds"] += seconds
+            http["max_seconds"] = max(http["max_seconds"], seconds)
+            # every request sent is charged, a 304 and an error too
+            http["quota_units"] += RESOURCE_QUOTA_COSTS.get(resource, 1)
+            if response is None or response.status_code >= 400:
+                http["errors"] += 1
+            if response is not None:
+                http["bytes"] += len(response.content or b"")
+                if response.status_code == 304:
+                    http["not_modified"] += 1
+
+    def _on_connection_created(self, sender, connection, **kwargs) -> None:
+        self._watch_connection(connection)
+
+    def _watch_connection(self, connection) -> None:
+        if self._execute_wrapper not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self._execute_wrapper)
+
+    def _execute_wrapper(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            seconds = time.perf_counter() - start
+            match = SQL_TABLE_PATTERN.search(sql)
+            table = match.group(1) if match else None
+            # savepoints and transactions have no table
+            model = self._tables.get(table, table or "(no table)")
+            with self._lock:
+                self.sql[model]["queries"] += 1
+                self.sql[model]["seconds"] += seconds
+
+    def _start_cprofile(self) -> None:
+        profile = cProfile.Profile()
+        with self._lock:
+            self._profiles.append(profile)
+        profile.enable()
+
+    def _start_thread_cprofile(self, frame, event, arg):
+        # runs once as the first profile event of every new thread, then hands over to cProfile
+        sys.setprofile(None)
+        self._start_cprofile()
+
+    def report(self) -> dict:
+        end = self.finished_at or time.perf_counter()
+
+        def rounded(values: dict) -> dict:
+            return {key: round(value, 6) if isinstance(value, float) else value for key, value in values.items()}
+
+        http = {}
+        for resource, values in sorted(self.http.items()):
+            values = dict(values)
+            values["mean_seconds"] = values["seconds"] / values["requests"] if values["requests"] else 0.0
+            http[resource] = rounded(values)
+
+        return {
+            "wall_seconds": round(end - self.started_at, 6) if self.started_at is not None else 0.0,
+            "stages": {name: rounded(values) for name, values in sorted(self.stages.items())},
+            "http": http,
+            "http_total": {
+                "requests": sum(values["requests"] for values in self.http.values()),
+                "seconds": round(sum(values["seconds"] for values in self.http.values()), 6),
+                "bytes": sum(values["bytes"] for values in self.http.values()),
+            },
+            "sql": {model: rounded(values) for model, values in sorted(self.sql.items())},
+            "sql_total": {
+                "queries": sum(values["queries"] for values in self.sql.values()),
+                "seconds": round(sum(values["seconds"] for values in self.sql.values()), 6),
+            },
+            "quota_units": sum(values["quota_units"] for values in self.http.values()),
+        }
+
+    def write_report(self, path: str) -> None:
+        with open(path, "w") as f:
+            json.dump(self.report(), f, indent=2)
+
+    def dump_cprofile(self, path: str) -> None:
+        """
+        Write the cProfile stats of all the profiled threads, merged, in pstats format.
+        """
+        if not self._profiles:
+            raise Exception("The profiler ran without cprofile=True")
+        stats = pstats.Stats(self._profiles[0])
+        for profile in self._profiles[1:]:
+            stats.add(profile)
+        stats.dump_stats(path)
@@ -0,0 +1,172 @@
+"""
+    Quota accounting and request pacing for the Data API.
+
+    The counters live in a django cache (Redis by default), so every thread and
+    process that talks to the API with the same project shares one budget.
+"""
+
+import math
+import time
+from datetime import datetime, timedelta
+from typing import Iterable, Optional
+
+import pytz
+from django.conf import settings
+from django.core.cache import caches
+
+from utube.scrapper.exceptions import QuotaExceededError
+from utube.utilz.constants import QUOTA_RESET_TIMEZONE, RESOURCE_QUOTA_COSTS
+
+
+class QuotaLimiter(object):
+    """
+    Example usage:
+
+        >>> limiter = QuotaLimiter(daily_budget=10000, requests_per_second=10)
+        >>> api = Api(api_key="your api key", limiter=limiter)
+
+        Every request first calls `limiter.acquire(resource)`, which charges the
+        resource's unit cost to today's budget and waits for a free slot of the
+        current second. `QuotaExceededError` is raised once the budget is spent.
+    """
+
+    key_prefix = "utube:quota:"
+
+    def __init__(
+        self,
+        daily_budget: Optional[int] = None,
+        requests_per_second: Optional[float] = None,
+        alias: str = "default",
+        namespace: str = "",
+    ) -> None:
+        """
+        Args:
+            daily_budget (int, optional):
+                Quota units which may be spent per day. Default is settings.YOUTUBE_API_DAILY_QUOTA.
+            requests_per_second (float, optional):
+                Requests allowed per second across all workers.
+                Default is settings.YOUTUBE_API_REQUESTS_PER_SECOND.
+            alias (str, optional):
+                The django cache holding the shared counters.
+            namespace (str, optional):
+                Keeps separate counters per project, e.g. one per api key.
+        """
+        if daily_budget is None:
+            daily_budget = settings.YOUTUBE_API_DAILY_QUOTA
+        if requests_per_second is None:
+            requests_per_second = settings.YOUTUBE_API_REQUESTS_PER_SECOND
+
+        self.daily_budget = daily_budget
+        self.requests_per_second = requests_per_second
+        self.cache = caches[alias]
+        self.namespace = namespace
+
+    @staticmethod
+    def quota_day() -> str:
+        return datetime.now(pytz.timezone(QUOTA_RESET_TIMEZONE)).strftime("%Y-%m-%d")
+
+    @staticmethod
+    def seconds_until_reset() -> int:
+        tz = pytz.timezone(QUOTA_RESET_TIMEZONE)
+        now = datetime.now(tz)
+        reset = tz.localize(datetime.combine(now.date() + timedelta(days=1), datetime.min.time()))
+        return max(int((reset - now).total_seconds()), 1)
+
+    def _key(self, *parts) -> str:
+        return self.key_prefix + ":".join((self.namespace,) + parts)
+
+    def _incr(self, key: str, delta: int, timeout: int) -> int:
+        self.cache.add(key, 0, timeout=timeout)
+        return self.cache.incr(key, delta)
+
+    def used(self) -> int:
+        return self.cache.get(self._key(self.quota_day()), 0)
+
+    def remaining(self) -> int:
+        return max(self.daily_budget - self.used(), 0)
+
+    def usage(self) -> dict:
+        """
+        Units spent today, in total and per resource.
+        """
+        day = self.quota_day()
+        usage = {"total": self.used(), "budget": self.daily_budget}
+        for resource in RESOURCE_QUOTA_COSTS:
+            usage[resource] = self.cache.get(self._key(day, resource), 0)
+        return usage
+
+    def acquire(self, resource: str) -> None:
+        """
+        Charge one request on `resource` and block until it may be sent.
+
+        Raises:
+            QuotaExceededError: if the request does not fit in today's budget.
+        """
+        cost = RESOURCE_QUOTA_COSTS.get(resource, 1)
+        day = self.quota_day()
+        day_key = self._key(day)
+
+        used = self._incr(day_key, cost, timeout=2 * 24 * 60 * 60)
+        if used > self.daily_budget:
+            self.cache.decr(day_key, cost)
+            raise QuotaExceededError(
+                f"Daily quota budget of {self.daily_budget} units is spent, {resource} request refused"
+            )
+        self._incr(self._key(day, resource), cost, timeout=2 * 24 * 60 * 60)
+
+        self._wait_for_slot()
+
+    def _wait_for_slot(self) -> None:
+        # Each second is a window of `requests_per_second` slots shared by every worker;
+        # when the window is full, wait for the next one. Below one request per
+        # second a window lasts 1 / requests_per_second seconds and holds one slot.
+        if not self.requests_per_second:
+            return
+
+        window_seconds = max(1.0, 1 / self.requests_per_second)
+        slots = max(1, math.floor(self.requests_per_second))
+        while True:
+            now = time.time()
+            window = int(now // window_seconds)
+            taken = self._incr(
+                self._key("rate", str(window_seconds), str(window)), 1, timeout=math.ceil(window_seconds) + 10,
+            )
+            if taken <= slots:
+                return
+            time.sleep((window + 1) * window_seconds - now)
+
+    @staticmethod
+    def estimate_scrape_cost(
+        channel_items: Iterable[dict], playlists_per_channel: int = 1, list_playlists: bool = True,
+    ) -> int:
+        """
+        Estimate the units a scrape of the given channels will spend, without spending them.
+
+        Args:
+            channel_items (iterable of dict):
+                Channel resources with `statistics.videoCount`.
+            playlists_per_channel (int, optional):
+                How many playlists are paged per channel.
+            list_playlists (bool, optional):
+                False when only the uploads playlist is paged, so the playlists are never listed.
+        Returns:
+            Estimated quota units.
+        """
+        page_size = 50
+        units = 0
+        for channel_item in channel_items:
+            video_count = int((channel_item.get("statistics") or {}).get("videoCount") or 0)
+            video_pages = math.ceil(video_count / page_size)
+
+            if list_playlists:
+                units += RESOURCE_QUOTA_COSTS["playlists"] * max(math.ceil(playlists_per_channel / page_size), 1)
+            units += RESOURCE_QUOTA_COSTS["playlistItems"] * max(video_pages, playlists_per_channel)
+            units += RESOURCE_QUOTA_COSTS["videos"] * video_pages
+        return units
+
+    @staticmethod
+    def estimate_stats_refresh_cost(video_count: int) -> int:
+        """
+        Estimate the units a stats-only refresh of `video_count` saved videos will spend.
+        """
+        return RESOURCE_QUOTA_COSTS["videos"] * math.ceil(video_count / 50)
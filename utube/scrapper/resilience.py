@@ -0,0 +1,136 @@
+"""
+    Retry and circuit breaker policies for the Api request path.
+"""
+
+import random
+import threading
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from typing import Optional
+
+from utube.scrapper.exceptions import CircuitOpenError
+
+
+class RetryPolicy(object):
+    """
+    Exponential backoff with full jitter.
+
+    Attempt n (starting at 0) waits a random time between 0 and
+    min(backoff_max, backoff_base * 2 ** n) seconds, unless the API told us
+    how long to wait with a `Retry-After` header.
+    """
+
+    def __init__(
+        self,
+        max_retries: int = 5,
+        backoff_base: float = 1.0,
+        backoff_max: float = 60.0,
+        jitter: bool = True,
+    ) -> None:
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.jitter = jitter
+
+    def delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        if retry_after is not None:
+            return min(retry_after, self.backoff_max)
+
+        delay = min(self.backoff_max, self.backoff_base * 2 ** attempt)
+        if self.jitter:
+            delay = random.uniform(0, delay)
+        return delay
+
+    @staticmethod
+    def parse_retry_after(value: Optional[str]) -> Optional[float]:
+        """
+        Parse a `Retry-After` header, given either in seconds or as an HTTP date.
+        """
+        if not value:
+            return None
+        try:
+            return max(float(value), 0.0)
+        except ValueError:
+            pass
+        try:
+            retry_at = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        return max((retry_at - datetime.now(timezone.utc)).total_seconds(), 0.0)
+
+
+class CircuitBreaker(object):
+    """
+    Stop calling the API while its error rate is too high.
+
+    The outcomes of the last `window` requests are kept. Once at least
+    `min_requests` were made and the share of failures reaches `failure_rate`,
+    the circuit opens and requests fail fast with CircuitOpenError for
+    `cool_down` seconds. After that a single trial request is let through
+    (half open) while the other callers still fail fast: success closes the
+    circuit, failure opens it again. A trial which never reports back is
+    replaced by a new one after another `cool_down`.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        failure_rate: float = 0.5,
+        window: int = 20,
+        min_requests: int = 10,
+        cool_down: float = 30.0,
+    ) -> None:
+        self.failure_rate = failure_rate
+        self.min_requests = min_requests
+        self.cool_down = cool_down
+        self.state = self.CLOSED
+        self._outcomes = deque(maxlen=window)
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._trial_started_at = 0.0
+        self._lock = threading.Lock()
+
+    def before_request(self) -> None:
+        with self._lock:
+            now = time.monotonic()
+            if self.state == self.OPEN:
+                if now - self._opened_at < self.cool_down:
+                    raise CircuitOpenError("Circuit breaker is open, the API error rate is too high")
+                self.state = self.HALF_OPEN
+            elif self.state != self.HALF_OPEN:
+                return
+
+            # threads sharing the breaker must not all hit the failing API at the end of the cool down
+            if self._trial_in_flight and now - self._trial_started_at < self.cool_down:
+                raise CircuitOpenError("Circuit breaker is half open, waiting for the trial request")
+            self._trial_in_flight = True
+            self._trial_started_at = now
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._outcomes.append(True)
+            if self.state == self.HALF_OPEN:
+                self.state = self.CLOSED
+                self._trial_in_flight = False
+                self._outcomes.clear()
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._outcomes.append(False)
+            if self.state == self.HALF_OPEN:
+                self._open()
+                return
+
+            failures = self._outcomes.count(False)
+            if len(self._outcomes) >= self.min_requests and failures / len(self._outcomes) >= self.failure_rate:
+                self._open()
+
+    def _open(self) -> None:
+        self.state = self.OPEN
+        self._trial_in_flight = False
+        self._opened_at = time.monotonic()
@@ -0,0 +1,152 @@
+"""
+    Full-text search of the videos, behind the `search` param of the videos API.
+
+    On MySQL the FULLTEXT index of the title and description answers the
+    searches. Other databases fall back to an inverted index of the same
+    columns, kept up to date by the scraper as it writes the videos.
+"""
+
+import re
+from collections import Counter
+from typing import Iterable, List, Optional
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Count, OuterRef, QuerySet, Subquery, Sum
+from django.db.models.expressions import RawSQL
+
+from utube.models import Video, VideoSearchTerm
+
+TERM_PATTERN = re.compile(r"\w+")
+MIN_TERM_LENGTH = 2
+MAX_TERM_LENGTH = 64
+# a word of the title counts as much as this many words of the description
+TITLE_WEIGHT = 3
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    """
+    The lowercase words of the text, as they are indexed and searched.
+    """
+    return [
+        term for term in TERM_PATTERN.findall((text or "").lower())
+        if MIN_TERM_LENGTH <= len(term) <= MAX_TERM_LENGTH
+    ]
+
+
+class SearchBackend(object):
+    """
+    Base class of the search backends.
+    """
+
+    # whether `index_videos` has to be called on every write of the videos
+    indexes_writes = False
+
+    def search(self, queryset: QuerySet, query: str) -> QuerySet:
+        """
+        Keep the videos of the queryset matching every word of the query, most relevant first.
+        """
+        raise NotImplementedError
+
+    def index_videos(self, videos: Iterable[Video]) -> None:
+        pass
+
+
+class MysqlFulltextSearch(SearchBackend):
+    """
+    MATCH ... AGAINST on the FULLTEXT index of the title and description, which
+    MySQL maintains itself.
+    """
+
+    match_sql = "MATCH (utube_video.title, utube_video.description) AGAINST (%s IN BOOLEAN MODE)"
+
+    def search(self, queryset: QuerySet, query: str) -> QuerySet:
+        terms = tokenize(query)
+        if not terms:
+            return queryset.none()
+        # every word is required; the words are \w+ so they carry no boolean operator
+        against = " ".join("+" + term for term in terms)
+        return (
+            queryset
+            .annotate(relevance=RawSQL(self.match_sql, [against]))
+            .filter(relevance__gt=0)
+            .order_by("-relevance", "-pk")
+        )
+
+
+class InvertedIndexSearch(SearchBackend):
+    """
+    One VideoSearchTerm row per distinct word of a video, weighted by how often
+    it appears, title words counting more.
+    """
+
+    indexes_writes = True
+
+    def search(self, queryset: QuerySet, query: str) -> QuerySet:
+        terms = sorted(set(tokenize(query)))
+        if not terms:
+            return queryset.none()
+
+        matches = VideoSearchTerm.objects.filter(term__in=terms)
+        # the ids come from the term index, the scores are only computed for them
+        matching_ids = (
+            matches.values("video_id")
+            .annotate(hits=Count("pk"))
+            .filter(hits=len(terms))
+            .values("video_id")
+        )
+        relevance = (
+            matches.filter(video=OuterRef("pk"))
+            .values("video_id")
+            .annotate(score=Sum("weight"))
+            .values("score")
+        )
+        return (
+            queryset
+            .filter(pk__in=matching_ids)
+            .annotate(relevance=Subquery(relevance))
+            .order_by("-relevance", "-pk")
+        )
+
+    def index_videos(self, videos: Iterable[Video]) -> None:
+        """
+        Replace the terms of the videos with the terms of their current title and description.
+        """
+        videos = list(videos)
+        if not videos:
+            return
+
+        rows = []
+        for video in videos:
+            weights = Counter(tokenize(video.description))
+            for term in tokenize(video.title):
+                weights[term] += TITLE_WEIGHT
+            rows += [VideoSearchTerm(term=term, video_id=video.pk, weight=weight) for term, weight in weights.items()]
+
+        VideoSearchTerm.objects.filter(video__in=[video.pk for video in videos]).delete()
+        VideoSearchTerm.objects.bulk_create(rows, batch_size=1000)
+
+
+def get_search_backend(backend: Optional[str] = None) -> SearchBackend:
+    """
+    Build the search backend configured by `settings.YOUTUBE_SEARCH_BACKEND`.
+
+    Args:
+        backend (str, optional):
+            'mysql', 'index' or 'auto', which picks 'mysql' on MySQL and 'index'
+            elsewhere. Default is the setting.
+    Returns:
+        The search backend.
+    """
+    if backend is None:
+        backend = settings.YOUTUBE_SEARCH_BACKEND
+
+    if backend == "auto":
+        backend = "mysql" if connection.vendor == "mysql" else "index"
+
+    if backend == "mysql":
+        return MysqlFulltextSearch()
+    elif backend == "index":
+        return InvertedIndexSearch()
+    else:
+        raise Exception(f"Unknown search backend {backend}")
@@ -1,6 +1,15 @@
-from celery import shared_task
+import math
+import time
+
+from celery import chord, group, shared_task
 from celery.utils.log import get_task_logger
-from django.core.management import call_command
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from utube.models import Channel, RegisteredChannel
+from utube.scrapper.api import Api
 from .management.commands import channel_scrapper
 
 logger = get_task_logger(__name__)
@@ -11,7 +20,225 @@ def sample_task():
     logger.info("The sample task just ran.")
 
 
+@shared_task(bind=True)
+def utube_channel_scrapper_task(self, incremental=True, mode=channel_scrapper.MODE_UPLOADS):
+    """
+    Start a scrape of the registered channels.
+
+    The channels are fetched 50 ids per call here, then each one is scraped by
+    its own scrape_channel_task, so the scrape spreads over every worker.
+
+    With the global lock scope the whole run holds one lock, released by the
+    last channel to finish, so a beat firing before then does not overlap it.
+    """
+    # frequent runs only pick up new uploads, full rescans happen every YOUTUBE_FULL_RESCAN_HOURS
+    channel_ids = list(
+        RegisteredChannel.objects.filter(is_active=True).order_by('id').values_list('channel_uid', flat=True)
+    )
+    if not channel_ids:
+        logger.warning('No registered channels to scrape')
+        return 0
+
+    lock = None
+    if settings.YOUTUBE_SCRAPE_LOCK_SCOPE == channel_scrapper.LOCK_SCOPE_GLOBAL:
+        lock = take_scrape_lock(self, channel_scrapper.GLOBAL_LOCK_NAME)
+        if lock is None:
+            return 0
+
+    try:
+        command = channel_scrapper.Command()
+        channel_items = command.fetch_channel_items(Api(**command.api_components()), channel_ids)
+    except Exception:
+        if lock is not None:
+            lock.release()
+        raise
+
+    if lock is not None:
+        if not channel_items:
+            lock.release()
+            return 0
+        cache.set(pending_key(lock.name), len(channel_items), timeout=settings.YOUTUBE_SCRAPE_LOCK_EXPIRE)
+
+    lock_info = [lock.name, lock.token] if lock is not None else None
+    group(
+        scrape_channel_task.s(channel_item, incremental, mode, lock_info) for channel_item in channel_items
+    ).apply_async()
+    return len(channel_items)
+
+
+@shared_task(bind=True)
+def scrape_channel_task(self, channel_item, incremental=True, mode=channel_scrapper.MODE_UPLOADS, lock_info=None):
+    """
+    Page the playlist items of one channel and fan the video ids out to
+    fetch_videos_task, 50 per task. finish_channel_task runs once they all
+    succeeded.
+
+    lock_info is the [name, token] of the run's global lock. Without it, the
+    channel is locked here until finish_channel_task.
+    """
+    started_at = time.time()
+    command = channel_scrapper.Command()
+
+    if lock_info is None and settings.YOUTUBE_SCRAPE_LOCK_SCOPE == channel_scrapper.LOCK_SCOPE_CHANNEL:
+        lock = take_scrape_lock(self, f"channel:{channel_item['id']}")
+        if lock is None:
+            return 0
+        lock_info = [lock.name, lock.token]
+
+    try:
+        channel_instance = command.save_channel(channel_item)
+        if channel_instance is None:
+            release_scrape_lock(lock_info)
+            return 0
+
+        # only the uploads playlist is ordered newest first, so only it can stop early
+        incremental = incremental and mode == channel_scrapper.MODE_UPLOADS
+        full_scan = not incremental or command.needs_full_scan(channel_instance, settings.YOUTUBE_FULL_RESCAN_HOURS)
+
+        api = Api(**command.api_components())
+        batches = []
+
+        def save_batch(video_ids):
+            batches.append(list(video_ids))
+            # paging a big channel can outlast the lock expiry
+            extend_scrape_lock(lock_info)
+
+        newest = command.scrape_channel(
+            api,
+            channel_instance,
+            command.iter_channel_playlist_ids(api, channel_item, mode),
+            # the batches are fetched in other tasks, duplicates across channels are just saved twice
+            set(),
+            known_until=None if full_scan else channel_instance,
+            save_batch=save_batch,
+        )
+    except Exception as e:
+        record_scrape(channel_item['id'], started_at, f'{type(e).__name__}: {e}')
+        release_scrape_lock(lock_info)
+        raise
+
+    callback = finish_channel_task.s(
+        channel_instance.pk,
+        newest[0].isoformat() if newest else None,
+        newest[1] if newest else None,
+        full_scan,
+        mode == channel_scrapper.MODE_UPLOADS,
+        started_at,
+        lock_info,
+    )
+    # a failed batch means the callback never runs, the errback records it and frees the lock
+    callback.on_error(fail_channel_task.s(channel_item['id'], started_at, lock_info))
+    if batches:
+        chord(fetch_videos_task.s(channel_instance.pk, video_ids, lock_info) for video_ids in batches)(callback)
+    else:
+        callback.delay([])
+
+    return len(batches)
+
+
 @shared_task
-def utube_channel_scrapper_task():
-    call_command('channel_scrapper', )
+def fetch_videos_task(channel_pk, video_ids, lock_info=None):
+    """
+    Fetch one batch of at most 50 videos and save them.
+    """
+    # every batch is a heartbeat of the channel's lock, the last one hands it to the callback
+    extend_scrape_lock(lock_info)
+
+    command = channel_scrapper.Command()
+    video_items = command.fetch_video_items(Api(**command.api_components()), video_ids)
+    command.save_video_items(Channel.objects.get(pk=channel_pk), video_items)
+    return len(video_items)
+
+
+@shared_task
+def finish_channel_task(saved_counts, channel_pk, newest_published_at, newest_video_uid, full_scan, update_mark,
+                        started_at, lock_info=None):
+    """
+    Chord callback of a channel: only runs once every video batch was saved,
+    so the high-water mark never moves past videos which were not.
+    """
+    try:
+        channel_instance = Channel.objects.get(pk=channel_pk)
+        if update_mark:
+            newest = (parse_datetime(newest_published_at), newest_video_uid) if newest_published_at else None
+            channel_scrapper.Command.update_high_water_mark(channel_instance, newest, full_scan)
+
+        seconds = record_scrape(channel_instance.channel_uid, started_at, None)
+    finally:
+        release_scrape_lock(lock_info)
+
+    logger.info(f'{channel_instance.channel_uid}: {sum(saved_counts)} videos saved in {seconds:.1f}s')
+    return sum(saved_counts)
+
+
+@shared_task
+def fail_channel_task(request, exc, traceback, channel_uid, started_at, lock_info=None):
+    """
+    Errback of finish_channel_task: records the failed scrape of the channel and
+    releases its lock, which finish_channel_task would have done.
+    """
+    try:
+        record_scrape(channel_uid, started_at, f'{type(exc).__name__}: {exc}')
+    finally:
+        release_scrape_lock(lock_info)
+    logger.error(f'{channel_uid}: video batch failed, {exc!r}')
+
+
+def record_scrape(channel_uid, started_at, error):
+    seconds = time.time() - started_at
+    RegisteredChannel.objects.filter(channel_uid=channel_uid).update(
+        last_scraped_at=timezone.now(), last_scrape_seconds=seconds, last_error=error,
+    )
+    return seconds
+
+
+def take_scrape_lock(task, name):
+    """
+    Take a scrape lock for the task.
+
+    Returns None when the lock is taken elsewhere and the task is skipped. With
+    the queue policy the task is retried later instead, for at most one lock
+    expiry, by when a crashed holder's lock is gone.
+    """
+    lock = channel_scrapper.Command.scrape_lock(name)
+    delay = settings.YOUTUBE_SCRAPE_LOCK_RETRY_DELAY
+    max_retries = math.ceil(settings.YOUTUBE_SCRAPE_LOCK_EXPIRE / delay)
+    requeue = (
+        settings.YOUTUBE_SCRAPE_LOCK_POLICY == channel_scrapper.LOCK_POLICY_QUEUE
+        and task.request.retries < max_retries
+    )
+
+    if lock.acquire(requeue=requeue):
+        return lock
+    if requeue:
+        raise task.retry(countdown=delay, max_retries=max_retries)
+    return None
+
+
+def pending_key(lock_name):
+    return channel_scrapper.Command.scrape_lock(lock_name).key + ':pending'
+
+
+def extend_scrape_lock(lock_info):
+    if lock_info is None:
+        return
+    name, token = lock_info
+    if not channel_scrapper.Command.scrape_lock(name, token=token).extend():
+        logger.warning(f'Lock {name} expired during the scrape, another scrape may overlap')
+    elif name == channel_scrapper.GLOBAL_LOCK_NAME:
+        cache.touch(pending_key(name), timeout=settings.YOUTUBE_SCRAPE_LOCK_EXPIRE)
+
 
+def release_scrape_lock(lock_info):
+    if lock_info is None:
+        return
+    name, token = lock_info
+    if name == channel_scrapper.GLOBAL_LOCK_NAME:
+        # the global lock is shared by all the channels of the run, the last one frees it
+        try:
+            if cache.decr(pending_key(name)) > 0:
+                return
+        except ValueError:
+            # the counter expired with the lock
+            pass
+    channel_scrapper.Command.scrape_lock(name, token=token).release()
@@ -1,3 +1,1110 @@
-from django.test import TestCase
+import asyncio
+import json
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, transaction
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from requests.models import Response
+
+from utube.management.commands.channel_scrapper import Command as ChannelScrapperCommand
+from utube.models import Channel, RegisteredChannel, ScrapeCheckpoint, Video, VideoSearchTerm
+from utube import tasks
+from utube.scrapper import persistence
+from utube.scrapper.api import Api
+from utube.scrapper.async_api import AsyncApi
+from utube.scrapper.cache import FileResponseCache
+from utube.scrapper.exceptions import ApiError, CircuitOpenError, QuotaExceededError, TransientApiError
+from utube.scrapper.keys import ApiKeyPool
+from utube.scrapper.locks import DistributedLock
+from utube.scrapper.mappers import VIDEO_FIELD_MAPPING, VIDEO_FIELDS, VIDEO_PARTS, fields_mask, map_item
+from utube.scrapper.pipeline import Pipeline, Stage
+from utube.scrapper.profiling import ScrapeProfiler
+from utube.scrapper.quota import QuotaLimiter
+from utube.scrapper.resilience import CircuitBreaker, RetryPolicy
+from utube.search import InvertedIndexSearch, MysqlFulltextSearch, tokenize
+
+
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+def fake_response(data):
+    return http_response(200, json.dumps(data).encode())
+
+
+def http_response(status_code, content=b'', headers=None):
+    response = Response()
+    response.status_code = status_code
+    response._content = content
+    response.headers.update(headers or {})
+    return response
+
+
+class FakeAioResponse(object):
+    """
+    What `aiohttp.ClientSession.get` returns, as far as AsyncApi uses it.
+    """
+
+    def __init__(self, status, content=b'', headers=None):
+        self.status = status
+        self.reason = None
+        self.headers = headers or {}
+        self.url = 'https://www.googleapis.com/youtube/v3/'
+        self.content = content
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        pass
+
+    async def read(self):
+        return self.content
+
+
+class FakeAioSession(object):
+    """
+    Answers the GETs with the given responses in order, or with respond(resource, params).
+    """
+
+    def __init__(self, responses=None, respond=None):
+        self.responses = list(responses or [])
+        self.respond = respond
+        self.calls = []
+
+    def get(self, url, params=None, headers=None, proxy=None):
+        self.calls.append({'url': url, 'params': params, 'headers': headers})
+        if self.respond is not None:
+            return self.respond(url.rsplit('/', 1)[-1], params)
+        return self.responses.pop(0)
+
+    async def close(self):
+        pass
+
+
+def fake_aio_response(data):
+    return FakeAioResponse(200, json.dumps(data).encode())
+
+
+class ApiPagingTestCase(SimpleTestCase):
+    def setUp(self):
+        self.api = Api(api_key='test')
+        self.pages = [
+            {'items': [{'id': 'a'}, {'id': 'b'}], 'nextPageToken': 'p2'},
+            {'items': [{'id': 'c'}, {'id': 'd'}], 'nextPageToken': 'p3'},
+            {'items': [{'id': 'e'}]},
+        ]
+        self.api.session = mock.Mock()
+        self.api.session.request.side_effect = [fake_response(page) for page in self.pages]
+
+    def test_iter_playlist_items_yields_pages(self):
+        pages = list(self.api.iter_playlist_items(playlist_id='PL'))
+
+        self.assertEqual([[item['id'] for item in page['items']] for page in pages], [['a', 'b'], ['c', 'd'], ['e']])
+        self.assertEqual(self.api.session.request.call_args_list[1].kwargs['params']['pageToken'], 'p2')
+
+    def test_iter_playlist_items_resumes_from_page_token(self):
+        list(self.api.iter_playlist_items(playlist_id='PL', page_token='p2'))
+
+        self.assertEqual(self.api.session.request.call_args_list[0].kwargs['params']['pageToken'], 'p2')
+
+    def test_paged_by_page_token_respects_count(self):
+        res = self.api.get_playlist_items(playlist_id='PL', count=3, limit=2)
+
+        self.assertEqual([item['id'] for item in res['items']], ['a', 'b', 'c'])
+        self.assertEqual(res['nextPageToken'], 'p3')
+
+
+class ResponseCacheTestCase(SimpleTestCase):
+    def setUp(self):
+        self.cache = FileResponseCache(directory=tempfile.mkdtemp())
+        self.api = Api(api_key='test', cache=self.cache)
+        self.api.session = mock.Mock()
+
+    def test_not_modified_is_served_from_cache(self):
+        self.api.session.request.side_effect = [
+            http_response(200, b'{"items": [{"id": "v1"}]}', {'ETag': '"e1"'}),
+            http_response(304),
+        ]
+
+        first = self.api.get_video_by_id(video_id='v1')
+        second = self.api.get_video_by_id(video_id='v1')
+
+        self.assertEqual(first, second)
+        self.assertEqual(self.api.session.request.call_args_list[1].kwargs['headers'], {'If-None-Match': '"e1"'})
+        self.assertEqual(self.cache.stats()['hits'], 1)
+        self.assertEqual(self.cache.stats()['misses'], 1)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class QuotaLimiterTestCase(SimpleTestCase):
+    def test_budget_is_enforced(self):
+        limiter = QuotaLimiter(daily_budget=2, requests_per_second=0, namespace='test-budget')
+
+        limiter.acquire('videos')
+        limiter.acquire('playlistItems')
+        with self.assertRaises(QuotaExceededError):
+            limiter.acquire('videos')
+
+        usage = limiter.usage()
+        self.assertEqual(usage['total'], 2)
+        self.assertEqual(usage['videos'], 1)
+
+    def test_fractional_rate_paces_one_request_per_window(self):
+        limiter = QuotaLimiter(daily_budget=10, requests_per_second=0.5, namespace='test-fractional')
+        clock = [100.5]
+
+        def sleep(seconds):
+            clock[0] += seconds
+
+        # only the limiter's clock is faked, the cache expiries keep the real one
+        with mock.patch('utube.scrapper.quota.time') as fake_time:
+            fake_time.time.side_effect = lambda: clock[0]
+            fake_time.sleep.side_effect = sleep
+            limiter.acquire('videos')
+            limiter.acquire('videos')
+
+        # one request per 2 s window: the second waits from 100.5 for the window starting at 102
+        self.assertEqual([c.args[0] for c in fake_time.sleep.call_args_list], [1.5])
+        self.assertEqual(limiter.usage()['videos'], 2)
+
+    def test_estimate_scrape_cost(self):
+        channel_items = [{'statistics': {'videoCount': '120'}}]
+
+        self.assertEqual(QuotaLimiter.estimate_scrape_cost(channel_items), 1 + 3 + 3)
+
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class DistributedLockTestCase(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_lock_is_exclusive_and_counts_skips(self):
+        first = DistributedLock('channel:UC1', expire=60)
+        second = DistributedLock('channel:UC1', expire=60)
+
+        self.assertTrue(first.acquire())
+        with self.assertLogs('utube.scrapper.locks', 'INFO') as logs:
+            self.assertFalse(second.acquire())
+
+        self.assertIn('1 skips', logs.output[0])
+        self.assertEqual(second.stats()['skips'], 1)
+        # only the holder can release or extend it
+        self.assertFalse(second.release())
+        self.assertFalse(second.extend())
+        self.assertTrue(DistributedLock('channel:UC1', token=first.token).extend())
+        self.assertTrue(first.release())
+        self.assertTrue(second.acquire())
+
+    def test_blocking_acquire_waits_for_the_expiry(self):
+        DistributedLock('scrape', expire=0.2).acquire()
+
+        lock = DistributedLock('scrape', expire=60)
+        with self.assertLogs('utube.scrapper.locks', 'INFO'):
+            self.assertTrue(lock.acquire(blocking=True, timeout=2, poll_interval=0.05))
+        self.assertEqual(lock.stats()['waits'], 1)
+
+    def test_heartbeat_keeps_the_lock_past_its_expiry(self):
+        with DistributedLock('scrape', expire=0.3, heartbeat=0.05) as lock:
+            self.assertTrue(lock.acquired)
+            time.sleep(0.5)
+            self.assertFalse(DistributedLock('scrape').acquire())
+
+        self.assertTrue(DistributedLock('scrape').acquire())
+
+
+class PipelineTestCase(SimpleTestCase):
+    def test_items_go_through_every_stage(self):
+        thread_exit = mock.Mock()
+        pipeline = Pipeline([
+            Stage('double', lambda x: x * 2, workers=3),
+            Stage('format', lambda x: 'v{}'.format(x), workers=2),
+        ], thread_exit=thread_exit)
+
+        with pipeline:
+            tickets = [pipeline.submit(i) for i in range(20)]
+            results = [ticket.wait(timeout=5) for ticket in tickets]
+
+        self.assertEqual(results, ['v{}'.format(i * 2) for i in range(20)])
+        self.assertEqual([stage['processed'] for stage in pipeline.stats()], [20, 20])
+        self.assertEqual(thread_exit.call_count, 5)
+
+    def test_failed_item_is_dropped_and_reported(self):
+        def persist(x):
+            if x == 3:
+                raise ValueError('bad row')
+            return x
+
+        with Pipeline([Stage('fetch', lambda x: x), Stage('persist', persist)]) as pipeline:
+            tickets = [pipeline.submit(i) for i in range(5)]
+
+        self.assertEqual([tickets[i].wait() for i in (0, 1, 2, 4)], [0, 1, 2, 4])
+        with self.assertRaises(ValueError):
+            tickets[3].wait()
+        self.assertEqual(pipeline.stats()[1]['failed'], 1)
+
+    def test_full_queue_holds_the_producer_back(self):
+        release = threading.Event()
+
+        def slow(x):
+            release.wait(5)
+            return x
+
+        pipeline = Pipeline([Stage('slow', slow, queue_size=1)]).start()
+        pipeline.submit(0)
+        pipeline.submit(1)
+        threading.Timer(0.2, release.set).start()
+        pipeline.submit(2)
+        pipeline.close()
+
+        stats = pipeline.stats()[0]
+        self.assertGreater(stats['producers_blocked_seconds'], 0.1)
+        self.assertEqual(stats['max_queue_depth'], 1)
+
+@mock.patch('utube.scrapper.api.time.sleep')
+class ApiRetryTestCase(SimpleTestCase):
+    def setUp(self):
+        self.api = Api(api_key='test', retry=RetryPolicy(max_retries=2))
+        self.api.session = mock.Mock()
+
+    def test_transient_errors_are_retried_on_the_same_page(self, sleep):
+        self.api.session.request.side_effect = [
+            fake_response({'items': [{'id': 'a'}], 'nextPageToken': 'p2'}),
+            http_response(503, headers={'Retry-After': '3'}),
+            fake_response({'items': [{'id': 'b'}]}),
+        ]
+
+        res = self.api.get_playlist_items(playlist_id='PL', count=None)
+
+        self.assertEqual([item['id'] for item in res['items']], ['a', 'b'])
+        self.assertEqual(self.api.session.request.call_args_list[2].kwargs['params']['pageToken'], 'p2')
+        sleep.assert_called_once_with(3.0)
+
+    def test_retries_are_bounded(self, sleep):
+        self.api.session.request.side_effect = [http_response(500)] * 3
+
+        with self.assertRaises(TransientApiError):
+            self.api.get_video_by_id(video_id='v1')
+        self.assertEqual(self.api.session.request.call_count, 3)
+
+    def test_quota_errors_are_not_retried(self, sleep):
+        body = {'error': {'code': 403, 'message': 'quota', 'errors': [{'reason': 'quotaExceeded'}]}}
+        self.api.session.request.side_effect = [http_response(403, json.dumps(body).encode())]
+
+        with self.assertRaises(QuotaExceededError):
+            self.api.get_video_by_id(video_id='v1')
+        sleep.assert_not_called()
+
+    def test_circuit_opens_on_high_error_rate(self, sleep):
+        self.api.retry = RetryPolicy(max_retries=0)
+        self.api.breaker = CircuitBreaker(failure_rate=0.5, window=4, min_requests=2, cool_down=60)
+        self.api.session.request.side_effect = [http_response(500)] * 2
+
+        for _ in range(2):
+            with self.assertRaises(TransientApiError):
+                self.api.get_video_by_id(video_id='v1')
+        with self.assertRaises(CircuitOpenError):
+            self.api.get_video_by_id(video_id='v1')
+
+    def test_half_open_circuit_lets_a_single_trial_through(self, sleep):
+        breaker = CircuitBreaker(failure_rate=0.5, window=4, min_requests=2, cool_down=60)
+        with mock.patch('utube.scrapper.resilience.time.monotonic', return_value=0):
+            breaker.record_failure()
+            breaker.record_failure()
+
+        with mock.patch('utube.scrapper.resilience.time.monotonic', return_value=61):
+            breaker.before_request()
+            # the other threads wait for the trial's outcome
+            with self.assertRaises(CircuitOpenError):
+                breaker.before_request()
+            breaker.record_success()
+            breaker.before_request()
+            breaker.before_request()
+
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+    def test_lost_trial_is_replaced_after_the_cool_down(self, sleep):
+        breaker = CircuitBreaker(failure_rate=0.5, window=4, min_requests=2, cool_down=60)
+        with mock.patch('utube.scrapper.resilience.time.monotonic', return_value=0):
+            breaker.record_failure()
+            breaker.record_failure()
+
+        with mock.patch('utube.scrapper.resilience.time.monotonic', return_value=61):
+            breaker.before_request()
+        with mock.patch('utube.scrapper.resilience.time.monotonic', return_value=100):
+            with self.assertRaises(CircuitOpenError):
+                breaker.before_request()
+        with mock.patch('utube.scrapper.resilience.time.monotonic', return_value=122):
+            breaker.before_request()
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ApiKeyPoolTestCase(SimpleTestCase):
+    def test_round_robin_rotation(self):
+        pool = ApiKeyPool(['rr-1', 'rr-2'], daily_budget=10)
+
+        self.assertEqual([pool.acquire('videos') for _ in range(4)], ['rr-1', 'rr-2', 'rr-1', 'rr-2'])
+
+    def test_exhausted_key_leaves_rotation(self):
+        pool = ApiKeyPool(['ex-1', 'ex-2'], strategy=ApiKeyPool.LEAST_USED, daily_budget=1)
+
+        self.assertEqual(sorted([pool.acquire('videos'), pool.acquire('videos')]), ['ex-1', 'ex-2'])
+        with self.assertRaises(QuotaExceededError):
+            pool.acquire('videos')
+        self.assertTrue(all(usage['exhausted'] for usage in pool.usage().values()))
+
+    def test_api_rotates_key_on_quota_error(self):
+        pool = ApiKeyPool(['api-1', 'api-2'], daily_budget=10)
+        api = Api(key_pool=pool)
+        api.session = mock.Mock()
+        quota_body = {'error': {'code': 403, 'errors': [{'reason': 'quotaExceeded'}]}}
+        api.session.request.side_effect = [
+            http_response(403, json.dumps(quota_body).encode()),
+            fake_response({'items': []}),
+        ]
+
+        api.get_video_by_id(video_id='v1')
+
+        used_keys = [call.kwargs['params']['key'] for call in api.session.request.call_args_list]
+        self.assertEqual(used_keys, ['api-1', 'api-2'])
+        self.assertTrue(pool.is_exhausted('api-1'))
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class AsyncApiTestCase(SimpleTestCase):
+    def setUp(self):
+        self.pages = [
+            {'items': [{'id': 'a'}, {'id': 'b'}], 'nextPageToken': 'p2'},
+            {'items': [{'id': 'c'}, {'id': 'd'}], 'nextPageToken': 'p3'},
+            {'items': [{'id': 'e'}]},
+        ]
+
+    def test_get_playlist_items_follows_the_page_tokens(self):
+        api = AsyncApi(api_key='test')
+        api.session = FakeAioSession([fake_aio_response(page) for page in self.pages])
+
+        res = asyncio.run(api.get_playlist_items(playlist_id='PL', count=None))
+
+        self.assertEqual([item['id'] for item in res['items']], ['a', 'b', 'c', 'd', 'e'])
+        self.assertEqual([call['params'].get('pageToken') for call in api.session.calls], [None, 'p2', 'p3'])
+
+    def test_iter_playlist_items_yields_pages(self):
+        api = AsyncApi(api_key='test')
+        api.session = FakeAioSession([fake_aio_response(page) for page in self.pages])
+
+        async def collect():
+            return [page async for page in api.iter_playlist_items(playlist_id='PL', page_token='p1')]
+
+        pages = asyncio.run(collect())
+
+        self.assertEqual([[item['id'] for item in page['items']] for page in pages], [['a', 'b'], ['c', 'd'], ['e']])
+        self.assertEqual(api.session.calls[0]['params']['pageToken'], 'p1')
+
+    def test_requests_in_flight_are_capped(self):
+        in_flight = peak = 0
+
+        class SlowResponse(FakeAioResponse):
+            async def __aenter__(self):
+                nonlocal in_flight, peak
+                in_flight += 1
+                peak = max(peak, in_flight)
+                await asyncio.sleep(0.01)
+                return self
+
+            async def __aexit__(self, *exc_info):
+                nonlocal in_flight
+                in_flight -= 1
+
+        api = AsyncApi(api_key='test', concurrency=2)
+        api.session = FakeAioSession(respond=lambda resource, params: SlowResponse(
+            200, json.dumps({'items': [{'id': vid} for vid in params['id'].split(',')]}).encode(),
+        ))
+
+        items = asyncio.run(api.gather_videos_by_id(video_ids=['v{}'.format(i) for i in range(10)], batch_size=2))
+
+        self.assertEqual([item['id'] for item in items], ['v{}'.format(i) for i in range(10)])
+        self.assertEqual(len(api.session.calls), 5)
+        self.assertEqual(peak, 2)
+
+    def test_error_body_raises_api_error(self):
+        body = {'error': {'code': 404, 'message': 'Playlist not found', 'errors': [{'reason': 'playlistNotFound'}]}}
+        api = AsyncApi(api_key='test')
+        api.session = FakeAioSession([
+            FakeAioResponse(404, json.dumps(body).encode()),
+            fake_aio_response({'error': {'message': 'unexpected'}}),
+        ])
+
+        with self.assertRaises(ApiError) as raised:
+            asyncio.run(api.get_playlist_items(playlist_id='PL'))
+        # a client error is not retried
+        self.assertIs(type(raised.exception), ApiError)
+        self.assertEqual((raised.exception.status_code, raised.exception.reason), (404, 'playlistNotFound'))
+        self.assertEqual(len(api.session.calls), 1)
+
+        with self.assertRaises(ApiError):
+            asyncio.run(api.get_video_by_id(video_id='v1'))
+
+    @mock.patch('utube.scrapper.async_api.asyncio.sleep')
+    def test_transient_errors_are_retried_and_charged(self, sleep):
+        limiter = QuotaLimiter(daily_budget=10, requests_per_second=0, namespace='async-retry')
+        api = AsyncApi(api_key='test', limiter=limiter, retry=RetryPolicy(max_retries=2))
+        api.session = FakeAioSession([
+            FakeAioResponse(503, headers={'Retry-After': '3'}),
+            fake_aio_response({'items': [{'id': 'v1'}]}),
+        ])
+
+        res = asyncio.run(api.get_video_by_id(video_id='v1'))
+
+        self.assertEqual(res['items'], [{'id': 'v1'}])
+        sleep.assert_called_once_with(3.0)
+        self.assertEqual(limiter.usage()['videos'], 2)
+
+    def test_rotates_key_on_quota_error(self):
+        pool = ApiKeyPool(['async-1', 'async-2'], daily_budget=10)
+        api = AsyncApi(key_pool=pool)
+        quota_body = {'error': {'code': 403, 'errors': [{'reason': 'quotaExceeded'}]}}
+        api.session = FakeAioSession([
+            FakeAioResponse(403, json.dumps(quota_body).encode()),
+            fake_aio_response({'items': []}),
+        ])
+
+        asyncio.run(api.get_video_by_id(video_id='v1'))
+
+        self.assertEqual([call['params']['key'] for call in api.session.calls], ['async-1', 'async-2'])
+        self.assertTrue(pool.is_exhausted('async-1'))
+
+    def test_not_modified_is_served_from_cache(self):
+        cache = FileResponseCache(directory=tempfile.mkdtemp())
+        api = AsyncApi(api_key='test', cache=cache)
+        api.session = FakeAioSession([
+            FakeAioResponse(200, b'{"items": [{"id": "v1"}]}', {'ETag': '"e1"'}),
+            FakeAioResponse(304),
+        ])
+
+        async def fetch_twice():
+            return [await api.get_video_by_id(video_id='v1') for _ in range(2)]
+
+        first, second = asyncio.run(fetch_twice())
+
+        self.assertEqual(first, second)
+        self.assertEqual(api.session.calls[1]['headers'], {'If-None-Match': '"e1"'})
+        self.assertEqual(cache.stats()['hits'], 1)
+
+    def test_open_circuit_refuses_requests(self):
+        breaker = CircuitBreaker(failure_rate=0.5, window=4, min_requests=2, cool_down=60)
+        breaker.record_failure()
+        breaker.record_failure()
+        api = AsyncApi(api_key='test', breaker=breaker)
+        api.session = FakeAioSession()
+
+        with self.assertRaises(CircuitOpenError):
+            asyncio.run(api.get_video_by_id(video_id='v1'))
+        self.assertEqual(api.session.calls, [])
+
+
+class FieldMaskTestCase(SimpleTestCase):
+    def test_fields_mask_from_paths(self):
+        mask = fields_mask([('id',), ('snippet', 'title'), ('snippet', 'tags'), ('statistics', 'viewCount')], paging=True)
+
+        self.assertEqual(mask, 'items(id,snippet(title,tags),statistics(viewCount)),nextPageToken')
+
+    def test_video_mask_covers_mapping(self):
+        self.assertEqual(VIDEO_PARTS, 'snippet,statistics')
+        for field, (part, key) in VIDEO_FIELD_MAPPING.items():
+            self.assertIn(key, VIDEO_FIELDS)
+
+    def test_map_item_tolerates_missing_parts(self):
+        mapped = map_item({'id': 'v1', 'snippet': {'title': 'T'}}, VIDEO_FIELD_MAPPING)
+
+        self.assertEqual(mapped['title'], 'T')
+        self.assertIsNone(mapped['view_count'])
+
+
+def video_item(video_id, title='Title', tags=None, view_count='10'):
+    return {
+        'id': video_id,
+        'snippet': {'title': title, 'description': '', 'publishedAt': '2020-04-19T16:10:00Z', 'tags': tags or []},
+        'statistics': {'viewCount': view_count, 'likeCount': '1', 'commentCount': '0'},
+    }
+
+
+class ChannelScrapperTestCase(TestCase):
+    def setUp(self):
+        self.channel = Channel.objects.create(channel_uid='UC1')
+        self.api = mock.Mock()
+        playlist_pages = {
+            'PL1': [{'items': [{'contentDetails': {'videoId': 'v1'}}, {'contentDetails': {'videoId': 'v2'}}]}],
+            'PL2': [{'items': [{'contentDetails': {'videoId': 'v2'}}, {'contentDetails': {'videoId': 'v3'}}]}],
+        }
+        self.api.iter_playlist_items.side_effect = lambda playlist_id, **kwargs: iter(playlist_pages[playlist_id])
+        self.api.get_video_by_id.side_effect = lambda video_id, **kwargs: {
+            'items': [video_item(vid, tags=['python']) for vid in video_id],
+        }
+
+    def test_videos_are_deduplicated_across_playlists(self):
+        ChannelScrapperCommand().scrape_channel(self.api, self.channel, ['PL1', 'PL2'], set())
+
+        self.assertEqual(self.api.get_video_by_id.call_count, 1)
+        self.assertEqual(self.api.get_video_by_id.call_args.kwargs['video_id'], ['v1', 'v2', 'v3'])
+        self.assertEqual(sorted(Video.objects.values_list('video_uid', flat=True)), ['v1', 'v2', 'v3'])
+        self.assertEqual(list(Video.objects.get(video_uid='v2').tags.names()), ['python'])
+
+    def test_incremental_scrape_stops_at_high_water_mark(self):
+        self.channel.last_video_uid = 'v2'
+        self.channel.last_published_at = datetime(2020, 4, 2, tzinfo=timezone.utc)
+        requested_pages = []
+
+        def uploads_pages(playlist_id, **kwargs):
+            requested_pages.append(1)
+            yield {'items': [
+                {'contentDetails': {'videoId': 'v3', 'videoPublishedAt': '2020-04-03T00:00:00Z'}},
+                {'contentDetails': {'videoId': 'v2', 'videoPublishedAt': '2020-04-02T00:00:00Z'}},
+            ]}
+            requested_pages.append(2)
+            yield {'items': [{'contentDetails': {'videoId': 'v1', 'videoPublishedAt': '2020-04-01T00:00:00Z'}}]}
+
+        self.api.iter_playlist_items.side_effect = uploads_pages
+        command = ChannelScrapperCommand()
+
+        newest = command.scrape_channel(self.api, self.channel, ['UU1'], set(), known_until=self.channel)
+        command.update_high_water_mark(self.channel, newest, full_scan=False)
+
+        self.assertEqual(requested_pages, [1])
+        self.assertEqual(list(Video.objects.values_list('video_uid', flat=True)), ['v3'])
+        self.channel.refresh_from_db()
+        self.assertEqual(self.channel.last_video_uid, 'v3')
+
+    def test_interrupted_scrape_resumes_from_checkpoint(self):
+        requested = []
+        pages = {
+            ('PL0', None): {'items': [{'contentDetails': {'videoId': 'v0'}}]},
+            ('PL1', None): {
+                'items': [{'contentDetails': {'videoId': 'v1'}}, {'contentDetails': {'videoId': 'v2'}}],
+                'nextPageToken': 't2',
+            },
+            ('PL1', 't2'): {'items': [{'contentDetails': {'videoId': 'v3'}}]},
+        }
+        fail_on = {('PL1', 't2')}
+
+        def iter_playlist_items(playlist_id, page_token=None, **kwargs):
+            while True:
+                requested.append((playlist_id, page_token))
+                if (playlist_id, page_token) in fail_on:
+                    raise ConnectionError('worker killed')
+                page = pages[(playlist_id, page_token)]
+                yield page
+                page_token = page.get('nextPageToken')
+                if not page_token:
+                    return
+
+        self.api.iter_playlist_items.side_effect = iter_playlist_items
+        command = ChannelScrapperCommand()
+        saved = []
+
+        def on_page(*args):
+            command.save_checkpoint(self.channel, 'uploads', True, *args)
+
+        with self.assertRaises(ConnectionError):
+            command.scrape_channel(self.api, self.channel, ['PL0', 'PL1'], set(), save_batch=saved.append, on_page=on_page)
+
+        checkpoint = command.load_checkpoint(self.channel, 'uploads')
+        self.assertEqual((checkpoint.playlist_id, checkpoint.page_token), ('PL1', 't2'))
+        self.assertEqual(checkpoint.pending_video_ids, ['v0', 'v1', 'v2'])
+
+        fail_on.clear()
+        requested.clear()
+        command.scrape_channel(
+            self.api, self.channel, ['PL0', 'PL1'], set(),
+            save_batch=saved.append, resume_from=checkpoint, on_page=on_page,
+        )
+
+        self.assertEqual(requested, [('PL1', 't2')])
+        self.assertEqual(saved, [['v0', 'v1', 'v2', 'v3']])
+        command.clear_checkpoint(self.channel, 'uploads')
+        self.assertFalse(ScrapeCheckpoint.objects.exists())
+
+    def test_resume_from_a_deleted_playlist_scrapes_all_the_playlists(self):
+        requested = []
+
+        def iter_playlist_items(playlist_id, page_token=None, **kwargs):
+            requested.append((playlist_id, page_token))
+            yield {'items': [{'contentDetails': {'videoId': 'v-' + playlist_id}}]}
+
+        self.api.iter_playlist_items.side_effect = iter_playlist_items
+        command = ChannelScrapperCommand()
+        command.save_checkpoint(self.channel, 'playlists', True, 'PL-deleted', 't2', ['v0'], None)
+        saved = []
+
+        command.scrape_channel(
+            self.api, self.channel, iter(['PL0', 'PL1']), set(),
+            save_batch=saved.append, resume_from=command.load_checkpoint(self.channel, 'playlists'),
+        )
+
+        self.assertEqual(requested, [('PL0', None), ('PL1', None)])
+        self.assertEqual(saved, [['v0', 'v-PL0', 'v-PL1']])
+
+    def test_rejected_page_token_restarts_the_playlist(self):
+        requested = []
+
+        def iter_playlist_items(playlist_id, page_token=None, **kwargs):
+            requested.append((playlist_id, page_token))
+            if page_token is not None:
+                raise ApiError('invalidPageToken', status_code=400, reason='invalidPageToken')
+            yield {'items': [{'contentDetails': {'videoId': 'v1'}}, {'contentDetails': {'videoId': 'v2'}}]}
+
+        self.api.iter_playlist_items.side_effect = iter_playlist_items
+        command = ChannelScrapperCommand()
+        command.save_checkpoint(self.channel, 'uploads', True, 'UU1', 'expired', ['v1'], None)
+        saved = []
+
+        command.scrape_channel(
+            self.api, self.channel, ['UU1'], set(),
+            save_batch=saved.append, resume_from=command.load_checkpoint(self.channel, 'uploads'),
+        )
+
+        self.assertEqual(requested, [('UU1', 'expired'), ('UU1', None)])
+        self.assertEqual(saved, [['v1', 'v2']])
+        self.assertFalse(ScrapeCheckpoint.objects.exists())
+
+    def test_async_rejects_the_flags_it_ignores(self):
+        with self.assertRaisesMessage(CommandError, '--async cannot be combined with --resume, --estimate'):
+            call_command('channel_scrapper', '--async', '--resume', '--estimate', channels=['UC1'])
+
+    def test_channel_info_is_requested_in_batches_of_50(self):
+        channel_ids = ['UC{}'.format(i) for i in range(120)]
+        self.api.get_channel_info.side_effect = lambda channel_id, **kwargs: {
+            'items': [{'id': uid} for uid in channel_id if uid != 'UC7'],
+        }
+
+        channel_items = ChannelScrapperCommand().fetch_channel_items(self.api, channel_ids)
+
+        self.assertEqual([len(c.kwargs['channel_id']) for c in self.api.get_channel_info.call_args_list], [50, 50, 20])
+        self.assertEqual(len(channel_items), 119)
+
+    def test_failing_channel_does_not_stop_the_others(self):
+        RegisteredChannel.objects.bulk_create([RegisteredChannel(channel_uid=uid) for uid in ['UC1', 'UC2', 'UC3']])
+        scraped = []
+
+        def scrape(channel_item):
+            if channel_item['id'] == 'UC2':
+                raise ValueError('broken payload')
+            scraped.append(channel_item['id'])
+
+        with self.assertLogs('utube.management.commands.channel_scrapper', 'ERROR'):
+            results = ChannelScrapperCommand().scrape_channels(
+                [{'id': 'UC1'}, {'id': 'UC2'}, {'id': 'UC3'}], 1, scrape,
+            )
+
+        self.assertEqual(scraped, ['UC1', 'UC3'])
+        self.assertEqual([error for _, _, error in results], [None, 'ValueError: broken payload', None])
+        self.assertEqual(RegisteredChannel.objects.get(channel_uid='UC2').last_error, 'ValueError: broken payload')
+        self.assertIsNotNone(RegisteredChannel.objects.get(channel_uid='UC3').last_scrape_seconds)
+
+    def test_quota_exhaustion_skips_the_remaining_channels(self):
+        scrape = mock.Mock(side_effect=[None, QuotaExceededError('out of quota'), None])
+
+        with self.assertLogs('utube.management.commands.channel_scrapper', 'ERROR'):
+            results = ChannelScrapperCommand().scrape_channels(
+                [{'id': 'UC1'}, {'id': 'UC2'}, {'id': 'UC3'}], 1, scrape,
+            )
+
+        self.assertEqual(scrape.call_count, 2)
+        self.assertEqual(results[2][2], 'skipped, quota exhausted')
+
+    @override_settings(CACHES=LOCMEM_CACHES)
+    def test_channel_locked_elsewhere_is_skipped(self):
+        held = ChannelScrapperCommand.scrape_lock('channel:UC2')
+        held.acquire()
+        scrape = mock.Mock()
+
+        with self.assertLogs('utube.scrapper.locks', 'INFO'):
+            results = ChannelScrapperCommand().scrape_channels(
+                [{'id': 'UC1'}, {'id': 'UC2'}], 1, scrape, lock_scope='channel',
+            )
+
+        self.assertEqual([c.args[0]['id'] for c in scrape.call_args_list], ['UC1'])
+        self.assertEqual(results[1][2], 'skipped, scraped elsewhere')
+        # the lock of UC1 was released after its scrape
+        freed = ChannelScrapperCommand.scrape_lock('channel:UC1')
+        self.assertTrue(freed.acquire())
+        freed.release()
+        held.release()
+
+    def test_async_videos_are_saved_as_their_batches_arrive(self):
+        channel_item = {'id': 'UC9', 'contentDetails': {'relatedPlaylists': {'uploads': 'UU9'}}}
+        first_batch_saved = threading.Event()
+        waited = []
+
+        class SecondPage(FakeAioResponse):
+            async def read(self):
+                # answered only once the videos of the first page are in the database
+                waited.append(await asyncio.get_running_loop().run_in_executor(None, first_batch_saved.wait, 5))
+                return self.content
+
+        def respond(resource, params):
+            if resource == 'channels':
+                return fake_aio_response({'items': [channel_item]})
+            if resource == 'playlistItems':
+                page = int(params.get('pageToken', 0))
+                data = {'items': [{'contentDetails': {'videoId': 'v{}'.format(page * 50 + i)}} for i in range(50)]}
+                if page == 0:
+                    data['nextPageToken'] = '1'
+                    return fake_aio_response(data)
+                return SecondPage(200, json.dumps(data).encode())
+            return fake_aio_response({'items': [video_item(vid) for vid in params['id'].split(',')]})
+
+        command = ChannelScrapperCommand()
+        save_video_items = command.save_video_items
+
+        def save_and_signal(channel_instance, video_items):
+            save_video_items(channel_instance, video_items)
+            first_batch_saved.set()
+
+        with mock.patch('utube.scrapper.async_api.aiohttp.ClientSession', return_value=FakeAioSession(respond=respond)), \
+                mock.patch('utube.scrapper.async_api.aiohttp.TCPConnector'), \
+                mock.patch.object(command, 'save_video_items', side_effect=save_and_signal):
+            command.stream_async(['UC9'], 10, 'uploads', {})
+
+        self.assertEqual(waited, [True])
+        self.assertEqual(Video.objects.filter(channel__channel_uid='UC9').count(), 100)
+
+    @override_settings(CACHES=LOCMEM_CACHES)
+    @mock.patch.object(ChannelScrapperCommand, 'api_components', staticmethod(lambda: {}))
+    @mock.patch.object(ChannelScrapperCommand, 'write_api_usage')
+    @mock.patch.object(ChannelScrapperCommand, 'fetch_async', return_value=([], {}))
+    def test_async_scrape_takes_the_locks(self, fetch_async, write_api_usage):
+        held = ChannelScrapperCommand.scrape_lock('scrape')
+        held.acquire()
+        with self.assertLogs('utube.scrapper.locks', 'INFO'):
+            call_command('channel_scrapper', '--async', lock_scope='global', channels=['UC1'], stdout=mock.Mock())
+        fetch_async.assert_not_called()
+        held.release()
+
+        held = ChannelScrapperCommand.scrape_lock('channel:UC2')
+        held.acquire()
+        with self.assertLogs('utube.scrapper.locks', 'INFO'):
+            call_command('channel_scrapper', '--async', lock_scope='channel', channels=['UC1', 'UC2'], stdout=mock.Mock())
+        self.assertEqual(fetch_async.call_args.args[0], ['UC1'])
+        freed = ChannelScrapperCommand.scrape_lock('channel:UC1')
+        self.assertTrue(freed.acquire())
+        freed.release()
+        held.release()
+
+    def test_register_channels_from_arguments_and_file(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.txt') as f:
+            f.write('UC2  # second channel\n\nUC3\n')
+            f.flush()
+            call_command('register_channels', 'UC1', 'UC2', file=f.name, stdout=mock.Mock())
+
+        self.assertEqual(
+            sorted(RegisteredChannel.objects.filter(is_active=True).values_list('channel_uid', flat=True)),
+            ['UC1', 'UC2', 'UC3', 'UChTsiSbpTuSrdOHpXkKlq6Q'],
+        )
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class StatsRefreshTestCase(TransactionTestCase):
+    # the pipeline threads use their own connections, which only see committed rows
+
+    def test_stats_only_refreshes_counters_in_batches_of_50(self):
+        channel = Channel.objects.create(channel_uid='UC1')
+        persistence.save_videos(channel, [video_item('v{}'.format(i), title='Kept') for i in range(120)])
+        Video.objects.update(content_hash='stale')
+        api = mock.Mock()
+        # v119 was deleted on youtube and is not returned
+        api.get_video_by_id.side_effect = lambda video_id, **kwargs: {'items': [
+            {'id': vid, 'statistics': video_item(vid, view_count='500' if vid == 'v0' else '10')['statistics']}
+            for vid in video_id if vid != 'v119'
+        ]}
+        components = {
+            'cache': None,
+            'limiter': mock.Mock(**{'usage.return_value': {'total': 3, 'budget': 10000}}),
+            'key_pool': mock.Mock(**{'usage.return_value': {}}),
+        }
+        stdout = mock.Mock()
+
+        with mock.patch.object(ChannelScrapperCommand, 'api_components', return_value=components), \
+                mock.patch.object(ChannelScrapperCommand, 'api_factory', return_value=lambda: api):
+            call_command('channel_scrapper', stats_only=True, fetch_workers=1, persist_workers=1, stdout=stdout)
+
+        calls = api.get_video_by_id.call_args_list
+        self.assertEqual([len(c.kwargs['video_id']) for c in calls], [50, 50, 20])
+        self.assertEqual(calls[0].kwargs['parts'], 'statistics')
+        self.assertNotIn('snippet', calls[0].kwargs['fields'])
+        self.assertEqual(api.iter_playlist_items.call_count, 0)
+
+        v0 = Video.objects.get(video_uid='v0')
+        self.assertEqual((v0.view_count, v0.title, v0.content_hash), (500, 'Kept', None))
+        self.assertEqual(Video.objects.get(video_uid='v1').content_hash, 'stale')
+        self.assertIn(
+            mock.call('videos: 1 changed, 118 unchanged, 1 not returned\n'),
+            stdout.write.call_args_list,
+        )
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+@mock.patch.object(ChannelScrapperCommand, 'api_components', staticmethod(lambda: {}))
+class ScrapeTasksTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.channel_item = {'id': 'UC1', 'contentDetails': {'relatedPlaylists': {'uploads': 'UU1'}}}
+        self.uploads = [
+            {'contentDetails': {'videoId': 'v{}'.format(i), 'videoPublishedAt': '2020-04-01T00:00:00Z'}}
+            for i in range(120)
+        ]
+        self.uploads[0]['contentDetails']['videoPublishedAt'] = '2020-05-01T00:00:00Z'
+
+    @mock.patch('utube.tasks.chord')
+    @mock.patch('utube.tasks.Api')
+    def test_channel_task_fans_out_batches_of_50(self, api, chord):
+        api.return_value.iter_playlist_items.return_value = iter([{'items': self.uploads}])
+
+        tasks.scrape_channel_task(self.channel_item)
+
+        header = list(chord.call_args.args[0])
+        self.assertEqual([len(signature.args[1]) for signature in header], [50, 50, 20])
+        channel = Channel.objects.get(channel_uid='UC1')
+        self.assertEqual(header[0].args[0], channel.pk)
+        callback = chord.return_value.call_args.args[0]
+        self.assertEqual(callback.task, tasks.finish_channel_task.name)
+        # the mark only moves in the callback
+        self.assertIsNone(channel.last_video_uid)
+
+    @mock.patch('utube.tasks.Api')
+    def test_video_batch_task_saves_videos(self, api):
+        channel = Channel.objects.create(channel_uid='UC1')
+        api.return_value.get_video_by_id.return_value = {'items': [video_item('v1'), video_item('v2')]}
+
+        self.assertEqual(tasks.fetch_videos_task(channel.pk, ['v1', 'v2']), 2)
+        self.assertEqual(Video.objects.filter(channel=channel).count(), 2)
+
+    @override_settings(CACHES=LOCMEM_CACHES, YOUTUBE_SCRAPE_LOCK_SCOPE='channel', YOUTUBE_SCRAPE_LOCK_POLICY='skip')
+    @mock.patch('utube.tasks.Api')
+    def test_channel_task_skips_a_locked_channel(self, api):
+        held = ChannelScrapperCommand.scrape_lock('channel:UC1')
+        held.acquire()
+
+        with self.assertLogs('utube.scrapper.locks', 'INFO'):
+            self.assertEqual(tasks.scrape_channel_task(self.channel_item), 0)
+
+        api.assert_not_called()
+        held.release()
+
+    @override_settings(CACHES=LOCMEM_CACHES)
+    @mock.patch('utube.tasks.chord')
+    @mock.patch('utube.tasks.Api')
+    def test_failed_batch_records_the_error_and_frees_the_lock(self, api, chord):
+        RegisteredChannel.objects.create(channel_uid='UC1')
+        lock = ChannelScrapperCommand.scrape_lock('scrape')
+        lock.acquire()
+        lock_info = [lock.name, lock.token]
+        cache.set(tasks.pending_key(lock.name), 2)
+        api.return_value.iter_playlist_items.return_value = iter([{'items': self.uploads}])
+
+        tasks.scrape_channel_task(self.channel_item, lock_info=lock_info)
+
+        errback = chord.return_value.call_args.args[0].options['link_error'][0]
+        self.assertEqual(errback.task, tasks.fail_channel_task.name)
+        channel = Channel.objects.get(channel_uid='UC1')
+        api.return_value.get_video_by_id.side_effect = TransientApiError('HTTP 503')
+        with self.assertRaises(TransientApiError) as raised:
+            tasks.fetch_videos_task(channel.pk, ['v1'], lock_info)
+
+        # what celery calls when a task of the chord header failed
+        with self.assertLogs('utube.tasks', 'ERROR'):
+            errback.clone((None, raised.exception, None))()
+
+        self.assertEqual(RegisteredChannel.objects.get(channel_uid='UC1').last_error, 'TransientApiError: HTTP 503')
+        self.assertEqual(cache.get(tasks.pending_key(lock.name)), 1)
+        # the last channel of the run frees the global lock
+        with self.assertLogs('utube.tasks', 'ERROR'):
+            tasks.fail_channel_task(None, ValueError('bad'), None, 'UC2', 0, lock_info)
+        self.assertTrue(ChannelScrapperCommand.scrape_lock('scrape').acquire())
+
+    def test_finish_task_moves_the_high_water_mark(self):
+        channel = Channel.objects.create(channel_uid='UC1')
+        RegisteredChannel.objects.create(channel_uid='UC1')
+
+        saved = tasks.finish_channel_task([50, 20], channel.pk, '2020-05-01T00:00:00+00:00', 'v0', True, True, 0)
+
+        self.assertEqual(saved, 70)
+        channel.refresh_from_db()
+        self.assertEqual(channel.last_video_uid, 'v0')
+        self.assertIsNotNone(channel.last_full_scan_at)
+        self.assertIsNone(RegisteredChannel.objects.get(channel_uid='UC1').last_error)
+
+
+class ScrapeProfilerTestCase(TestCase):
+    def test_http_requests_are_recorded_per_resource(self):
+        profiler = ScrapeProfiler()
+        api = Api(api_key='test', request_hook=profiler.record_request)
+        api.session = mock.Mock()
+        api.session.request.side_effect = [
+            http_response(200, b'{"items": []}'),
+            http_response(200, b'{"items": []}'),
+            http_response(200, b'{"items": [{"id": "v1"}]}'),
+        ]
+
+        with profiler:
+            api.get_playlist_items(playlist_id='PL', count=None)
+            api.get_playlist_items(playlist_id='PL', count=None)
+            api.get_video_by_id(video_id='v1')
+
+        report = profiler.report()
+        self.assertEqual(report['http']['playlistItems']['requests'], 2)
+        self.assertEqual(report['http']['playlistItems']['errors'], 0)
+        self.assertEqual(report['http']['videos']['bytes'], len(b'{"items": [{"id": "v1"}]}'))
+        self.assertEqual(report['quota_units'], 3)
+
+    def test_sql_queries_and_stages_are_recorded(self):
+        with ScrapeProfiler() as profiler:
+            with profiler.stage('persist'):
+                Channel.objects.create(channel_uid='UC1')
+                list(Video.objects.all())
+        Channel.objects.count()
+
+        report = profiler.report()
+        self.assertEqual(report['stages']['persist']['calls'], 1)
+        self.assertEqual(report['sql']['utube.Channel']['queries'], 1)
+        self.assertEqual(report['sql']['utube.Video']['queries'], 1)
+        self.assertEqual(json.loads(json.dumps(report)), report)
+
+
+def written_queries(queries):
+    return [query['sql'] for query in queries if query['sql'].split()[0] in ('INSERT', 'UPDATE', 'DELETE')]
+
+
+class PersistenceTestCase(TestCase):
+    def setUp(self):
+        self.channel = Channel.objects.create(channel_uid='UC1')
+
+    def test_save_videos_upserts_batch(self):
+        persistence.save_videos(self.channel, [video_item('v1', title='Old'), video_item('v2')])
+        persistence.save_videos(self.channel, [video_item('v1', title='New', view_count='99'), video_item('v3')])
+
+        self.assertEqual(Video.objects.count(), 3)
+        video = Video.objects.get(video_uid='v1')
+        self.assertEqual((video.title, video.view_count), ('New', 99))
+
+    def test_tag_sync_only_touches_changed_rows(self):
+        persistence.save_videos(self.channel, [video_item('v1', tags=['a', 'b'])])
+        kept = Video.objects.get(video_uid='v1').tags.through.objects.get(tag__name='b')
+
+        persistence.save_videos(self.channel, [video_item('v1', tags=['b', 'c'])])
+
+        video = Video.objects.get(video_uid='v1')
+        self.assertEqual(sorted(video.tags.names()), ['b', 'c'])
+        self.assertTrue(video.tags.through.objects.filter(pk=kept.pk).exists())
+
+    def test_save_videos_query_count_does_not_grow_with_batch(self):
+        persistence.save_videos(self.channel, [video_item('warm-up', tags=['a'])])
+
+        # the batch's tags and search terms are written in bulk too
+        with self.assertNumQueries(12):
+            persistence.save_videos(self.channel, [video_item('v{}'.format(i), tags=['a', 'b']) for i in range(20)])
+
+    def test_video_uid_is_unique(self):
+        persistence.save_videos(self.channel, [video_item('v1')])
+
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Video.objects.create(video_uid='v1', published_at=datetime(2020, 4, 19, tzinfo=timezone.utc))
+
+    def test_unchanged_batch_is_not_written(self):
+        items = [video_item('v{}'.format(i), tags=['a', 'b']) for i in range(5)]
+        persistence.save_videos(self.channel, items)
+
+        stats = Counter()
+        with CaptureQueriesContext(connection) as queries:
+            persistence.save_videos(self.channel, items, stats=stats)
+        self.assertEqual(written_queries(queries), [])
+        self.assertEqual(stats, Counter(unchanged=5))
+
+    def test_only_changed_rows_are_written(self):
+        persistence.save_videos(self.channel, [video_item('v1'), video_item('v2', tags=['a'])])
+
+        stats = Counter()
+        persistence.save_videos(
+            self.channel,
+            [video_item('v1', view_count='7'), video_item('v2', tags=['a', 'b']), video_item('v3')],
+            stats=stats,
+        )
+
+        self.assertEqual(stats, Counter(created=1, changed=2))
+        self.assertEqual(Video.objects.get(video_uid='v1').view_count, 7)
+        self.assertEqual(sorted(Video.objects.get(video_uid='v2').tags.names()), ['a', 'b'])
+
+    def test_moved_video_is_written(self):
+        persistence.save_videos(self.channel, [video_item('v1')])
+        other = Channel.objects.create(channel_uid='UC2')
+
+        stats = Counter()
+        persistence.save_videos(other, [video_item('v1')], stats=stats)
+
+        self.assertEqual(stats, Counter(changed=1))
+        self.assertEqual(Video.objects.get(video_uid='v1').channel, other)
+
+    def test_unchanged_channel_is_not_written(self):
+        item = {'id': 'UC9', 'snippet': {'title': 'Channel'}, 'statistics': {'viewCount': '5'}}
+        persistence.save_channels([item])
+
+        stats = Counter()
+        with CaptureQueriesContext(connection) as queries:
+            persistence.save_channels([item], stats=stats)
+        self.assertEqual(written_queries(queries), [])
+        self.assertEqual(stats, Counter(unchanged=1))
+
+
+class SearchTestCase(TestCase):
+    def setUp(self):
+        self.channel = Channel.objects.create(channel_uid='UC1')
+        self.backend = InvertedIndexSearch()
+
+    def search(self, query):
+        return list(self.backend.search(Video.objects.all(), query).values_list('video_uid', flat=True))
+
+    def test_tokenize(self):
+        self.assertEqual(tokenize('Django: the Web-Framework, a 2nd time!'), ['django', 'the', 'web', 'framework', '2nd', 'time'])
+
+    def test_every_word_must_match_and_titles_rank_first(self):
+        persistence.save_videos(self.channel, [
+            dict(video_item('v1', title='Cooking pasta'), snippet={
+                'title': 'Cooking pasta', 'description': 'Learn python while it boils',
+                'publishedAt': '2020-04-19T16:10:00Z',
+            }),
+            video_item('v2', title='Python for beginners'),
+            video_item('v3', title='Python tricks'),
+        ])
+
+        self.assertEqual(self.search('python'), ['v3', 'v2', 'v1'])
+        self.assertEqual(self.search('PYTHON beginners'), ['v2'])
+        self.assertEqual(self.search('rust'), [])
+        self.assertEqual(self.search('!!'), [])
+
+    def test_rewritten_video_is_reindexed(self):
+        persistence.save_videos(self.channel, [video_item('v1', title='Old title')])
+        persistence.save_videos(self.channel, [video_item('v1', title='New title')])
+
+        self.assertEqual(self.search('old'), [])
+        self.assertEqual(self.search('new title'), ['v1'])
+
+    def test_mysql_backend_uses_the_fulltext_index(self):
+        sql = str(MysqlFulltextSearch().search(Video.objects.all(), 'python tricks').query)
+
+        self.assertIn('MATCH (utube_video.title, utube_video.description) AGAINST (+python +tricks IN BOOLEAN MODE)', sql)
+        self.assertNotIn('LIKE', sql)
+
+    def test_rebuild_search_index(self):
+        persistence.save_videos(self.channel, [video_item('v1', title='Python tricks')])
+        VideoSearchTerm.objects.all().delete()
+
+        call_command('rebuild_search_index', batch_size=1, stdout=mock.Mock())
+
+        self.assertEqual(self.search('tricks'), ['v1'])
@@ -40,3 +40,16 @@ RESOURCE_PARTS_MAPPING = {
     "playlistItems": PLAYLIST_ITEM_RESOURCE_PROPERTIES,
     "videos": VIDEO_RESOURCE_PROPERTIES,
 }
+
+# Quota units a read (list) request costs on each resource.
+# Refer https://developers.google.com/youtube/v3/determine_quota_cost
+RESOURCE_QUOTA_COSTS = {
+    "channels": 1,
+    "playlists": 1,
+    "playlistItems": 1,
+    "videos": 1,
+    "search": 100,
+}
+
+# The daily quota of a project resets at midnight Pacific Time.
+QUOTA_RESET_TIMEZONE = "America/Los_Angeles"